@@ -1,10 +1,12 @@
 import datetime as dt
-import pandas as pd
 import streamlit as st
 
 from utils.constants import CONSTANT
+from utils.loader import DATA
+from utils import profiling
 
 st. set_page_config(layout="wide") 
+profile = profiling.begin('Equation of Value')
 
 st.title('Assumptions for Health Post Sustainability')
 col1, col2 = st.columns(2)
@@ -25,7 +27,7 @@ col2.markdown(body="""
 * add different types of healthcare workers (not just nurses)
 * Lots of calibration
 * :tick: 20% margin on cost to serve
-* modelling payment delays
+* :tick: modelling payment delays
 * How many nurses per patient do we need?
 """)
 
@@ -46,45 +48,22 @@ col3.number_input('Average Revenue Per Visit RWF', value=1500, key='rev_patient'
 st.header('Expense assumptions')
 healthposts, nurses, services, equipment, constants = st.tabs(['Healthposts', 'Nurses', 'Services', 'Equipment', 'Constants'])
 
-if 'healthposts' not in st.session_state:
-    df = pd.read_csv('data/healthposts.csv')
-    df.set_index('name', inplace=True)
-    df = df.astype(float)
-    st.session_state['healthposts'] = df
-
-if 'nurses' not in st.session_state:
-    df = pd.read_csv('data/healthcareworkers.csv')
-    df.set_index('id', inplace=True)
-    st.session_state['nurses'] = df
-
-if 'services' not in st.session_state:
-    df = pd.read_csv('data/services.csv')
-    df.set_index('service_type', inplace=True)
-    df = df.astype(float)
-    df = df[['revenue_per_service', 'cost_per_service', 'service_prop']]
-    df.sort_values('service_prop', ascending=False, inplace=True)
-    st.session_state['services'] = df
-
-if 'equipment' not in st.session_state:
-    df = pd.read_csv('data/equipment.csv')
-    df.set_index('equipment_type', inplace=True)
-    df.fillna(0.0, inplace=True)
-    st.session_state['equipment'] = df
-
 with healthposts:
-    df = st.session_state['healthposts']
+    df = DATA.frame('healthposts')
 
     col1, col2 = st.columns(2)
     col1.metric('Average Patients Per Day', value=f"{df['patients'].mean():,.0f}")
     col2.metric('Average Revenue Per Visit', value=f"{((df['rev_per_visit'] * df['patients']).sum()/df['patients'].sum()):,.0f}")
     st.dataframe(df, use_container_width=True)
 
-services.dataframe(st.session_state['services'], use_container_width=True)
-equipment.dataframe(st.session_state['equipment'], use_container_width=True)
-nurses.dataframe(st.session_state['nurses'], use_container_width=True)
+services.dataframe(DATA.frame('services'), use_container_width=True)
+equipment.dataframe(DATA.frame('equipment'), use_container_width=True)
+nurses.dataframe(DATA.frame('nurses'), use_container_width=True)
 
 constants.write(CONSTANT)
 
+profiling.end(profile)
+
 
 
 
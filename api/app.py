@@ -0,0 +1,110 @@
+from __future__ import annotations
+import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+import io
+import os
+from typing import AsyncIterator
+
+import pandas as pd
+from fastapi import FastAPI, HTTPException, Request, UploadFile
+from fastapi.responses import StreamingResponse
+
+from api.valuation import (Frequency, ValuationRequest, ValuationResponse, Valuation,
+                           chunks, healthposts_from_frame, summarise, value_chunk)
+from models.healthpost import HealthPost
+from utils import profiling
+
+WORKERS = int(os.environ.get('EOV_WORKERS', 0)) or os.cpu_count() or 1     # one per core by default
+CHUNK_SIZE = 64
+MAX_IN_FLIGHT = 2 * WORKERS
+
+_pool: ProcessPoolExecutor | None = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one pool for the whole service, so concurrent requests share the cores
+    global _pool
+    _pool = ProcessPoolExecutor(WORKERS)
+    try:
+        yield
+    finally:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+app = FastAPI(title="Equation of Value", lifespan=lifespan)
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    # valuations run in pool workers, so a request profile covers parsing, validation and streaming setup
+    profile = profiling.begin(f"{request.method} {request.url.path}")
+    try:
+        return await call_next(request)
+    finally:
+        profiling.end(profile)
+
+async def iter_valuations(healthposts: list[HealthPost], frequency: Frequency) -> AsyncIterator[list[Valuation]]:
+    """Chunks of valuations in input order, with a bounded number of chunks queued on the pool."""
+    loop = asyncio.get_running_loop()
+    pending = deque()
+    try:
+        for chunk in chunks(healthposts, CHUNK_SIZE):
+            pending.append(loop.run_in_executor(_pool, value_chunk, chunk, frequency))
+            if len(pending) >= MAX_IN_FLIGHT:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        # a client that disconnects mid stream should not keep the pool busy
+        for future in pending:
+            future.cancel()
+
+async def value_all(healthposts: list[HealthPost], frequency: Frequency) -> ValuationResponse:
+    with profiling.span('api.valuations'):
+        valuations = [v async for chunk in iter_valuations(healthposts, frequency) for v in chunk]
+    return ValuationResponse(valuations=valuations, totals=summarise(valuations))
+
+def stream(healthposts: list[HealthPost], frequency: Frequency) -> StreamingResponse:
+    # newline delimited json, one valuation per line as soon as its chunk is done
+    async def lines():
+        async for chunk in iter_valuations(healthposts, frequency):
+            yield ''.join(v.model_dump_json() + '\n' for v in chunk)
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+async def read_upload(file: UploadFile) -> list[HealthPost]:
+    data = await file.read()
+    with profiling.span('api.read_upload'):
+        try:
+            if (file.filename or '').endswith('.parquet'):
+                df = pd.read_parquet(io.BytesIO(data))
+            else:
+                df = pd.read_csv(io.BytesIO(data))
+            return healthposts_from_frame(df, validate=True)
+        except (ValueError, KeyError) as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+@app.get("/health")
+async def health() -> dict:
+    return {'status': 'ok', 'workers': WORKERS if _pool else 0}
+
+@app.post("/valuations")
+async def valuations(request: ValuationRequest) -> ValuationResponse:
+    return await value_all(request.healthposts, request.frequency)
+
+@app.post("/valuations/stream")
+async def valuations_stream(request: ValuationRequest) -> StreamingResponse:
+    return stream(request.healthposts, request.frequency)
+
+@app.post("/valuations/upload")
+async def valuations_upload(file: UploadFile, frequency: Frequency = 'QE', streamed: bool = False):
+    """A csv or parquet table shaped like data/healthposts.csv."""
+    healthposts = await read_upload(file)
+    if streamed:
+        return stream(healthposts, frequency)
+    return await value_all(healthposts, frequency)
+
+@app.get("/profiles")
+async def profiles() -> list[dict]:
+    # newest first, empty unless the service runs with EOV_PROFILE=1
+    return list(profiling.PROFILES)[::-1]
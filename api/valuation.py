@@ -0,0 +1,121 @@
+from __future__ import annotations
+import argparse
+from concurrent.futures import Executor, ProcessPoolExecutor
+import itertools
+import json
+from pathlib import Path
+import sys
+from typing import Iterator, Literal, get_args
+
+import pandas as pd
+from pydantic import BaseModel
+
+from models.bulk import build_healthposts
+from models.healthpost import HealthPost
+from utils.loader import DATA
+
+# period totals the service reports, anything else is rejected before a valuation starts
+Frequency = Literal['D', 'W', 'ME', 'QE', 'YE']
+
+class ValuationRequest(BaseModel):
+    healthposts: list[HealthPost]
+    frequency: Frequency = 'QE'
+
+class Valuation(BaseModel):
+    name: str
+    npv: float
+    revenue: float
+    net_income: float
+    salaries_cost: float
+    cost_of_care: float
+    equipment_capital: float
+    equipment_maintenance: float
+    total_cost: float
+    cashflows: dict[str, float]         # period end -> net cashflow
+
+class ValuationResponse(BaseModel):
+    valuations: list[Valuation]
+    totals: dict[str, float]
+
+TOTALS = ['npv', 'revenue', 'net_income', 'salaries_cost', 'cost_of_care',
+          'equipment_capital', 'equipment_maintenance', 'total_cost']
+
+def value_healthpost(hp: HealthPost, frequency: str = 'QE') -> Valuation:
+    cfs = hp.generate_cashflows()
+    periods = cfs.aggregate_frequency(frequency)['total']
+    return Valuation(
+        name=hp.name,
+        npv=cfs.npv,
+        cashflows={d.date().isoformat(): float(v) for d, v in periods.items()},
+        **{k: getattr(hp, k) for k in TOTALS if k != 'npv'},
+    )
+
+def value_chunk(healthposts: list[HealthPost], frequency: str = 'QE') -> list[Valuation]:
+    # unit of work sent to a pool worker
+    return [value_healthpost(hp, frequency) for hp in healthposts]
+
+def chunks(healthposts: list[HealthPost], chunk_size: int) -> Iterator[list[HealthPost]]:
+    for start in range(0, len(healthposts), chunk_size):
+        yield healthposts[start:start + chunk_size]
+
+def iter_valuations(healthposts: list[HealthPost], frequency: str = 'QE', executor: Executor | None = None,
+                    chunk_size: int = 64) -> Iterator[Valuation]:
+    """Valuations in input order, computed chunk by chunk on executor when given."""
+    if executor is None:
+        for chunk in chunks(healthposts, chunk_size):
+            yield from value_chunk(chunk, frequency)
+        return
+    for valuations in executor.map(value_chunk, chunks(healthposts, chunk_size), itertools.repeat(frequency)):
+        yield from valuations
+
+def summarise(valuations: list[Valuation]) -> dict[str, float]:
+    return {k: float(sum(getattr(v, k) for v in valuations)) for k in TOTALS}
+
+def healthposts_from_frame(healthposts: pd.DataFrame, services: pd.DataFrame | None = None,
+                           equipment: pd.DataFrame | None = None, validate: bool = False) -> list[HealthPost]:
+    """HealthPosts from a table shaped like data/healthposts.csv.
+
+    Posts share the service mix and equipment list, the data/ tables by
+    default. Optional ehr_takeup and salary columns override the defaults.
+    Pass validate=True for tables from outside, such as uploads.
+    """
+    services = DATA.frame('services') if services is None else services
+    equipment = DATA.frame('equipment') if equipment is None else equipment
+    return build_healthposts(healthposts, services, equipment, validate)
+
+def read_healthposts(path: str | Path) -> list[HealthPost]:
+    # csv or parquet driver table, or a json ValuationRequest / list of HealthPosts
+    path = Path(path)
+    if path.suffix == '.json':
+        data = json.loads(path.read_text())
+        data = data['healthposts'] if isinstance(data, dict) else data
+        return [HealthPost.model_validate(hp) for hp in data]
+    df = pd.read_parquet(path) if path.suffix == '.parquet' else pd.read_csv(path)
+    return healthposts_from_frame(df)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Value a fleet of health posts without the Streamlit app")
+    parser.add_argument('healthposts', nargs='?', default='data/healthposts.csv',
+                        help="csv/parquet table like data/healthposts.csv, or json list of HealthPost")
+    parser.add_argument('--frequency', default='QE', choices=get_args(Frequency))
+    parser.add_argument('--workers', type=int, default=1, help="0 for one per core")
+    parser.add_argument('--chunk-size', type=int, default=64)
+    parser.add_argument('--out', default=None, help="write one json valuation per line here")
+    args = parser.parse_args()
+
+    healthposts = read_healthposts(args.healthposts)
+    out = open(args.out, 'w') if args.out else None
+    executor = ProcessPoolExecutor(args.workers or None) if args.workers != 1 else None
+    valuations = []
+    try:
+        for valuation in iter_valuations(healthposts, args.frequency, executor, args.chunk_size):
+            valuations.append(valuation)
+            if out:
+                out.write(valuation.model_dump_json() + '\n')
+    finally:
+        if executor:
+            executor.shutdown()
+        if out:
+            out.close()
+    json.dump(summarise(valuations), sys.stdout, indent=2)
+    print()
@@ -0,0 +1,53 @@
+import argparse
+import subprocess
+import sys
+
+# modules a worker imports to value posts, and what they must not pull in
+CORE = ['utils.constants', 'models.cashflow', 'models.healthpost', 'models.fleet', 'models.simulation', 'api.valuation']
+HEAVY = ['matplotlib', 'seaborn', 'scipy', 'statsmodels', 'streamlit']
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(','.join(sorted({{m.split('.')[0] for m in sys.modules}} & set({heavy!r}))))
+"""
+
+def cold_import(module: str) -> tuple[float, list[str], list[tuple[float, str]]]:
+    """Seconds to import module in a fresh interpreter, the heavy packages it loaded and its slowest imports."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE.format(module=module, heavy=HEAVY)],
+                          capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr}")
+    seconds, heavy = proc.stdout.splitlines()[-2:]
+    # -X importtime lines are "import time: self [us] | cumulative | name"
+    slowest = []
+    for line in proc.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            slowest.append((int(parts[1]) / 1e6, parts[2].rstrip()))
+    return float(seconds), [m for m in heavy.split(',') if m], sorted(slowest, reverse=True)[:5]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold import time of the model core, failing over budget or on plotting / scipy imports")
+    parser.add_argument('modules', nargs='*', default=CORE)
+    parser.add_argument('--budget', type=float, default=1.0, help="seconds allowed per module")
+    parser.add_argument('--verbose', action='store_true', help="list the slowest nested imports")
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules:
+        seconds, heavy, slowest = cold_import(module)
+        flag = ' OVER BUDGET' if seconds > args.budget else ''
+        flag += f" imports {', '.join(heavy)}" if heavy else ''
+        print(f"{module:30s} {seconds * 1e3:8.1f}ms{flag}")
+        if args.verbose:
+            for cumulative, name in slowest:
+                print(f"    {cumulative * 1e3:8.1f}ms {name}")
+        if flag:
+            failures.append(module)
+
+    if failures:
+        print(f"\n{len(failures)} module(s) over the {args.budget}s budget or importing {', '.join(HEAVY)}")
+        sys.exit(1)
@@ -0,0 +1,241 @@
+import argparse
+import datetime as dt
+import itertools
+import json
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from models.breakeven import breakeven_table
+from models.bulk import build_healthposts
+from models.cashflow import CashFlow, CashFlowAggregator
+from models.fleet import HealthPostFleet
+from models.healthpost import HealthPost, HealthPostAggregator, HealthCareWorker, Equipment, Service
+from models.sensitivity import tornado
+from models.simulation import SimulationConfig, simulate
+from utils.constants import CONSTANT
+
+# benchmark name -> (setup(**params) returning the timed callable, parameter grid)
+BENCHMARKS: dict[str, tuple[Callable, dict[str, list]]] = {}
+
+GRID = {
+    'posts': [1, 100, 10_000, 100_000],
+    'services': [4, 12, 48],
+    'years': [1, 3, 10],
+}
+QUICK = {'posts': [1, 100], 'services': [12], 'years': [3]}
+
+def horizon_end(years: int) -> dt.date:
+    return CONSTANT['start_date'].replace(year=CONSTANT['start_date'].year + years) - dt.timedelta(days=1)
+
+def benchmark(name: str, **grid: list):
+    # register a setup function, grid values default to GRID and are capped per benchmark
+    def register(setup: Callable) -> Callable:
+        BENCHMARKS[name] = (setup, grid)
+        return setup
+    return register
+
+def make_services(num_services: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    cost = rng.uniform(500, 20_000, num_services)
+    prop = rng.dirichlet(np.ones(num_services))
+    return pd.DataFrame({'revenue_per_service': cost * 1.2, 'cost_per_service': cost, 'service_prop': prop},
+                        index=pd.Index([f"service_{i}" for i in range(num_services)], name='service_type'))
+
+def make_equipment(num_equipment: int = 10) -> pd.DataFrame:
+    rng = np.random.default_rng(1)
+    return pd.DataFrame({'capital_investment': rng.uniform(100, 5_000, num_equipment),
+                         'monthly_maintenance': rng.uniform(0, 50, num_equipment),
+                         'num_units': 1.0},
+                        index=pd.Index([f"equipment_{i}" for i in range(num_equipment)], name='equipment_type'))
+
+def make_healthpost(services: int, name: str = "", patients: int = 20, end_date: dt.date | None = None) -> HealthPost:
+    return HealthPost(
+        name=name, patients=patients, rev_per_visit=1_500, ehr_takeup=0.7, end_date=end_date or CONSTANT['end_date'],
+        nurses=[HealthCareWorker(name=f"{name}_nurse_{i}") for i in range(2)],
+        services=[Service(service_type=k, cases=v.service_prop * patients, **v) for k, v in make_services(services).iterrows()],
+        equipment=[Equipment(equipment_type=k, **v) for k, v in make_equipment().iterrows()],
+    )
+
+def make_fleet(posts: int, services: int, end_date: dt.date | None = None) -> HealthPostFleet:
+    rng = np.random.default_rng(2)
+    healthposts = pd.DataFrame({
+        'patients': rng.uniform(1, 40, posts),
+        'rev_per_visit': rng.uniform(500, 2_500, posts),
+        'nurses': rng.integers(1, 4, posts).astype(float),
+        'ehr_takeup': rng.uniform(0.5, 1.0, posts),
+    }, index=pd.Index([f"healthpost_{i}" for i in range(posts)], name='name'))
+    return HealthPostFleet.from_frame(healthposts, make_services(services), make_equipment(), end_date=end_date)
+
+def make_cashflows(services: int, years: int) -> list[CashFlow]:
+    # the line items of one health post over a horizon of `years`
+    return make_healthpost(services, end_date=horizon_end(years)).generate_cashflows().cashflows
+
+@benchmark('cashflow.cashflow', years=GRID['years'])
+def _(years):
+    cf = make_cashflows(1, years)[0]
+    return lambda: cf.cashflow
+
+@benchmark('aggregator.aggregate', services=GRID['services'], years=GRID['years'])
+def _(services, years):
+    cashflows = make_cashflows(services, years)
+    return lambda: CashFlowAggregator(cashflows)
+
+@benchmark('aggregator.resample', services=GRID['services'], years=GRID['years'])
+def _(services, years):
+    agg = CashFlowAggregator(make_cashflows(services, years))
+    return lambda: agg.aggregate_frequency('QE')
+
+@benchmark('aggregator.npv', services=GRID['services'], years=GRID['years'])
+def _(services, years):
+    agg = CashFlowAggregator(make_cashflows(services, years))
+    return lambda: agg.npv
+
+@benchmark('healthpost.generate_cashflows', services=GRID['services'], years=GRID['years'])
+def _(services, years):
+    hp = make_healthpost(services, end_date=horizon_end(years))
+    return hp.generate_cashflows
+
+@benchmark('healthpost.npv', services=GRID['services'], years=GRID['years'])
+def _(services, years):
+    hp = make_healthpost(services, end_date=horizon_end(years))
+    return lambda: hp.npv
+
+@benchmark('healthpost_aggregator', posts=[1, 100, 1_000])
+def _(posts):
+    # builds one HealthPost per post and a merged model, so the large sizes are left out
+    hps = [make_healthpost(4, name=f"healthpost_{i}") for i in range(posts)]
+    return lambda: HealthPostAggregator("fleet", list(hps))
+
+@benchmark('bulk.build_healthposts', posts=[1, 100, 10_000])
+def _(posts):
+    fleet = make_fleet(posts, 12)
+    healthposts = pd.DataFrame({'patients': fleet.patients[:posts], 'rev_per_visit': fleet.rev_per_visit[:posts],
+                                'nurses': fleet.nurses[:posts]}, index=pd.Index(fleet.posts, name='name'))
+    services, equipment = make_services(12), make_equipment()
+    return lambda: build_healthposts(healthposts, services, equipment)
+
+@benchmark('fleet.compact_cashflows', posts=[1, 100, 10_000], years=GRID['years'])
+def _(posts, years):
+    fleet = make_fleet(posts, 12, horizon_end(years))
+    return fleet.compact_cashflows
+
+@benchmark('compact.totals', posts=[1, 100, 10_000], years=GRID['years'])
+def _(posts, years):
+    compact = make_fleet(posts, 12, horizon_end(years)).compact_cashflows()
+    return lambda: compact.totals('QE')
+
+@benchmark('fleet.metrics', posts=GRID['posts'], services=GRID['services'], years=GRID['years'])
+def _(posts, services, years):
+    fleet = make_fleet(posts, services, horizon_end(years))
+    return fleet.metrics
+
+@benchmark('simulate.clt', posts=[1, 100, 10_000])
+def _(posts):
+    fleet = make_fleet(posts, 12)
+    config = SimulationConfig(scenarios=1_000)
+    return lambda: simulate(fleet, config, rng=np.random.default_rng(0))
+
+@benchmark('breakeven.table', posts=GRID['posts'])
+def _(posts):
+    fleet = make_fleet(posts, 12)
+    return lambda: breakeven_table(fleet)
+
+@benchmark('sensitivity.tornado', posts=GRID['posts'])
+def _(posts):
+    fleet = make_fleet(posts, 12)
+    return lambda: tornado(fleet)
+
+def case_id(name: str, params: dict) -> str:
+    return name + ''.join(f"[{k}={v}]" for k, v in params.items())
+
+def cases(pattern: str | None = None, quick: bool = False, max_posts: int | None = None):
+    for name, (setup, grid) in BENCHMARKS.items():
+        if pattern and not re.search(pattern, name):
+            continue
+        grid = {k: [v for v in values if (not quick or v in QUICK[k]) and (k != 'posts' or not max_posts or v <= max_posts)]
+                for k, values in grid.items()}
+        for values in itertools.product(*grid.values()):
+            yield name, setup, dict(zip(grid, values))
+
+def measure(fn: Callable, repeat: int, min_time: float) -> list[float]:
+    # one warm-up call, then at least `repeat` runs and `min_time` seconds
+    fn()
+    times = []
+    started = time.perf_counter()
+    while len(times) < repeat or time.perf_counter() - started < min_time:
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+        if len(times) >= 1_000:
+            break
+    return times
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'timestamp': dt.datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+    }
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    # cases slower than baseline by more than threshold, on the best of each run
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        ratio = result['min'] / old['min']
+        flag = ' REGRESSION' if ratio > 1 + threshold else ''
+        print(f"{key:70s} {old['min'] * 1e3:10.3f}ms -> {result['min'] * 1e3:10.3f}ms  {ratio:6.2f}x{flag}")
+        if flag:
+            regressions.append(key)
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Timings of the model hot paths, with regression checks against a saved run")
+    parser.add_argument('--filter', default=None, help="regex on benchmark names")
+    parser.add_argument('--quick', action='store_true', help="small sizes only")
+    parser.add_argument('--max-posts', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help="seconds to spend timing each case")
+    parser.add_argument('--out', default=None, help="write results to this json file")
+    parser.add_argument('--baseline', default=None, help="json from an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown before a case fails, 0.25 is 25%%")
+    args = parser.parse_args()
+
+    results = {}
+    for name, setup, params in cases(args.filter, args.quick, args.max_posts):
+        times = measure(setup(**params), args.repeat, args.min_time)
+        key = case_id(name, params)
+        results[key] = {'name': name, 'params': params, 'runs': len(times),
+                        'min': min(times), 'median': statistics.median(times)}
+        print(f"{key:70s} {min(times) * 1e3:10.3f}ms  median {statistics.median(times) * 1e3:10.3f}ms  ({len(times)} runs)")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        print()
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
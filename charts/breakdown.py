@@ -1,8 +1,17 @@
-import matplotlib.pyplot as plt
-import seaborn as sns
-from models.healthpost import HealthPost
+from __future__ import annotations
+import typing
 
+from utils.profiling import profiled
+
+if typing.TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+    from models.healthpost import HealthPost
+
+@profiled('chart.cost_breakdown')
 def chart_cost_breakdown(hp: HealthPost) -> plt:
+    # matplotlib and seaborn take about a second to import, so only chart callers pay for them
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
     # Create a bar chart to show each of the individual costs in the total cost
     plt.figure(figsize=(10, 6))
@@ -14,4 +23,4 @@ def chart_cost_breakdown(hp: HealthPost) -> plt:
     plt.xlabel("Cost Category")
     plt.ylabel("Cost (RWF)")
 
-    return plt
\ No newline at end of file
+    return plt
@@ -0,0 +1,150 @@
+from __future__ import annotations
+import datetime as dt
+import io
+import typing
+from typing import Callable, Sequence
+
+import numpy as np
+import pandas as pd
+
+from models.cashflow import CashFlowAggregator, CashFlowMatrix
+from utils.cache import RESULTS, input_hash
+from utils.profiling import profiled
+
+if typing.TYPE_CHECKING:
+    from models.healthpost import HealthPost
+
+# chart granularities from finest to coarsest, downsampling picks the finest that fits
+LADDER = ['D', 'W', 'ME', 'QE', 'YE']
+PAGE_SIZE = 100
+
+class CashflowView():
+    """Line item cashflows served at a requested granularity, a page of rows at a time.
+
+    Resampling and column pruning run on the compact segments or the matrix
+    before any DataFrame is built, so a page of a top-N table costs its own
+    size however many line items and days sit behind it, and the daily matrix
+    is only built when the 'D' granularity is asked for. Tables are kept per (frequency, tag, top),
+    so hold on to the view (HealthPostGraph does) to reuse them across reruns.
+    Cashflows add up, so every coarser period is a sum and never an average.
+    """
+
+    def __init__(self, names: Sequence[str], tags: Sequence[str], labels: pd.DatetimeIndex | None, values: np.ndarray | None,
+                 resample: Callable[[str], tuple[pd.DatetimeIndex, np.ndarray]] | None = None,
+                 daily: Callable[[], tuple[pd.DatetimeIndex, np.ndarray]] | None = None,
+                 span: tuple[dt.date, dt.date] | None = None):
+        self.names = np.asarray(names, dtype=object)
+        self.tags = np.asarray(tags, dtype=object)
+        self._labels = labels
+        self._values = values               # line items x periods, loaded through daily when not given
+        self._resample = resample
+        self._daily = daily
+        self.span = span or (labels[0], labels[-1])
+        self._tables: dict[tuple, pd.DataFrame] = {}
+
+    @classmethod
+    def from_cashflows(cls, cashflows: CashFlowAggregator | CashFlowMatrix) -> CashflowView:
+        # an aggregator's view resamples its compact segments and builds the daily matrix only for 'D'
+        if isinstance(cashflows, CashFlowMatrix):
+            return cls(cashflows.names, cashflows.tags, cashflows.calendar, cashflows.values, cashflows.resample)
+        compact = cashflows.compact
+        span = (min(spec[0] for spec in compact.specs), max(spec[1] for spec in compact.specs)) if compact.specs else None
+        return cls(compact.names, compact.tags, None, None, compact.resample,
+                   daily=lambda: (cashflows.matrix.calendar, cashflows.matrix.values), span=span)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, tags: Sequence[str]) -> CashflowView:
+        # a periods x line items frame, such as a cached aggregate_frequency without its total
+        return cls(list(df.columns), tags, df.index, df.to_numpy(dtype=float).T)
+
+    @property
+    def labels(self) -> pd.DatetimeIndex:
+        if self._labels is None:
+            self._labels, self._values = self._daily()
+        return self._labels
+
+    @property
+    def values(self) -> np.ndarray:
+        if self._values is None:
+            self._labels, self._values = self._daily()
+        return self._values
+
+    def resample(self, frequency: str) -> tuple[pd.DatetimeIndex, np.ndarray]:
+        native = 'D' if self._labels is None else getattr(self._labels, 'freqstr', None)
+        if frequency == 'D' or frequency == native:
+            return self.labels, self.values
+        if self._resample is not None:
+            return self._resample(frequency)
+        df = pd.DataFrame(self.values.T, index=self.labels).resample(frequency).sum()
+        return df.index, df.to_numpy().T
+
+    def frequency_for(self, max_points: int) -> str:
+        # the finest granularity with at most max_points periods
+        for frequency in LADDER:
+            if len(pd.date_range(*self.span, freq=frequency)) + 1 <= max_points:
+                return frequency
+        return LADDER[-1]
+
+    @profiled('views.table')
+    def table(self, frequency: str = 'ME', tag: str | None = None, top: int | None = None) -> pd.DataFrame:
+        """Line items as columns at frequency, optionally one tag only and the top items by absolute total.
+
+        Items past the top are summed per tag into an 'other <tag>' column, so
+        the row totals still match the full table.
+        """
+        key = (frequency, tag, top)
+        if key not in self._tables:
+            keep = np.ones(len(self.names), dtype=bool) if tag is None else self.tags == tag
+            labels, values = self.resample(frequency)
+            values, names, tags = values[keep], self.names[keep], self.tags[keep]
+
+            if top is not None and len(names) > top:
+                order = np.argsort(-np.abs(values).sum(axis=1), kind='stable')
+                head, rest = order[:top], order[top:]
+                others = list(dict.fromkeys(tags[rest]))
+                values = np.vstack([values[head]] + [values[rest][tags[rest] == t].sum(axis=0, keepdims=True) for t in others])
+                names = list(names[head]) + [f'other {t}' for t in others]
+            self._tables[key] = pd.DataFrame(values.T, index=labels, columns=list(names))
+        return self._tables[key]
+
+    def downsample(self, max_points: int = 200, tag: str | None = None, top: int | None = 10) -> pd.DataFrame:
+        # chart data with at most max_points periods, at the finest granularity that fits
+        return self.table(self.frequency_for(max_points), tag, top)
+
+    def totals(self, frequency: str = 'ME') -> pd.DataFrame:
+        # net cashflow per tag, the smallest table that still tells the story
+        labels, values = self.resample(frequency)
+        tags = list(dict.fromkeys(self.tags))
+        return pd.DataFrame({t: values[self.tags == t].sum(axis=0) for t in tags}, index=labels)
+
+def num_pages(df: pd.DataFrame, page_size: int = PAGE_SIZE) -> int:
+    return max(1, -(-len(df) // page_size))
+
+def page(df: pd.DataFrame, number: int, page_size: int = PAGE_SIZE) -> pd.DataFrame:
+    """Rows of page `number` (from 0), clipped to the last page."""
+    number = min(max(number, 0), num_pages(df, page_size) - 1)
+    return df.iloc[number * page_size:(number + 1) * page_size]
+
+def chart_png(name: str, inputs: typing.Any, render: Callable[[], typing.Any], dpi: int = 100) -> bytes:
+    """A matplotlib chart as PNG bytes, rendered only when its inputs change.
+
+    Images are kept in RESULTS keyed by the chart name and an input hash, so
+    reruns, sessions and processes with the same figures share one render.
+    render returns pyplot or a Figure, as the charts in charts/ do.
+    """
+    def draw() -> dict[str, np.ndarray]:
+        import matplotlib.pyplot as plt
+        figure = render()
+        figure = figure.gcf() if figure is plt else figure
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+        plt.close(figure)
+        return {'png': np.frombuffer(buffer.getvalue(), dtype=np.uint8)}
+    key = input_hash('chart', name, inputs, dpi)
+    return RESULTS.get_or_compute(key, draw)['png'].tobytes()
+
+def cost_breakdown_png(hp: HealthPost) -> bytes:
+    # keyed by the four figures the chart plots, anything with HealthPost's cost properties works
+    from charts.breakdown import chart_cost_breakdown
+    figures = [float(hp.salaries_cost), float(hp.cost_of_care), float(hp.equipment_capital), float(hp.equipment_maintenance)]
+    return chart_png('cost_breakdown', figures, lambda: chart_cost_breakdown(hp))
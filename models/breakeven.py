@@ -0,0 +1,57 @@
+from __future__ import annotations
+from typing import Literal
+
+import numpy as np
+
+from models.fleet import HealthPostFleet, metrics
+from models.healthpost import HealthPost
+
+Driver = Literal['patients', 'rev_per_visit', 'ehr_takeup', 'nurses', 'salary']
+
+def _evaluate(fleet: HealthPostFleet, metric: str, **overrides) -> np.ndarray:
+    return metrics(**{**fleet.columns(), **overrides}, **fleet.horizon)[metric]
+
+def breakeven(model: HealthPost | HealthPostFleet, driver: Driver, target: float = 0.0,
+              metric: Literal['npv', 'net_income'] = 'npv') -> float | np.ndarray:
+    """Value of `driver` at which `metric` hits `target`, for one post or every post of a fleet.
+
+    NPV and net income are affine in patients, revenue, nurses and salary,
+    and of the form a / takeup + b in the EHR takeup, so two vectorized
+    evaluations pin down the exact root for every post at once. Posts whose
+    metric does not move with the driver come back as nan.
+
+    The NPV is bottom up on services, so its revenue per visit breakeven
+    scales every service's revenue_per_service and reports the resulting
+    revenue per visit (service_prop @ revenue_per_service). Net income is
+    top down and uses rev_per_visit directly. Nurse counts are not rounded.
+    """
+    fleet = HealthPostFleet.from_healthposts([model]) if isinstance(model, HealthPost) else model
+    columns = fleet.columns()
+
+    if driver == 'ehr_takeup':
+        # metric = a / t + b, evaluated at t = 1 and t = 1/2
+        at_one = _evaluate(fleet, metric, ehr_takeup=np.ones(len(fleet)))
+        at_half = _evaluate(fleet, metric, ehr_takeup=np.full(len(fleet), 0.5))
+        a, b = at_half - at_one, 2 * at_one - at_half
+        root = _divide(a, target - b)
+    elif driver == 'rev_per_visit' and metric == 'npv':
+        # scale the service price list by k, the metric is affine in k
+        base = columns['revenue_per_service']
+        at_zero = _evaluate(fleet, metric, revenue_per_service=0 * base)
+        at_one = _evaluate(fleet, metric, revenue_per_service=base)
+        root = _divide(target - at_zero, at_one - at_zero) * (columns['service_prop'] @ base)
+    else:
+        at_zero = _evaluate(fleet, metric, **{driver: np.zeros(len(fleet))})
+        at_one = _evaluate(fleet, metric, **{driver: np.ones(len(fleet))})
+        root = _divide(target - at_zero, at_one - at_zero)
+
+    return float(root[0]) if isinstance(model, HealthPost) else root
+
+def _divide(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    num, den = np.broadcast_arrays(np.asarray(num, dtype=float), np.asarray(den, dtype=float))
+    return np.divide(num, den, out=np.full(num.shape, np.nan), where=~np.isclose(den, 0.0, atol=1e-9))
+
+def breakeven_table(model: HealthPost | HealthPostFleet, target: float = 0.0,
+                    metric: Literal['npv', 'net_income'] = 'npv') -> dict[str, float | np.ndarray]:
+    return {driver: breakeven(model, driver, target, metric)
+            for driver in ['patients', 'rev_per_visit', 'ehr_takeup', 'nurses', 'salary']}
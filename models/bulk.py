@@ -0,0 +1,143 @@
+from __future__ import annotations
+from functools import lru_cache
+import typing
+from typing import Any, Mapping, Sequence, TypeVar
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel, TypeAdapter
+
+from models.healthpost import HealthPost, HealthCareWorker, Service, Equipment, SALARY
+
+Model = TypeVar('Model', bound=BaseModel)
+
+@lru_cache(maxsize=None)
+def _adapter(annotation: Any) -> TypeAdapter:
+    return TypeAdapter(list[annotation])
+
+def _holds_models(annotation: Any) -> bool:
+    # a field of models or lists of models, filled with objects already built here
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return True
+    return any(_holds_models(arg) for arg in typing.get_args(annotation))
+
+def _columns(model: type[BaseModel], data: pd.DataFrame | Mapping[str, Sequence]) -> dict[str, list]:
+    # a frame contributes its model fields and a named index, other columns are ignored as pydantic would
+    if not isinstance(data, pd.DataFrame):
+        return {k: v.tolist() if isinstance(v, (np.ndarray, pd.Series, pd.Index)) else list(v) for k, v in data.items()}
+    columns = {k: data[k].tolist() for k in data.columns if k in model.model_fields}
+    if data.index.name in model.model_fields and data.index.name not in columns:
+        columns[data.index.name] = data.index.tolist()
+    return columns
+
+def build(model: type[Model], data: pd.DataFrame | Mapping[str, Sequence], validate: bool = False,
+          **shared: Any) -> list[Model]:
+    """One model per row of a frame or dict of equal length columns, plus fields shared by every row.
+
+    Models of plain fields are validated in a single pydantic call on a list of
+    the model, which pydantic's core does faster than model_construct could
+    assemble them. Models holding other models take those as they are and
+    should get them from build as well: each plain column is validated once
+    against its field type and the objects are made with model_construct, with
+    their own copy of every list. Pass validate=True for untrusted input to
+    validate every object in full, nested models included.
+    """
+    columns = _columns(model, data)
+    fields = model.model_fields
+    unknown = (set(columns) | set(shared)) - set(fields)
+    if unknown:
+        raise ValueError(f"{model.__name__} has no fields {sorted(unknown)}")
+    missing = [k for k, f in fields.items() if f.is_required() and k not in columns and k not in shared]
+    if missing:
+        raise ValueError(f"{model.__name__} requires {missing}")
+    lengths = {len(v) for v in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"columns for {model.__name__} have different lengths {sorted(lengths)}")
+
+    names = list(columns)
+    nested = [k for k in [*names, *shared] if _holds_models(fields[k].annotation)]
+    if validate or not nested:
+        return _adapter(model).validate_python([dict(zip(names, row), **shared) for row in zip(*columns.values())])
+
+    for k, v in columns.items():
+        if k not in nested:
+            columns[k] = _adapter(fields[k].annotation).validate_python(v)
+    for k, v in shared.items():
+        if k not in nested:
+            shared[k] = _adapter(fields[k].annotation).validate_python([v])[0]
+    construct = model.model_construct
+    objects = []
+    for row in zip(*columns.values()):
+        values = dict(shared, **dict(zip(names, row)))
+        for k in nested:
+            if isinstance(values[k], list):
+                values[k] = list(values[k])
+        objects.append(construct(**values))
+    return objects
+
+def build_services(df: pd.DataFrame, patients: float | None = None, validate: bool = False) -> list[Service]:
+    # rows of a services table indexed by service_type, with cases from patients when given
+    if patients is not None:
+        df = df.assign(cases=df['service_prop'] * patients)
+    return build(Service, df, validate)
+
+def build_equipment(df: pd.DataFrame, validate: bool = False) -> list[Equipment]:
+    return build(Equipment, df, validate)
+
+def build_nurses(count: int, salary: float = SALARY, prefix: str | None = None, validate: bool = False) -> list[HealthCareWorker]:
+    columns = {'salary': [salary] * count}
+    if prefix is not None:
+        columns['name'] = [f"{prefix}_nurse_{i}" for i in range(count)]
+    return build(HealthCareWorker, columns, validate)
+
+def build_healthposts(df: pd.DataFrame, services: list[Service] | pd.DataFrame, equipment: list[Equipment] | pd.DataFrame,
+                      validate: bool = False) -> list[HealthPost]:
+    """HealthPosts from a table shaped like data/healthposts.csv with the same services and equipment.
+
+    Each post gets its own services and equipment lists holding shared items,
+    so adding or removing items on one post leaves the others alone.
+
+    Optional ehr_takeup and salary columns override the defaults. Patients are
+    rounded, HealthPost counts whole patients. With a services frame each post
+    gets cases from its own patients.
+    """
+    if 'name' in df.columns:
+        df = df.set_index('name')
+    missing = {'patients', 'rev_per_visit', 'nurses'} - set(df.columns)
+    if missing:
+        raise ValueError(f"healthposts table is missing columns {sorted(missing)}")
+
+    if isinstance(equipment, pd.DataFrame):
+        equipment = build_equipment(equipment, validate)
+    names = [str(name) for name in df.index]
+    patients = df['patients'].round().astype(int).to_numpy()
+    salary = df['salary'].to_numpy(dtype=float) if 'salary' in df.columns else np.full(len(df), SALARY)
+    counts = df['nurses'].to_numpy().astype(int)
+
+    # every post's nurses, and services when cases differ per post, in one build each
+    workers = build(HealthCareWorker, {
+        'name': [f"{name}_nurse_{i}" for name, n in zip(names, counts) for i in range(n)],
+        'salary': np.repeat(salary, counts),
+    }, validate)
+    ends = np.cumsum(counts)
+    if isinstance(services, list):
+        per_post = [services] * len(df)
+    else:
+        cases = np.outer(patients, services['service_prop'].to_numpy(dtype=float))
+        mix = build(Service, {
+            'service_type': np.tile(np.asarray(services.index, dtype=object), len(df)),
+            'cases': cases.ravel(),
+            **{k: np.tile(services[k].to_numpy(dtype=float), len(df))
+               for k in ['cost_per_service', 'revenue_per_service', 'service_prop']},
+        }, validate)
+        width = len(services)
+        per_post = [mix[i * width:(i + 1) * width] for i in range(len(df))]
+
+    return build(HealthPost, {
+        'name': names,
+        'patients': patients,
+        'rev_per_visit': df['rev_per_visit'],
+        'ehr_takeup': df['ehr_takeup'] if 'ehr_takeup' in df.columns else np.ones(len(df)),
+        'nurses': [workers[end - n:end] for end, n in zip(ends, counts)],
+        'services': per_post,
+    }, validate, equipment=equipment)
@@ -0,0 +1,110 @@
+from collections import OrderedDict
+import datetime as dt
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.profiling import span
+
+# 'WD' is the business day calendar from the CashFlow TODO, 'Y' is spelt 'YE' since pandas 2.2
+FREQUENCY_ALIASES = {'WD': 'B', 'Y': 'YE'}
+
+Spec = tuple[dt.date, dt.date, str]
+
+def _readonly(values: np.ndarray) -> np.ndarray:
+    values.flags.writeable = False
+    return values
+
+class CalendarCache():
+    """Bounded LRU of date ranges and the index arrays derived from them.
+
+    Everything handed out is shared between callers: DatetimeIndex is immutable
+    and the NumPy arrays are flagged read-only.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: tuple, build):
+        with self._lock:
+            if key in self._items:
+                self.hits += 1
+                self._items.move_to_end(key)
+                return self._items[key]
+            self.misses += 1
+
+        with span(f'calendar.{key[0]}'):
+            value = build()
+        with self._lock:
+            self._items[key] = value
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value
+
+    def date_range(self, start_date: dt.date, end_date: dt.date, frequency: str) -> pd.DatetimeIndex:
+        freq = FREQUENCY_ALIASES.get(frequency, frequency)
+        return self._get(('date_range', start_date, end_date, freq),
+                         lambda: pd.date_range(start=start_date, end=end_date, freq=freq))
+
+    def union(self, specs: tuple[Spec, ...]) -> pd.DatetimeIndex:
+        def build():
+            ranges = [self.date_range(*spec) for spec in specs]
+            calendar = ranges[0] if ranges else pd.DatetimeIndex([])
+            for ts in ranges[1:]:
+                calendar = calendar.union(ts)
+            return calendar
+        return self._get(('union', specs), build)
+
+    def positions(self, specs: tuple[Spec, ...], spec: Spec) -> np.ndarray:
+        # where the periods of `spec` sit on the union calendar of `specs`
+        return self._get(('positions', specs, spec),
+                         lambda: _readonly(self.union(specs).get_indexer(self.date_range(*spec))))
+
+    def quarters(self, start_date: dt.date, end_date: dt.date, frequency: str, origin: dt.date) -> np.ndarray:
+        # quarter number of each period, counted from the calendar quarter holding origin
+        def build():
+            ts = self.date_range(start_date, end_date, frequency)
+            quarters = (ts.year * 4 + (ts.month - 1) // 3) - (origin.year * 4 + (origin.month - 1) // 3)
+            return _readonly(np.asarray(quarters, dtype=np.int64))
+        return self._get(('quarters', start_date, end_date, frequency, origin), build)
+
+    def bins(self, specs: tuple[Spec, ...], frequency: str) -> tuple[pd.DatetimeIndex, np.ndarray, np.ndarray]:
+        # Resample a dummy series over the calendar only, so the bin labels and
+        # edges are exactly the ones pandas would use for the full frame
+        def build():
+            counts = pd.Series(1, index=self.union(specs)).resample(frequency).count()
+            starts = np.cumsum(counts.values) - counts.values
+            nonempty = counts.values > 0
+            return counts.index, _readonly(starts[nonempty]), _readonly(nonempty)
+        return self._get(('bins', specs, frequency), build)
+
+    def bin_counts(self, specs: tuple[Spec, ...], frequency: str) -> tuple[pd.DatetimeIndex, np.ndarray, np.ndarray]:
+        # periods of each spec in each bin, and the bin of each spec's first period (-1 when it has none)
+        def build():
+            labels, starts, nonempty = self.bins(specs, frequency)
+            bin_of_date = np.flatnonzero(nonempty)[np.searchsorted(starts, np.arange(len(self.union(specs))), 'right') - 1]
+            counts = np.zeros((len(specs), len(labels)))
+            first = np.full(len(specs), -1)
+            for i, spec in enumerate(specs):
+                positions = self.positions(specs, spec)
+                if len(positions):
+                    counts[i] = np.bincount(bin_of_date[positions], minlength=len(labels))
+                    first[i] = bin_of_date[positions[0]]
+            return labels, _readonly(counts), _readonly(first)
+        return self._get(('bin_counts', specs, frequency), build)
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._items), 'maxsize': self.maxsize}
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+CALENDARS = CalendarCache()
@@ -1,10 +1,13 @@
-import numpy_financial as npf
+from functools import lru_cache
 from typing import Literal
 import datetime as dt
+import numpy as np
 import pandas as pd
 from pydantic import BaseModel
 
+from models.calendar import CALENDARS
 from utils.constants import CONSTANT
+from utils.profiling import count, profiled
 
 class CashFlow(BaseModel):
     name: str = ""
@@ -16,10 +19,11 @@ class CashFlow(BaseModel):
     tag: Literal['revenue', 'salary', 'cost_of_care', 'equipment']
 
     @property
+    @profiled('cashflow.cashflow')
     def cashflow(self):
-        # Create a time series with the specified frequency
-        # TODO create a business day
-        ts = pd.date_range(start=self.start_date, end=self.end_date, freq=f"{self.frequency}")
+        # Create a time series with the specified frequency, shared through the calendar cache
+        count('cashflow.series')
+        ts = CALENDARS.date_range(self.start_date, self.end_date, self.frequency)
         num_periods = len(ts)
 
         if self.cashflow_type == 'repeat':
@@ -33,31 +37,157 @@ class CashFlow(BaseModel):
         cashflows = pd.Series(cf, index=ts, name=self.name)
 
         return cashflows
+
+    @property
+    def npv_fast(self) -> float:
+        # as CashFlowAggregator([self]).npv without materialising the series, like HealthPost.npv_fast
+        return self.npv_at()
+
+    def npv_at(self, discount_rate: float | None = None, origin: dt.date | None = None) -> float:
+        """NPV at discount_rate, in quarters counted from the quarter holding origin.
+
+        origin defaults to the first period the flow emits, where the
+        aggregator's quarters start for this flow alone; give the first
+        period of the whole aggregation to add flows up to its NPV.
+        """
+        periods = CALENDARS.date_range(self.start_date, self.end_date, self.frequency)
+        if len(periods) == 0:
+            return 0.0
+        factors = discount_factors(self.start_date, self.end_date, self.frequency,
+                                   origin or periods[0].date(), discount_rate)
+        if self.cashflow_type == 'repeat':
+            return self.amount * factors.sum()
+        elif self.cashflow_type == 'smooth':
+            return self.amount / len(factors) * factors.sum()
+        elif self.cashflow_type == 'once-off':
+            return self.amount * factors[0]
+
+@lru_cache(maxsize=256)
+def discount_factors(start_date: dt.date, end_date: dt.date, frequency: str, 
+                     origin: dt.date, discount_rate: float | None = None) -> np.ndarray:
+    """Quarterly discount factor of every period of a flow.
+
+    CashFlowAggregator.npv buckets flows into calendar quarters and discounts
+    quarter q (counted from the quarter holding `origin`) by (1 + rate / 4) ** -q,
+    so a flow's NPV is its per-period amount times the sum of these factors.
+    With origin in the aggregation's first quarter this agrees with the
+    aggregator to floating point summation order (relative error below 1e-9).
+    """
+    if discount_rate is None:
+        discount_rate = CONSTANT['discount_rate']
+    quarters = CALENDARS.quarters(start_date, end_date, frequency, origin)
+    factors = (1 + discount_rate / 4) ** -quarters.astype(float)
+    factors.flags.writeable = False
+    return factors
     
+CASHFLOW_TYPES = ['repeat', 'smooth', 'once-off']
+
+class CashFlowMatrix():
+    """Dense flows x periods matrix of a list of CashFlows on one shared calendar."""
+
+    @profiled('cashflow.matrix')
+    def __init__(self, cashflows: list[CashFlow]):
+        count('cashflow.matrix_flows', len(cashflows))
+        self.names = self._column_names(cashflows)
+        self.tags = np.array([cf.tag for cf in cashflows], dtype=object)
+        self.amounts = np.array([cf.amount for cf in cashflows], dtype=float)
+        self.types = np.array([CASHFLOW_TYPES.index(cf.cashflow_type) for cf in cashflows], dtype=np.int8)
+
+        # every distinct (start, end, frequency) only needs its periods placed once
+        specs = [(cf.start_date, cf.end_date, cf.frequency) for cf in cashflows]
+        spec_index = {spec: i for i, spec in enumerate(dict.fromkeys(specs))}
+        self.specs = tuple(spec_index)
+        self.calendar = CALENDARS.union(self.specs)
+
+        self.spec_ids = np.array([spec_index[spec] for spec in specs], dtype=np.int64)
+        self.values = np.zeros((len(cashflows), len(self.calendar)))
+        for spec_id, spec in enumerate(self.specs):
+            self._fill(spec_id, CALENDARS.positions(self.specs, spec))
+
+    @staticmethod
+    def _column_names(cashflows: list[CashFlow]) -> list[str]:
+        # mirror the suffixing the old outer join applied to clashing names
+        names, seen = [], set()
+        for i, cf in enumerate(cashflows):
+            name = f"{cf.name}_{i}" if cf.name in seen else cf.name
+            seen.add(name)
+            names.append(name)
+        return names
+
+    def _fill(self, spec_id: int, positions: np.ndarray):
+        rows = np.flatnonzero(self.spec_ids == spec_id)
+        num_periods = len(positions)
+        if num_periods == 0:
+            return
+
+        types = self.types[rows]
+        per_period = np.where(types == CASHFLOW_TYPES.index('smooth'), 
+                              self.amounts[rows] / num_periods, 
+                              self.amounts[rows])
+        self.values[np.ix_(rows, positions)] = per_period[:, None]
+
+        once_off = rows[types == CASHFLOW_TYPES.index('once-off')]
+        self.values[np.ix_(once_off, positions[1:])] = 0.0
+
+    @property
+    def totals(self) -> np.ndarray:
+        return self.values.sum(axis=0)
+
+    def resample(self, frequency: str, values: np.ndarray | None = None) -> tuple[pd.DatetimeIndex, np.ndarray]:
+        values = self.values if values is None else values
+        labels, starts, nonempty = CALENDARS.bins(self.specs, frequency)
+        out = np.zeros(values.shape[:-1] + (len(labels),))
+        if len(starts):
+            out[..., nonempty] = np.add.reduceat(values, starts, axis=-1)
+        return labels, out
+
+    @profiled('cashflow.to_frame')
+    def to_frame(self) -> pd.DataFrame:
+        count('cashflow.frames')
+        return pd.DataFrame(self.values.T, index=self.calendar, columns=self.names)
+
 class CashFlowAggregator():
+    """A list of CashFlows with their totals, resampling and NPV.
+
+    The flows are held as CompactCashFlows, so npv never builds the daily
+    matrix. matrix and df are built on first use by callers that want daily
+    values, such as Statements and the cashflow views.
+    """
+
     def __init__(self, cashflows=list[CashFlow]):
         self.cashflows = cashflows
-        self.df = pd.DataFrame()
         self.aggregate_cashflows()
 
     def aggregate_cashflows(self, fillna: int = 0) -> pd.DataFrame:
-        for i, cf in enumerate(self.cashflows):
-            if not self.df.empty:
-                self.df = self.df.join(cf.cashflow, how='outer', rsuffix=f'_{i}')
-            else:
-                self.df[cf.name] = cf.cashflow
-        self.df.fillna(fillna, inplace=True)
+        # fillna is kept for compatibility, periods a flow does not cover are always 0
+        from models.compact import CompactCashFlows
+        self.compact = CompactCashFlows.from_cashflows(self.cashflows)
+        self._matrix = None
+        self._df = None
+
+    @property
+    def matrix(self) -> CashFlowMatrix:
+        if self._matrix is None:
+            self._matrix = CashFlowMatrix(self.cashflows)
+        return self._matrix
+
+    @property
+    def df(self) -> pd.DataFrame:
+        if self._df is None:
+            self._df = self.matrix.to_frame()
+        return self._df
 
+    @profiled('cashflow.aggregate_frequency')
     def aggregate_frequency(self, frequency: str) -> pd.DataFrame:
-        df = self.df.resample(frequency).sum()
-        df['total'] = df.sum(axis=1)
+        labels, values = self.compact.resample(frequency)
+        df = pd.DataFrame(values.T, index=labels, columns=self.compact.names)
+        df['total'] = values.sum(axis=0)
         return df
     
     @property
+    @profiled('cashflow.npv')
     def npv(self) -> float:
-        values = self.aggregate_frequency('QE')['total'].values
-        rate = CONSTANT['discount_rate'] / 4
-        return npf.npv(rate, values)
+        return self.compact.npv
 
 if __name__ == "__main__":
     # Example usage:
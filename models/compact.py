@@ -0,0 +1,143 @@
+from __future__ import annotations
+import datetime as dt
+from typing import Sequence
+
+import numpy as np
+import numpy_financial as npf
+import pandas as pd
+
+from models.calendar import CALENDARS, Spec
+from models.cashflow import CASHFLOW_TYPES, CashFlow, CashFlowMatrix
+from utils.constants import CONSTANT
+from utils.profiling import count, profiled
+
+SMOOTH, ONCE_OFF = CASHFLOW_TYPES.index('smooth'), CASHFLOW_TYPES.index('once-off')
+
+class CompactCashFlows():
+    """Cashflows as (amount, start, end, frequency, type) segments, never as daily columns.
+
+    Memory is a handful of numbers per line item plus one row of bin counts
+    per distinct (start, end, frequency), so a national fleet costs its line
+    items rather than line items x days. Resampling multiplies per period
+    amounts by how many periods each bin holds, and totals are summed per
+    segment shape before that, so neither builds the dense matrix. Call
+    to_matrix or to_frame when a daily time series is really wanted.
+    """
+
+    def __init__(self, names: Sequence[str], tags: Sequence[str], amounts: np.ndarray, types: np.ndarray,
+                 specs: tuple[Spec, ...], spec_ids: np.ndarray):
+        self.names = names.tolist() if isinstance(names, np.ndarray) else list(names)
+        self.tags = np.asarray(tags, dtype=object)
+        self.amounts = np.asarray(amounts, dtype=float)
+        self.types = np.asarray(types, dtype=np.int8)
+        self.specs = specs
+        self.spec_ids = np.asarray(spec_ids, dtype=np.int64)
+        count('cashflow.compact_flows', len(self.names))
+
+    @classmethod
+    @profiled('cashflow.compact')
+    def from_cashflows(cls, cashflows: list[CashFlow]) -> CompactCashFlows:
+        specs = [(cf.start_date, cf.end_date, cf.frequency) for cf in cashflows]
+        spec_index = {spec: i for i, spec in enumerate(dict.fromkeys(specs))}
+        return cls(CashFlowMatrix._column_names(cashflows),
+                   [cf.tag for cf in cashflows],
+                   [cf.amount for cf in cashflows],
+                   [CASHFLOW_TYPES.index(cf.cashflow_type) for cf in cashflows],
+                   tuple(spec_index),
+                   [spec_index[spec] for spec in specs])
+
+    @classmethod
+    def from_arrays(cls, names: Sequence[str], tags: Sequence[str], amounts: np.ndarray, frequencies: Sequence[str],
+                    types: Sequence[str] | None = None, start_date: dt.date | None = None,
+                    end_date: dt.date | None = None) -> CompactCashFlows:
+        """Line items straight from arrays, for fleets too large to hold a CashFlow per item.
+
+        types defaults to 'repeat' and the horizon to CONSTANT's start and end dates.
+        """
+        start_date, end_date = start_date or CONSTANT['start_date'], end_date or CONSTANT['end_date']
+        spec_ids, unique = pd.factorize(np.asarray(frequencies, dtype=object))
+        if types is None:
+            types = np.zeros(len(names), dtype=np.int8)
+        else:
+            codes, kinds = pd.factorize(np.asarray(types, dtype=object))
+            types = np.array([CASHFLOW_TYPES.index(t) for t in kinds], dtype=np.int8)[codes]
+        return cls(names, tags, amounts, types, tuple((start_date, end_date, f) for f in unique), spec_ids)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def nbytes(self) -> int:
+        # the arrays behind the flows, names and shared calendars left out
+        return self.tags.nbytes + self.amounts.nbytes + self.types.nbytes + self.spec_ids.nbytes
+
+    @property
+    def num_periods(self) -> np.ndarray:
+        return np.array([len(CALENDARS.date_range(*spec)) for spec in self.specs])[self.spec_ids]
+
+    @property
+    def per_period(self) -> np.ndarray:
+        # amount booked in each period a flow covers, its first period only for once-off flows
+        periods = np.maximum(self.num_periods, 1)
+        return np.where(self.types == SMOOTH, self.amounts / periods, self.amounts)
+
+    @profiled('cashflow.compact_resample')
+    def resample(self, frequency: str, rows=None) -> tuple[pd.DatetimeIndex, np.ndarray]:
+        """Flows x bins at frequency, for all flows or the selected rows."""
+        labels, counts, first = CALENDARS.bin_counts(self.specs, frequency)
+        rows = slice(None) if rows is None else rows
+        per_period, spec_ids, types = self.per_period[rows], self.spec_ids[rows], self.types[rows]
+        values = per_period[:, None] * counts[spec_ids]
+        once = np.flatnonzero((types == ONCE_OFF) & (first[spec_ids] >= 0))
+        values[once] = 0.0
+        values[once, first[spec_ids[once]]] = per_period[once]
+        return labels, values
+
+    def totals(self, frequency: str, by: np.ndarray | None = None) -> tuple[pd.DatetimeIndex, np.ndarray]:
+        """Groups x bins sums, one group of all flows unless `by` gives each flow a group code.
+
+        Flows are summed per (group, shape, type) first, so the work per bin is
+        the number of distinct shapes rather than the number of flows.
+        """
+        labels, counts, first = CALENDARS.bin_counts(self.specs, frequency)
+        by = np.zeros(len(self), dtype=np.int64) if by is None else np.asarray(by, dtype=np.int64)
+        groups = int(by.max()) + 1 if len(by) else 1
+        once = self.types == ONCE_OFF
+        spread = np.zeros((groups, len(self.specs)))
+        np.add.at(spread, (by[~once], self.spec_ids[~once]), self.per_period[~once])
+        spiked = np.zeros((groups, len(self.specs)))
+        np.add.at(spiked, (by[once], self.spec_ids[once]), self.per_period[once])
+
+        values = spread @ counts
+        for spec_id in np.flatnonzero(first >= 0):
+            values[:, first[spec_id]] += spiked[:, spec_id]
+        return labels, values
+
+    def by_tag(self, frequency: str) -> pd.DataFrame:
+        tags = list(dict.fromkeys(self.tags))
+        codes = np.array([tags.index(t) for t in self.tags], dtype=np.int64)
+        labels, values = self.totals(frequency, codes)
+        return pd.DataFrame(values.T, index=labels, columns=tags)
+
+    @property
+    @profiled('cashflow.compact_npv')
+    def npv(self) -> float:
+        # as CashFlowAggregator.npv: quarterly totals discounted at a quarter of the annual rate
+        _, values = self.totals('QE')
+        return npf.npv(CONSTANT['discount_rate'] / 4, values[0])
+
+    def cashflows(self) -> list[CashFlow]:
+        return [CashFlow(name=name, tag=tag, amount=amount, start_date=self.specs[spec_id][0], end_date=self.specs[spec_id][1],
+                         frequency=self.specs[spec_id][2], cashflow_type=CASHFLOW_TYPES[t])
+                for name, tag, amount, t, spec_id in zip(self.names, self.tags, self.amounts, self.types, self.spec_ids)]
+
+    def to_matrix(self) -> CashFlowMatrix:
+        """The dense flows x days matrix, the one step whose memory grows with the horizon."""
+        return CashFlowMatrix(self.cashflows())
+
+    def to_frame(self, frequency: str | None = None) -> pd.DataFrame:
+        # a daily frame as CashFlowAggregator.df, or resampled without going through the dense matrix
+        if frequency is None:
+            return self.to_matrix().to_frame()
+        labels, values = self.resample(frequency)
+        return pd.DataFrame(values.T, index=labels, columns=self.names)
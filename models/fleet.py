@@ -0,0 +1,384 @@
+from __future__ import annotations
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+from models.cashflow import CashFlow, CashFlowAggregator
+from models.compact import CompactCashFlows
+from models.healthpost import HealthPost, SALARY, npv_fast
+from utils.constants import CONSTANT
+from utils.profiling import profiled
+
+# running totals kept by the fleet, all of them add up across posts
+ADDITIVE = ['patients', 'nurses', 'revenue', 'service_revenue', 'salaries_cost', 'cost_of_care',
+            'equipment_capital', 'equipment_maintenance', 'total_cost', 'net_income', 'npv']
+
+def metrics(patients, rev_per_visit, ehr_takeup, nurses, salary,
+            service_prop, revenue_per_service, cost_per_service,
+            units, capital_investment, monthly_maintenance,
+            start_date: dt.date | None = None, end_date: dt.date | None = None) -> dict[str, np.ndarray]:
+    """HealthPost's derived figures for arrays of posts.
+
+    Per-post inputs have shape (..., posts), service_prop (..., posts, services)
+    and units (..., posts, equipment); the per-service and per-equipment prices
+    broadcast over the posts. Any leading batch axes are carried through, which
+    lets callers evaluate many perturbed fleets at once. Cases per service are
+    patients * service_prop, as on the sustainability page. The NPV runs
+    over start_date to end_date, CONSTANT's horizon by default.
+    """
+    patients = np.asarray(patients, dtype=float)
+    ehr_takeup = np.asarray(ehr_takeup, dtype=float)
+    revenue_per_service = np.expand_dims(revenue_per_service, -2)
+    cost_per_service = np.expand_dims(cost_per_service, -2)
+
+    rev_mix = (service_prop * revenue_per_service).sum(axis=-1)
+    cost_mix = (service_prop * cost_per_service).sum(axis=-1)
+    capital = (units * np.expand_dims(capital_investment, -2)).sum(axis=-1)
+    maintenance = (units * np.expand_dims(monthly_maintenance, -2)).sum(axis=-1)
+
+    out = {
+        'patients': patients,
+        'nurses': np.asarray(nurses, dtype=float),
+        'revenue': patients * rev_per_visit * CONSTANT['WORKING_DAYS'] / ehr_takeup,
+        'service_revenue': patients * rev_mix * CONSTANT['WORKING_DAYS'] / ehr_takeup,
+        'salaries_cost': nurses * np.asarray(salary, dtype=float),
+        'cost_of_care': patients * cost_mix * CONSTANT['WORKING_DAYS'],
+        'equipment_capital': capital,
+        'equipment_maintenance': maintenance * 12 * CONSTANT['USDxRWF'],
+    }
+    out['total_cost'] = out['salaries_cost'] + out['cost_of_care'] + out['equipment_capital'] + out['equipment_maintenance']
+    out['net_income'] = out['revenue'] - out['total_cost']
+    out['npv'] = npv_fast(patients, ehr_takeup, rev_mix - cost_mix, out['salaries_cost'], capital, maintenance,
+                          start_date=start_date, end_date=end_date)
+    return out
+
+class HealthPostFleet():
+    """Column store of many health posts sharing one service and equipment price list.
+
+    Posts live in preallocated NumPy columns. Adding or removing a post
+    touches one row and updates the fleet totals, so it costs the same for
+    40 posts as for 40,000.
+    """
+
+    def __init__(self, services: pd.DataFrame | None = None, equipment: pd.DataFrame | None = None, capacity: int = 64,
+                 start_date: dt.date | None = None, end_date: dt.date | None = None):
+        services = services if services is not None else pd.DataFrame(columns=['revenue_per_service', 'cost_per_service'])
+        equipment = equipment if equipment is not None else pd.DataFrame(columns=['capital_investment', 'monthly_maintenance'])
+
+        self.service_types = list(services.index)
+        self.revenue_per_service = services['revenue_per_service'].to_numpy(dtype=float)
+        self.cost_per_service = services['cost_per_service'].to_numpy(dtype=float)
+
+        self.equipment_types = list(equipment.index)
+        self.capital_investment = equipment['capital_investment'].fillna(0.0).to_numpy(dtype=float)
+        self.monthly_maintenance = equipment['monthly_maintenance'].fillna(0.0).to_numpy(dtype=float)
+
+        # projection horizon shared by every post
+        self.start_date = start_date or CONSTANT['start_date']
+        self.end_date = end_date or CONSTANT['end_date']
+
+        self.size = 0
+        self._rows: dict[str, int] = {}
+        self._allocate(capacity)
+        self.totals = dict.fromkeys(ADDITIVE, 0.0)
+
+    def _allocate(self, capacity: int):
+        old = self.size
+        columns = {
+            'names': np.empty(capacity, dtype=object),
+            'patients': np.zeros(capacity),
+            'rev_per_visit': np.zeros(capacity),
+            'ehr_takeup': np.ones(capacity),
+            'nurses': np.zeros(capacity),
+            'salary': np.zeros(capacity),
+            'service_prop': np.zeros((capacity, len(self.service_types))),
+            'units': np.zeros((capacity, len(self.equipment_types))),
+        }
+        for k, v in columns.items():
+            if old:
+                v[:old] = getattr(self, k)[:old]
+            setattr(self, k, v)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.patients)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._rows
+
+    @property
+    def posts(self) -> list[str]:
+        return list(self.names[:self.size])
+
+    def columns(self, rows=None) -> dict[str, np.ndarray]:
+        # keyword arguments for metrics(), callers swap in perturbed columns
+        rows = slice(0, self.size) if rows is None else rows
+        return {
+            'patients': self.patients[rows],
+            'rev_per_visit': self.rev_per_visit[rows],
+            'ehr_takeup': self.ehr_takeup[rows],
+            'nurses': self.nurses[rows],
+            'salary': self.salary[rows],
+            'service_prop': self.service_prop[rows],
+            'revenue_per_service': self.revenue_per_service,
+            'cost_per_service': self.cost_per_service,
+            'units': self.units[rows],
+            'capital_investment': self.capital_investment,
+            'monthly_maintenance': self.monthly_maintenance,
+        }
+
+    @property
+    def horizon(self) -> dict[str, dt.date]:
+        return {'start_date': self.start_date, 'end_date': self.end_date}
+
+    def _metrics(self, rows) -> dict[str, np.ndarray]:
+        return metrics(**self.columns(rows), **self.horizon)
+
+    def _update_totals(self, rows, sign: float):
+        for k, v in self._metrics(rows).items():
+            self.totals[k] += sign * float(np.sum(v))
+
+    def recompute_totals(self):
+        # clears any floating point drift from a long run of add/remove
+        self.totals = dict.fromkeys(ADDITIVE, 0.0)
+        self._update_totals(slice(0, self.size), 1.0)
+
+    def add(self, name: str, patients: float, rev_per_visit: float, ehr_takeup: float = 1.0,
+            nurses: float = 0, salary: float = SALARY,
+            service_prop: dict[str, float] | None = None, units: dict[str, float] | None = None):
+        if name in self._rows:
+            raise ValueError(f"Health post {name} is already in the fleet")
+        if self.size == self.capacity:
+            self._allocate(2 * self.capacity)
+
+        row = self.size
+        self.names[row] = name
+        self.patients[row] = patients
+        self.rev_per_visit[row] = rev_per_visit
+        self.ehr_takeup[row] = ehr_takeup
+        self.nurses[row] = nurses
+        self.salary[row] = salary
+        self.service_prop[row] = self._spread(service_prop, self.service_types, 'service')
+        self.units[row] = self._spread(units, self.equipment_types, 'equipment')
+
+        self._rows[name] = row
+        self.size += 1
+        self._update_totals(slice(row, row + 1), 1.0)
+
+    def add_healthpost(self, hp: HealthPost):
+        if (hp.start_date, hp.end_date) != (self.start_date, self.end_date):
+            raise ValueError(f"Health post {hp.name} runs over a different horizon than the fleet")
+        for s in hp.services:
+            self._check_price(s.service_type, self.service_types,
+                              (s.revenue_per_service, s.cost_per_service),
+                              (self.revenue_per_service, self.cost_per_service))
+        for e in hp.equipment:
+            self._check_price(e.equipment_type, self.equipment_types,
+                              (e.capital_investment, e.monthly_maintenance),
+                              (self.capital_investment, self.monthly_maintenance))
+
+        self.add(name=hp.name,
+                 patients=hp.patients,
+                 rev_per_visit=hp.rev_per_visit,
+                 ehr_takeup=hp.ehr_takeup,
+                 nurses=hp.num_nurses,
+                 salary=hp.salaries_cost / hp.num_nurses if hp.nurses else SALARY,
+                 service_prop={s.service_type: s.service_prop for s in hp.services},
+                 units={e.equipment_type: e.num_units for e in hp.equipment})
+
+    def remove(self, name: str):
+        row = self._rows.pop(name)
+        self._update_totals(slice(row, row + 1), -1.0)
+
+        # move the last post into the hole so the columns stay dense
+        last = self.size - 1
+        if row != last:
+            for k in ['names', 'patients', 'rev_per_visit', 'ehr_takeup', 'nurses', 'salary', 'service_prop', 'units']:
+                column = getattr(self, k)
+                column[row] = column[last]
+            self._rows[self.names[row]] = row
+        self.names[last] = None
+        self.size -= 1
+
+    @staticmethod
+    def _spread(values: dict[str, float] | None, types: list[str], kind: str) -> np.ndarray:
+        row = np.zeros(len(types))
+        for k, v in (values or {}).items():
+            if k not in types:
+                raise ValueError(f"Unknown {kind} type {k} for this fleet")
+            row[types.index(k)] += v
+        return row
+
+    @staticmethod
+    def _check_price(key: str, types: list[str], prices: tuple, columns: tuple):
+        if key not in types:
+            raise ValueError(f"Unknown type {key} for this fleet")
+        i = types.index(key)
+        if not all(np.isclose(p, c[i]) for p, c in zip(prices, columns)):
+            raise ValueError(f"Prices for {key} differ from the fleet price list")
+
+    @classmethod
+    def from_frame(cls, healthposts: pd.DataFrame, services: pd.DataFrame | None = None,
+                   equipment: pd.DataFrame | None = None, start_date: dt.date | None = None,
+                   end_date: dt.date | None = None) -> HealthPostFleet:
+        """Bulk load a fleet from the healthposts table (indexed by name).
+
+        Optional columns ehr_takeup and salary default to 1.0 and SALARY. Every
+        post gets the service mix in services['service_prop'] and the units in
+        equipment['num_units']. The horizon defaults to CONSTANT's dates.
+        """
+        fleet = cls(services, equipment, capacity=max(len(healthposts), 1), start_date=start_date, end_date=end_date)
+        n = len(healthposts)
+        fleet.names[:n] = healthposts.index.to_numpy(dtype=object)
+        fleet.patients[:n] = healthposts['patients'].to_numpy(dtype=float)
+        fleet.rev_per_visit[:n] = healthposts['rev_per_visit'].to_numpy(dtype=float)
+        fleet.nurses[:n] = healthposts['nurses'].to_numpy(dtype=float)
+        if 'ehr_takeup' in healthposts:
+            fleet.ehr_takeup[:n] = healthposts['ehr_takeup'].to_numpy(dtype=float)
+        fleet.salary[:n] = healthposts['salary'].to_numpy(dtype=float) if 'salary' in healthposts else SALARY
+        if services is not None and 'service_prop' in services:
+            fleet.service_prop[:n] = services['service_prop'].to_numpy(dtype=float)
+        if equipment is not None and 'num_units' in equipment:
+            fleet.units[:n] = equipment['num_units'].fillna(0.0).to_numpy(dtype=float)
+
+        fleet._rows = {name: i for i, name in enumerate(fleet.names[:n])}
+        if len(fleet._rows) != n:
+            raise ValueError("Health post names must be unique")
+        fleet.size = n
+        fleet.recompute_totals()
+        return fleet
+
+    @classmethod
+    def from_healthposts(cls, healthposts: list[HealthPost]) -> HealthPostFleet:
+        # the price list is taken from the first post offering each service / equipment type,
+        # the horizon from the first post
+        services = {s.service_type: s for hp in reversed(healthposts) for s in hp.services}
+        equipment = {e.equipment_type: e for hp in reversed(healthposts) for e in hp.equipment}
+        fleet = cls(
+            pd.DataFrame([s.model_dump() for s in services.values()],
+                         columns=['service_type', 'revenue_per_service', 'cost_per_service']).set_index('service_type'),
+            pd.DataFrame([e.model_dump() for e in equipment.values()],
+                         columns=['equipment_type', 'capital_investment', 'monthly_maintenance']).set_index('equipment_type'),
+            capacity=max(len(healthposts), 1),
+            start_date=healthposts[0].start_date if healthposts else None,
+            end_date=healthposts[0].end_date if healthposts else None)
+        for hp in healthposts:
+            fleet.add_healthpost(hp)
+        return fleet
+
+    def take(self, start: int, stop: int) -> HealthPostFleet:
+        # a copy of rows [start, stop) sharing the price lists, small enough to ship to a worker
+        stop = min(stop, self.size)
+        fleet = HealthPostFleet.__new__(HealthPostFleet)
+        fleet.service_types, fleet.equipment_types = self.service_types, self.equipment_types
+        fleet.revenue_per_service, fleet.cost_per_service = self.revenue_per_service, self.cost_per_service
+        fleet.capital_investment, fleet.monthly_maintenance = self.capital_investment, self.monthly_maintenance
+        fleet.start_date, fleet.end_date = self.start_date, self.end_date
+        for k in ['names', 'patients', 'rev_per_visit', 'ehr_takeup', 'nurses', 'salary', 'service_prop', 'units']:
+            setattr(fleet, k, getattr(self, k)[start:stop].copy())
+        fleet.size = stop - start
+        fleet._rows = {name: i for i, name in enumerate(fleet.names)}
+        fleet.recompute_totals()
+        return fleet
+
+    @profiled('fleet.metrics')
+    def metrics(self) -> pd.DataFrame:
+        """Revenue, costs, net income and NPV of every post in one vectorized pass."""
+        rows = slice(0, self.size)
+        return pd.DataFrame(self._metrics(rows), index=pd.Index(self.names[rows], name='name'))
+
+    # fleet totals, named like the HealthPost properties so charts accept either
+    @property
+    def revenue(self) -> float:
+        return self.totals['revenue']
+
+    @property
+    def salaries_cost(self) -> float:
+        return self.totals['salaries_cost']
+
+    @property
+    def cost_of_care(self) -> float:
+        return self.totals['cost_of_care']
+
+    @property
+    def equipment_capital(self) -> float:
+        return self.totals['equipment_capital']
+
+    @property
+    def equipment_maintenance(self) -> float:
+        return self.totals['equipment_maintenance']
+
+    @property
+    def total_cost(self) -> float:
+        return self.totals['total_cost']
+
+    @property
+    def net_income(self) -> float:
+        return self.totals['net_income']
+
+    @property
+    def npv(self) -> float:
+        return self.totals['npv']
+
+    @profiled('fleet.generate_cashflows')
+    def generate_cashflows(self) -> CashFlowAggregator:
+        # the line items of HealthPost.generate_cashflows, summed over the fleet
+        rows = slice(0, self.size)
+        scaled_patients = self.patients[rows] / self.ehr_takeup[rows]
+        visits = scaled_patients @ self.service_prop[rows]
+        units = self.units[rows].sum(axis=0)
+
+        cfs = []
+        for i, service_type in enumerate(self.service_types):
+            cfs.append(CashFlow(name=f'{service_type}_rev', amount=visits[i] * self.revenue_per_service[i],
+                                frequency='D', tag='revenue', **self.horizon))
+            cfs.append(CashFlow(name=f'{service_type}_cost', amount=-visits[i] * self.cost_per_service[i],
+                                frequency='D', tag='cost_of_care', **self.horizon))
+
+        cfs.append(CashFlow(name='salaries', amount=-self.salaries_cost / 12, frequency='ME', tag='salary', **self.horizon))
+
+        for i, equipment_type in enumerate(self.equipment_types):
+            cfs.append(CashFlow(name=f"{equipment_type}_capital",
+                                amount=-self.capital_investment[i] * units[i] * CONSTANT['USDxRWF'],
+                                cashflow_type='once-off', tag='equipment', **self.horizon))
+            cfs.append(CashFlow(name=f"{equipment_type}_maintain",
+                                amount=-self.monthly_maintenance[i] * units[i] * CONSTANT['USDxRWF'],
+                                tag='equipment', **self.horizon))
+
+        return CashFlowAggregator(cfs)
+
+    @profiled('fleet.compact_cashflows')
+    def compact_cashflows(self) -> CompactCashFlows:
+        """Every post's own line items as compact segments, named '<post>/<line item>'.
+
+        The same items as HealthPost.generate_cashflows with the salaries in
+        one line per post. Memory grows with posts x line items, never with days.
+        """
+        rows = slice(0, self.size)
+        posts = self.names[rows].astype(str)
+        visits = (self.patients[rows] / self.ehr_takeup[rows])[:, None] * self.service_prop[rows]
+        units = self.units[rows]
+        fx = CONSTANT['USDxRWF']
+
+        # one block of columns per kind of line item, then flattened post by post
+        blocks = [
+            (self.service_types, '_rev', 'revenue', 'D', 'repeat', visits * self.revenue_per_service),
+            (self.service_types, '_cost', 'cost_of_care', 'D', 'repeat', -visits * self.cost_per_service),
+            (['salaries'], '', 'salary', 'ME', 'repeat', -(self.nurses[rows] * self.salary[rows] / 12)[:, None]),
+            (self.equipment_types, '_capital', 'equipment', 'ME', 'once-off', -units * self.capital_investment * fx),
+            (self.equipment_types, '_maintain', 'equipment', 'ME', 'repeat', -units * self.monthly_maintenance * fx),
+        ]
+        items = [f'{t}{suffix}' for types, suffix, *_ in blocks for t in types]
+        amounts = np.hstack([block[-1] for block in blocks])
+        per_item = lambda i: np.concatenate([[block[i]] * len(block[0]) for block in blocks])
+        n = len(posts)
+        return CompactCashFlows.from_arrays(
+            names=np.char.add(np.repeat(posts, len(items)), np.tile(np.char.add('/', items), n)),
+            tags=np.tile(per_item(2), n),
+            amounts=amounts.ravel(),
+            frequencies=np.tile(per_item(3), n),
+            types=np.tile(per_item(4), n),
+            **self.horizon)
\ No newline at end of file
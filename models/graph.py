@@ -0,0 +1,123 @@
+from __future__ import annotations
+from types import SimpleNamespace
+from typing import Any, Callable
+
+from charts.views import CashflowView
+from models.healthpost import HealthPost
+from models.statements import Statements
+
+_MISSING = object()
+
+class ComputeGraph():
+    """Lazily evaluated nodes that cache their value until one of their inputs changes.
+
+    Setting an input only invalidates the nodes downstream of it, and the
+    next read recomputes just those. Every recomputation is appended to
+    `trace` so callers can see what a change actually cost.
+    """
+
+    def __init__(self):
+        self._functions: dict[str, Callable] = {}
+        self._dependencies: dict[str, list[str]] = {}
+        self._dependents: dict[str, list[str]] = {}
+        self._values: dict[str, Any] = {}
+        self.trace: list[str] = []
+
+    def add_input(self, name: str, value: Any):
+        self._dependencies[name] = []
+        self._dependents.setdefault(name, [])
+        self._values[name] = value
+
+    def add_node(self, name: str, dependencies: list[str], function: Callable):
+        self._functions[name] = function
+        self._dependencies[name] = dependencies
+        self._dependents.setdefault(name, [])
+        for dep in dependencies:
+            self._dependents.setdefault(dep, []).append(name)
+
+    def set(self, name: str, value: Any) -> bool:
+        if name in self._functions:
+            raise ValueError(f"{name} is derived and cannot be set")
+        if self._values.get(name) == value:
+            return False
+        self._values[name] = value
+        self._invalidate(name)
+        return True
+
+    def update(self, **values) -> list[str]:
+        return [name for name, value in values.items() if self.set(name, value)]
+
+    def _invalidate(self, name: str):
+        # a cached node only has cached inputs, so the walk can stop at anything already stale
+        stack = list(self._dependents[name])
+        while stack:
+            node = stack.pop()
+            if self._values.pop(node, _MISSING) is not _MISSING:
+                stack.extend(self._dependents[node])
+
+    def get(self, name: str) -> Any:
+        if name not in self._values:
+            args = {dep: self.get(dep) for dep in self._dependencies[name]}
+            self._values[name] = self._functions[name](**args)
+            self.trace.append(name)
+        return self._values[name]
+
+    def is_cached(self, name: str) -> bool:
+        return name in self._values
+
+    def reset_trace(self) -> list[str]:
+        trace, self.trace = self.trace, []
+        return trace
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_') or name not in self._dependencies:
+            raise AttributeError(name)
+        return self.get(name)
+
+# derived HealthPost quantities and the fields their property reads
+HEALTHPOST_INPUTS = ['patients', 'rev_per_visit', 'ehr_takeup', 'nurses', 'equipment', 'services']
+HEALTHPOST_NODES = {
+    'revenue': ['patients', 'rev_per_visit', 'ehr_takeup'],
+    'service_revenue': ['services', 'ehr_takeup'],
+    'implied_revenue_rate': ['service_revenue', 'patients', 'ehr_takeup'],
+    'num_nurses': ['nurses'],
+    'salaries_cost': ['nurses'],
+    'cost_of_care': ['services'],
+    'equipment_capital': ['equipment'],
+    'equipment_maintenance': ['equipment'],
+    'total_cost': ['salaries_cost', 'cost_of_care', 'equipment_capital', 'equipment_maintenance'],
+    'cost_per_patient': ['total_cost', 'patients'],
+    'patients_per_nurse': ['patients', 'ehr_takeup', 'num_nurses'],
+    'net_income': ['revenue', 'total_cost'],
+    'cashflows': ['patients', 'ehr_takeup', 'services', 'nurses', 'equipment'],
+    'npv': ['cashflows'],
+    'statements': ['cashflows'],
+    'views': ['cashflows'],
+}
+
+def _healthpost_function(name: str) -> Callable:
+    # Run HealthPost's own implementation against only the declared inputs,
+    # so the formulas live in one place and a missing dependency fails loudly
+    if name == 'cashflows':
+        return lambda **deps: HealthPost.generate_cashflows(SimpleNamespace(**deps))
+    if name == 'npv':
+        return lambda cashflows: cashflows.npv
+    if name == 'statements':
+        return lambda cashflows: Statements(cashflows)
+    if name == 'views':
+        return lambda cashflows: CashflowView.from_cashflows(cashflows)
+    prop = getattr(HealthPost, name)
+    return lambda **deps: prop.fget(SimpleNamespace(**deps))
+
+class HealthPostGraph(ComputeGraph):
+    """The readme flowchart as a ComputeGraph over a HealthPost's fields."""
+
+    def __init__(self, hp: HealthPost):
+        super().__init__()
+        for name in HEALTHPOST_INPUTS:
+            self.add_input(name, getattr(hp, name))
+        for name, deps in HEALTHPOST_NODES.items():
+            self.add_node(name, deps, _healthpost_function(name))
+
+    def update_from(self, hp: HealthPost) -> list[str]:
+        return self.update(**{name: getattr(hp, name) for name in HEALTHPOST_INPUTS})
@@ -1,13 +1,17 @@
 from __future__ import annotations
 from uuid import UUID
-from models.cashflow import CashFlow, CashFlowAggregator
+from models.cashflow import CashFlow, CashFlowAggregator, discount_factors
 import datetime as dt
-import matplotlib.pyplot as plt
-import seaborn as sns
+import typing
+import numpy as np
 
 from utils.constants import CONSTANT
+from utils.profiling import count, profiled
 from pydantic import BaseModel
 
+if typing.TYPE_CHECKING:
+    import matplotlib.pyplot as plt
+
 # TODO put this is in a better place
 SALARY = 10_000 * CONSTANT['USDxRWF']
 
@@ -56,6 +60,10 @@ class HealthPost(BaseModel):
     equipment: list[Equipment] = []
     services: list[Service] = []
 
+    # projection horizon of every line item
+    start_date: dt.date = CONSTANT['start_date']
+    end_date: dt.date = CONSTANT['end_date']
+
     @property
     def revenue(self) -> float:
         return self.patients * self.rev_per_visit * CONSTANT['WORKING_DAYS'] / self.ehr_takeup
@@ -105,24 +113,42 @@ class HealthPost(BaseModel):
         return self.revenue - self.total_cost
     
     @property
+    @profiled('healthpost.npv')
     def npv(self) -> float:
         return self.generate_cashflows().npv
     
+    @property
+    def npv_fast(self) -> float:
+        return float(npv_fast(
+            patients=self.patients,
+            ehr_takeup=self.ehr_takeup,
+            service_margin=sum([s.service_prop * (s.revenue_per_service - s.cost_per_service) for s in self.services]),
+            salaries=self.salaries_cost,
+            capital=sum([e.capital_investment * e.num_units for e in self.equipment]),
+            maintenance=sum([e.monthly_maintenance * e.num_units for e in self.equipment]),
+            start_date=self.start_date,
+            end_date=self.end_date,
+        ))
+
+    @profiled('healthpost.generate_cashflows')
     def generate_cashflows(self) -> CashFlowAggregator:
 
+        horizon = {'start_date': self.start_date, 'end_date': self.end_date}
         cfs = []
         for service in self.services:
             service_rev = CashFlow( name=f'{service.service_type}_rev', 
                             amount= self.patients * service.service_prop * service.revenue_per_service / self.ehr_takeup,
                             frequency='D',
-                            tag="revenue"
+                            tag="revenue",
+                            **horizon
                             )
             cfs.append(service_rev)
 
             service_cf = CashFlow( name=f'{service.service_type}_cost', 
                             amount= -self.patients * service.service_prop * service.cost_per_service / self.ehr_takeup,
                             frequency='D',
-                            tag="cost_of_care"
+                            tag="cost_of_care",
+                            **horizon
                             )
             cfs.append(service_cf)
 
@@ -131,7 +157,8 @@ class HealthPost(BaseModel):
                 name=nurse.name if nurse.name is not None else f"nurse_id_{nurse.id}", 
                 amount=-nurse.salary / 12,
                 frequency='ME',
-                tag='salary'
+                tag='salary',
+                **horizon
                 )
             cfs.append(nurse_cf)
 
@@ -139,40 +166,25 @@ class HealthPost(BaseModel):
             capital = CashFlow(name=f"{equipment.equipment_type}_capital", 
                              amount = -equipment.capital_investment * equipment.num_units * CONSTANT['USDxRWF'],
                              cashflow_type='once-off',
-                             tag='equipment')
+                             tag='equipment',
+                             **horizon)
             
             maintain = CashFlow(name=f"{equipment.equipment_type}_maintain",
                                 amount = -equipment.monthly_maintenance * equipment.num_units * CONSTANT['USDxRWF'],
-                                tag='equipment')
+                                tag='equipment',
+                                **horizon)
             cfs.extend([capital, maintain])
 
+        count('objects.CashFlow', len(cfs))
         return CashFlowAggregator(cfs)
     
     def chart_cost_breakdown(self: HealthPost) -> plt:
-
-        # Create a bar chart to show each of the individual costs in the total cost
-        plt.figure(figsize=(10, 6))
-        sns.barplot(x=["Salaries", "Cost of Care", "Equipment Capital", "Equipment Maintenance"], 
-                    y=[self.salaries_cost, self.cost_of_care, self.equipment_capital, self.equipment_maintenance], palette="husl")
-
-        # Set title and labels
-        plt.title("Individual Costs in Total Cost")
-        plt.xlabel("Cost Category")
-        plt.ylabel("Cost (RWF)")
-
-        return plt
+        # plotting is imported on first use, see charts.breakdown
+        from charts.breakdown import chart_cost_breakdown
+        return chart_cost_breakdown(self)
     
     def __add__(self, other: HealthPost) -> HealthPost:
-        patients = self.patients + other.patients
-        rev_per_patient = (self.revenue + other.revenue) / patients
-
-        nurses = self.nurses + other.nurses
-        salary = (self.salaries_cost + other.salaries_cost) / nurses
-
-        equipment = self.equipment + other.equipment
-        service = self.services + other.services
-
-        return HealthPost(patients=patients, rev_per_patient=rev_per_patient, nurses=nurses, salary=salary, equipment=equipment, service=service)
+        return HealthPostAggregator(self.name, [self, other]).hp
 
     def __sub__(self, other: HealthPost) -> float:
         return self.net_income - other.net_income
@@ -180,6 +192,31 @@ class HealthPost(BaseModel):
     def __str__(self):
         return f"Total Net Income: Total = {self.net_income:.2f}"
 
+def npv_fast(patients, ehr_takeup, service_margin, salaries, capital, maintenance, discount_rate: float | None = None,
+             start_date: dt.date | None = None, end_date: dt.date | None = None) -> np.ndarray:
+    """Closed form of HealthPost.npv for one post or NumPy arrays of posts.
+
+    Inputs broadcast against each other:
+      patients        daily patients seen in the EHR
+      ehr_takeup      share of patients captured by the EHR
+      service_margin  sum over services of service_prop * (revenue_per_service - cost_per_service)
+      salaries        annual nurse salaries
+      capital         sum of capital_investment * num_units (USD)
+      maintenance     sum of monthly_maintenance * num_units (USD)
+
+    Every line item of generate_cashflows is linear in these drivers, so the
+    quarterly NPV is a weighted sum of them; see discount_factors for the
+    tolerance against HealthPost.npv. The horizon defaults to CONSTANT's dates.
+    """
+    start, end = start_date or CONSTANT['start_date'], end_date or CONSTANT['end_date']
+    daily = discount_factors(start, end, 'D', start, discount_rate)
+    monthly = discount_factors(start, end, 'ME', start, discount_rate)
+
+    revenue = np.asarray(patients) * np.asarray(service_margin) / np.asarray(ehr_takeup) * daily.sum()
+    costs = (np.asarray(salaries) / 12 + np.asarray(maintenance) * CONSTANT['USDxRWF']) * monthly.sum() \
+            + np.asarray(capital) * CONSTANT['USDxRWF'] * monthly[0]
+    return revenue - costs
+
 class HealthPostAggregator():
     def __init__(self, name:str, healthposts: list[HealthPost]):
         if not all(isinstance(healthpost, HealthPost) for healthpost in healthposts):
@@ -189,12 +226,23 @@ class HealthPostAggregator():
         self._aggregate()
         
     def _aggregate(self):
+        # The merged post has ehr_takeup 1, so each post's takeup is folded into
+        # its revenue and its services' share of the merged patients. Revenue,
+        # costs and NPV then add up; service_revenue only does when takeups match.
+        # models.hierarchy keeps incremental rollups for large portfolios.
         patients = sum([hp.patients for hp in self.healthposts])
-        rev_per_visit = sum([hp.revenue for hp in self.healthposts]) / patients
+        revenue = sum([hp.revenue for hp in self.healthposts])
+        rev_per_visit = revenue / (patients * CONSTANT['WORKING_DAYS']) if patients else 0.0
 
         nurses = [nurse for hp in self.healthposts for nurse in hp.nurses]
         equipment = [equipment for hp in self.healthposts for equipment in hp.equipment]
-        services = [service for hp in self.healthposts for service in hp.services]
+        services = [s.model_copy(update={'service_prop': s.service_prop * hp.patients / hp.ehr_takeup / patients if patients else 0.0})
+                    for hp in self.healthposts for s in hp.services]
+
+        horizons = {(hp.start_date, hp.end_date) for hp in self.healthposts}
+        if len(horizons) > 1:
+            raise ValueError("All health posts must share the same start and end date")
+        horizon = dict(zip(['start_date', 'end_date'], horizons.pop())) if horizons else {}
 
         self.hp = HealthPost(
             name=self.name,
@@ -202,7 +250,8 @@ class HealthPostAggregator():
             rev_per_visit=rev_per_visit,
             nurses=nurses,
             equipment=equipment,
-            service=services)
+            services=services,
+            **horizon)
         
     def add(self, other: HealthPost):
         if not isinstance(other, HealthPost):
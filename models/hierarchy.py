@@ -0,0 +1,188 @@
+from __future__ import annotations
+import datetime as dt
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from models.cashflow import CashFlow, CashFlowMatrix
+from models.fleet import ADDITIVE, HealthPostFleet, metrics
+from utils.constants import CONSTANT
+
+ROOT = 'national'
+
+@lru_cache(maxsize=None)
+def cashflow_basis(start_date: dt.date | None = None, end_date: dt.date | None = None) -> tuple[pd.DatetimeIndex, np.ndarray]:
+    """Monthly totals of a unit daily flow, a unit monthly flow and a unit once-off flow.
+
+    Every line item of HealthPost.generate_cashflows is one of these three
+    scaled by a driver, so a post's monthly cashflows are its three
+    coefficients times this basis. The horizon defaults to CONSTANT's dates.
+    """
+    horizon = {'start_date': start_date or CONSTANT['start_date'], 'end_date': end_date or CONSTANT['end_date']}
+    units = [CashFlow(amount=1.0, frequency='D', tag='revenue', **horizon),
+             CashFlow(amount=1.0, frequency='ME', tag='salary', **horizon),
+             CashFlow(amount=1.0, frequency='ME', cashflow_type='once-off', tag='equipment', **horizon)]
+    labels, basis = CashFlowMatrix(units).resample('ME')
+    basis.flags.writeable = False
+    return labels, basis
+
+def coefficients(columns: dict[str, np.ndarray]) -> np.ndarray:
+    # (posts, 3) daily, monthly and once-off amounts of fleet.columns(), as in HealthPostFleet.generate_cashflows
+    margin = (columns['service_prop'] * (columns['revenue_per_service'] - columns['cost_per_service'])).sum(axis=-1)
+    capital = (columns['units'] * columns['capital_investment']).sum(axis=-1)
+    maintenance = (columns['units'] * columns['monthly_maintenance']).sum(axis=-1)
+    return np.stack([
+        columns['patients'] / columns['ehr_takeup'] * margin,
+        -columns['nurses'] * columns['salary'] / 12 - maintenance * CONSTANT['USDxRWF'],
+        -capital * CONSTANT['USDxRWF'],
+    ], axis=-1)
+
+class PortfolioNode():
+    """A group of posts with the sums of their ADDITIVE figures and monthly cashflows."""
+
+    def __init__(self, path: tuple[str, ...], parent: PortfolioNode | None, width: int):
+        self.path = path
+        self.parent = parent
+        self.children: dict[str, PortfolioNode] = {}
+        self.posts = 0
+        self.values = np.zeros(width)       # ADDITIVE sums then the monthly cashflow vector
+
+    @property
+    def name(self) -> str:
+        return self.path[-1] if self.path else ROOT
+
+class PortfolioTree():
+    """Posts grouped by keys such as province then district, with rollups at every level.
+
+    Leaves are the rows of a HealthPostFleet. Each node keeps the sum of its
+    posts' ADDITIVE figures and monthly cashflows, so reading any node is a
+    lookup, and adding, updating or removing one post only walks its path to
+    the root: O(depth) vector additions. Groups are the columns of `groups`,
+    outermost level first.
+    """
+
+    def __init__(self, fleet: HealthPostFleet, groups: pd.DataFrame, levels: list[str] | None = None):
+        self.fleet = fleet
+        self.levels = levels or list(groups.columns)
+        self.months, self.basis = cashflow_basis(**fleet.horizon)
+        self.width = len(ADDITIVE) + len(self.months)
+        self.root = PortfolioNode((), None, self.width)
+        self.paths: dict[str, tuple[str, ...]] = {}
+
+        names = fleet.posts
+        missing = set(names) - set(groups.index)
+        if missing:
+            raise ValueError(f"No groups for posts {sorted(missing)[:5]}")
+        keys = groups.loc[names, self.levels].astype(str)
+        values = self._values(slice(0, len(fleet)))
+
+        # build bottom up with one grouped sum per level rather than post by post
+        self.root.values += values.sum(axis=0)
+        self.root.posts = len(names)
+        for depth in range(1, len(self.levels) + 1):
+            level = keys.iloc[:, :depth]
+            codes, uniques = pd.MultiIndex.from_frame(level).factorize()
+            sums = np.zeros((len(uniques), self.width))
+            np.add.at(sums, codes, values)
+            counts = np.bincount(codes, minlength=len(uniques))
+            for i, path in enumerate(uniques):
+                node = self._node(tuple(path), create=True)
+                node.values = sums[i]
+                node.posts = int(counts[i])
+        self.paths = dict(zip(names, map(tuple, keys.to_numpy())))
+
+    def _values(self, rows) -> np.ndarray:
+        columns = self.fleet.columns(rows)
+        figures = metrics(**columns, **self.fleet.horizon)
+        return np.concatenate([np.stack([figures[k] for k in ADDITIVE], axis=-1),
+                               coefficients(columns) @ self.basis], axis=-1)
+
+    def _node(self, path: tuple[str, ...], create: bool = False) -> PortfolioNode:
+        node = self.root
+        for depth in range(len(path)):
+            child = node.children.get(path[depth])
+            if child is None:
+                if not create:
+                    raise KeyError(f"No group {path[:depth + 1]}")
+                child = node.children[path[depth]] = PortfolioNode(path[:depth + 1], node, self.width)
+            node = child
+        return node
+
+    def _propagate(self, path: tuple[str, ...], delta: np.ndarray, posts: int):
+        node = self._node(path, create=True)
+        while node is not None:
+            node.values += delta
+            node.posts += posts
+            node = node.parent
+
+    def _row(self, name: str) -> np.ndarray:
+        row = self.fleet._rows[name]
+        return self._values(slice(row, row + 1))[0]
+
+    def add(self, name: str, path: tuple[str, ...] | dict[str, str], **drivers):
+        """Add a post to the fleet and the tree, drivers as for HealthPostFleet.add."""
+        path = tuple(str(path[level]) for level in self.levels) if isinstance(path, dict) else tuple(map(str, path))
+        if len(path) != len(self.levels):
+            raise ValueError(f"Expected a group for each of {self.levels}")
+        self.fleet.add(name, **drivers)
+        self.paths[name] = path
+        self._propagate(path, self._row(name), 1)
+
+    def remove(self, name: str):
+        path = self.paths.pop(name)
+        self._propagate(path, -self._row(name), -1)
+        self.fleet.remove(name)
+
+    def drivers(self, name: str) -> dict:
+        row = self.fleet._rows[name]
+        return {
+            'patients': self.fleet.patients[row],
+            'rev_per_visit': self.fleet.rev_per_visit[row],
+            'ehr_takeup': self.fleet.ehr_takeup[row],
+            'nurses': self.fleet.nurses[row],
+            'salary': self.fleet.salary[row],
+            'service_prop': dict(zip(self.fleet.service_types, self.fleet.service_prop[row])),
+            'units': dict(zip(self.fleet.equipment_types, self.fleet.units[row])),
+        }
+
+    def update(self, name: str, **drivers):
+        """Change some drivers of one post, the rest keep their values."""
+        path = self.paths[name]
+        old = self._row(name)
+        current = self.drivers(name)
+        for k in ('service_prop', 'units'):
+            if k in drivers:
+                drivers[k] = current[k] | drivers[k]
+        self.fleet.remove(name)
+        self.fleet.add(name, **(current | drivers))
+        self._propagate(path, self._row(name) - old, 0)
+
+    def node(self, *path: str) -> PortfolioNode:
+        return self._node(tuple(map(str, path)))
+
+    def totals(self, *path: str) -> dict[str, float]:
+        node = self.node(*path)
+        return dict(zip(ADDITIVE, node.values[:len(ADDITIVE)].tolist()))
+
+    def npv(self, *path: str) -> float:
+        return self.totals(*path)['npv']
+
+    def net_income(self, *path: str) -> float:
+        return self.totals(*path)['net_income']
+
+    def cashflows(self, *path: str) -> pd.Series:
+        # monthly net cashflows of the group
+        return pd.Series(self.node(*path).values[len(ADDITIVE):], index=self.months, name='net_cashflow')
+
+    def frame(self, depth: int | None = None) -> pd.DataFrame:
+        """ADDITIVE totals of every node at depth (the leaf groups by default), indexed by path."""
+        depth = len(self.levels) if depth is None else depth
+        nodes = [self.root]
+        for _ in range(depth):
+            nodes = [child for node in nodes for child in node.children.values()]
+        nodes = [node for node in nodes if node.posts]
+        index = pd.MultiIndex.from_tuples([node.path for node in nodes], names=self.levels[:depth]) if depth else pd.Index([ROOT])
+        df = pd.DataFrame([node.values[:len(ADDITIVE)] for node in nodes], index=index, columns=ADDITIVE)
+        df.insert(0, 'posts', [node.posts for node in nodes])
+        return df
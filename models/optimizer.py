@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from models.fleet import HealthPostFleet
+from models.healthpost import npv_fast
+from utils.profiling import profiled
+
+class Allocation():
+    """An optimized allocation of nurses and equipment kits across a fleet.
+
+    posts holds the nurses, equipped share and patients served of every post
+    with its NPV, shadow_prices the NPV of one more unit of each fleet-wide
+    budget (nurses, units of each equipment type) from the LP relaxation,
+    slack how much of each budget the allocation leaves unused, and
+    post_prices the per-post value of one more patient of demand and of one
+    more patient of nurse capacity. A budget with slack has a zero shadow
+    price, more of it is worth nothing while some is left over.
+    """
+
+    def __init__(self, posts: pd.DataFrame, shadow_prices: pd.Series, slack: pd.Series, post_prices: pd.DataFrame,
+                 npv: float, current_npv: float, relaxed_npv: float, integral: bool, message: str):
+        self.posts = posts
+        self.shadow_prices = shadow_prices
+        self.slack = slack
+        self.post_prices = post_prices
+        self.npv = npv
+        self.current_npv = current_npv
+        self.relaxed_npv = relaxed_npv
+        self.integral = integral
+        self.message = message
+
+    def summary(self) -> dict[str, float]:
+        return {
+            'npv': self.npv,
+            'current_npv': self.current_npv,
+            'npv_gain': self.npv - self.current_npv,
+            'relaxed_npv': self.relaxed_npv,
+            'gap': (self.relaxed_npv - self.npv) / abs(self.relaxed_npv) if self.relaxed_npv else 0.0,
+            'nurses': float(self.posts['nurses'].sum()),
+            'equipped_posts': float(self.posts['equipped'].sum()),
+            'patients_served': float(self.posts['served'].sum()),
+            'patients_turned_away': float((self.posts['demand'] - self.posts['served']).sum()),
+        }
+
+    def budgets(self) -> pd.DataFrame:
+        # shadow price and unused amount of every fleet-wide budget, binding where nothing is left
+        return pd.DataFrame({'npv_per_unit': self.shadow_prices, 'slack': self.slack,
+                             'binding': np.isclose(self.slack, 0.0, atol=1e-6)})
+
+def coefficients(fleet: HealthPostFleet) -> dict[str, np.ndarray]:
+    """NPV per patient served, per nurse and per equipment kit of every post.
+
+    npv_fast is linear in each driver, so each coefficient is npv_fast with
+    that driver at one and the others at zero.
+    """
+    columns = fleet.columns()
+    n = len(fleet)
+    zeros, ones = np.zeros(n), np.ones(n)
+    margin = columns['service_prop'] @ (columns['revenue_per_service'] - columns['cost_per_service'])
+    return {
+        'served': npv_fast(ones, columns['ehr_takeup'], margin, zeros, zeros, zeros, **fleet.horizon),
+        'nurse': npv_fast(zeros, ones, zeros, columns['salary'], zeros, zeros, **fleet.horizon),
+        'kit': npv_fast(zeros, ones, zeros, zeros,
+                        columns['units'] @ columns['capital_investment'], columns['units'] @ columns['monthly_maintenance'],
+                        **fleet.horizon),
+    }
+
+@profiled('optimizer.allocate')
+def allocate(fleet: HealthPostFleet, nurses: float | None = None, stock: dict[str, float] | None = None,
+             patients_per_nurse: float = 30.0, min_nurses: float = 1.0, max_nurses: float = 10.0,
+             close_posts: bool = False, use_all_nurses: bool = False, integral: bool = True,
+             mip_gap: float = 1e-2, time_limit: float = 10.0) -> Allocation:
+    """Nurses and equipment kits per post that maximize fleet NPV in one solve.
+
+    Each post's demand is its patients. A post serves up to its demand when
+    equipped with its kit (its units of each equipment type), and at most
+    patients_per_nurse per nurse on the HealthPost.patients_per_nurse
+    measure, so served / ehr_takeup <= patients_per_nurse * nurses. An
+    equipped post needs at least min_nurses nurses. The fleet has `nurses` nurses
+    and `stock` units of each equipment type, by default what it holds now.
+    Nurses cost more than the margin they bring in at most posts, so the
+    budget is an upper bound that often stays slack; use_all_nurses makes it
+    an equality, placing every nurse where it costs the least NPV. Every post
+    stays equipped unless close_posts, which lets loss making posts close and
+    kits move to where they earn most.
+
+    NPV is linear in served patients, nurses and kits, so this is a linear
+    program, with whole nurses and all-or-nothing kits as a MILP when
+    integral, stopped within mip_gap of the LP bound or at time_limit seconds
+    with the best allocation found; summary reports the gap reached. Shadow
+    prices always come from the LP relaxation.
+    """
+    from scipy.optimize import Bounds, LinearConstraint, linprog, milp
+    from scipy.sparse import csr_array, diags, hstack, identity, vstack
+
+    n = len(fleet)
+    if n == 0:
+        raise ValueError("The fleet has no posts to allocate to")
+    columns = fleet.columns()
+    units = columns['units']
+    nurses = float(columns['nurses'].sum()) if nurses is None else float(nurses)
+    stock = dict(zip(fleet.equipment_types, units.sum(axis=0))) | (stock or {})
+    unknown = set(stock) - set(fleet.equipment_types)
+    if unknown:
+        raise ValueError(f"Unknown equipment types {sorted(unknown)} for this fleet")
+    kit_types = [j for j, t in enumerate(fleet.equipment_types) if units[:, j].any()]
+    coef = coefficients(fleet)
+
+    # variables are [served, nurses, equipped] per post, constraints A @ x <= b
+    eye, empty = identity(n, format='csr'), csr_array((n, n))
+    demand = hstack([eye, empty, diags(-columns['patients'])])
+    capacity = hstack([diags(1 / columns['ehr_takeup']),
+                       -patients_per_nurse * eye, empty])
+    staffed = hstack([empty, -eye, min_nurses * eye])
+    budget = csr_array(np.concatenate([np.zeros(n), np.ones(n), np.zeros(n)])[None, :])
+    kits = csr_array(np.hstack([np.zeros((len(kit_types), 2 * n)), units[:, kit_types].T]))
+    A = vstack([demand, capacity, staffed, budget, kits], format='csr')
+    b = np.concatenate([np.zeros(3 * n), [nurses], [stock[fleet.equipment_types[j]] for j in kit_types]])
+    # rows with a lower bound too, only the nurse budget when every nurse must be placed
+    b_lower = np.full(len(b), -np.inf)
+    if use_all_nurses:
+        b_lower[3 * n] = nurses
+    ineq = np.isinf(b_lower)
+
+    c = -np.concatenate([coef['served'], coef['nurse'], coef['kit']])
+    lower = np.concatenate([np.zeros(2 * n), np.zeros(n) if close_posts else np.ones(n)])
+    upper = np.concatenate([columns['patients'], np.full(n, max_nurses), np.ones(n)])
+
+    relaxed = linprog(c, A_ub=A[ineq], b_ub=b[ineq], A_eq=A[~ineq] if use_all_nurses else None,
+                      b_eq=b[~ineq] if use_all_nurses else None, bounds=np.column_stack([lower, upper]), method='highs')
+    if relaxed.status != 0:
+        raise ValueError(f"No feasible allocation, check the nurse and equipment budgets or allow closing posts: {relaxed.message}")
+    x, message = relaxed.x, relaxed.message
+    if integral:
+        solved = milp(c, constraints=LinearConstraint(A, b_lower, b), bounds=Bounds(lower, upper),
+                      integrality=np.concatenate([np.zeros(n), np.ones(2 * n)]), options={'time_limit': time_limit, 'mip_rel_gap': mip_gap})
+        if solved.x is None:
+            raise ValueError(f"No whole allocation found: {solved.message}")
+        x, message = solved.x, solved.message
+
+    # marginals are d(-NPV)/d(b), so the NPV of one more unit is their negative
+    marginals = np.zeros(len(b))
+    marginals[ineq] = -relaxed.ineqlin.marginals
+    if use_all_nurses:
+        marginals[~ineq] = -relaxed.eqlin.marginals
+    served, staff, equipped = x[:n], x[n:2 * n], x[2 * n:]
+    names = pd.Index(fleet.posts, name='name')
+    posts = pd.DataFrame({
+        'demand': columns['patients'],
+        'served': served,
+        'nurses': staff,
+        'equipped': equipped,
+        'current_nurses': columns['nurses'],
+        'npv': coef['served'] * served + coef['nurse'] * staff + coef['kit'] * equipped,
+    }, index=names)
+    budgets = ['nurse'] + [fleet.equipment_types[j] for j in kit_types]
+    shadow_prices = pd.Series(marginals[3 * n:], index=budgets, name='npv_per_unit')
+    slack = pd.Series(np.maximum(b[3 * n:] - A[3 * n:] @ x, 0.0), index=budgets, name='slack')
+    post_prices = pd.DataFrame({'demand': marginals[:n],
+                                'capacity': marginals[n:2 * n]}, index=names)
+
+    # what the posts are worth as they are: every post equipped, serving what its nurses allow
+    current = np.minimum(columns['patients'], patients_per_nurse * columns['nurses'] * columns['ehr_takeup'])
+    current_npv = float(coef['served'] @ current + coef['nurse'] @ columns['nurses'] + coef['kit'].sum())
+    return Allocation(posts, shadow_prices, slack, post_prices, float(-c @ x), current_npv, float(-relaxed.fun), integral, message)
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from models.cashflow import CashFlowAggregator
+from models.compact import CompactCashFlows
+from models.fleet import HealthPostFleet
+from utils.constants import CONSTANT
+from utils.profiling import profiled
+
+class PaymentTerms(BaseModel):
+    """How one payer settles its share of revenue.
+
+    delay[d] is the share of a day's billing paid d days later. Whatever
+    the delays leave short of 1 is never collected.
+    """
+    payer: str
+    share: float
+    delay: list[float] = [1.0]
+
+    @classmethod
+    def fixed(cls, payer: str, share: float, days: int) -> PaymentTerms:
+        if days < 0:
+            raise ValueError(f"Payment days for {payer} must not be negative, got {days}")
+        return cls(payer=payer, share=share, delay=[0.0] * days + [1.0])
+
+    @classmethod
+    def spread(cls, payer: str, share: float, min_days: int, max_days: int, collected: float = 1.0) -> PaymentTerms:
+        # paid evenly over min_days to max_days after the visit
+        if min_days < 0 or max_days < min_days:
+            raise ValueError(f"Payment days for {payer} must satisfy 0 <= min_days <= max_days, got {min_days} to {max_days}")
+        days = max_days - min_days + 1
+        return cls(payer=payer, share=share, delay=[0.0] * min_days + [collected / days] * days)
+
+    @property
+    def days(self) -> tuple[int, int]:
+        # first and last day with a payment
+        paid = np.flatnonzero(np.asarray(self.delay) > 0)
+        return (int(paid[0]), int(paid[-1])) if len(paid) else (0, 0)
+
+# community health insurance reimburses most visits in arrears, the rest is paid at the visit
+DEFAULT_TERMS = [
+    PaymentTerms.spread('insurer', 0.9, 30, 90),
+    PaymentTerms.fixed('out_of_pocket', 0.1, 0),
+]
+
+def kernels(terms: list[PaymentTerms]) -> np.ndarray:
+    """Payers x days of delay, each row the payer's delay scaled by its share."""
+    if not terms:
+        raise ValueError("At least one payer is needed")
+    shares = sum(t.share for t in terms)
+    if not np.isclose(shares, 1.0):
+        raise ValueError(f"Payer shares add up to {shares:.3f}, not 1")
+    for t in terms:
+        if min(t.delay) < 0 or sum(t.delay) > 1 + 1e-9:
+            raise ValueError(f"Delays for {t.payer} must be non-negative and add up to at most 1")
+    out = np.zeros((len(terms), max(len(t.delay) for t in terms)))
+    for i, t in enumerate(terms):
+        out[i, :len(t.delay)] = t.share * np.asarray(t.delay)
+    return out
+
+def delay(billed: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    """Cash received per payer for daily billing, as one batched FFT convolution.
+
+    billed has shape (..., days) and kernel (payers, lags); the result is
+    (..., payers, days). Payments falling after the last day are dropped.
+    """
+    days = billed.shape[-1]
+    size = days + kernel.shape[-1] - 1
+    n = 1 << (size - 1).bit_length()
+    spectrum = np.fft.rfft(billed, n)[..., None, :] * np.fft.rfft(kernel, n)
+    return np.fft.irfft(spectrum, n)[..., :days]
+
+def quarterly_npv(dates: pd.DatetimeIndex, values: np.ndarray, discount_rate: float | None = None) -> np.ndarray:
+    # as CashFlowAggregator.npv for every row: quarterly totals discounted at a quarter of the annual rate
+    rate = (CONSTANT['discount_rate'] if discount_rate is None else discount_rate) / 4
+    quarters = pd.DataFrame(np.atleast_2d(values).T, index=dates).resample('QE').sum().to_numpy().T
+    return (quarters / (1 + rate) ** np.arange(quarters.shape[-1])).sum(axis=-1)
+
+class Receivables():
+    """Daily billing, cash received per payer and the balances that follow, per group of flows.
+
+    Revenue flows are billed as before and paid per the payer terms, costs
+    are paid as they fall. Every array has the groups on the first axis and
+    the days on the last.
+    """
+
+    @profiled('receivables.build')
+    def __init__(self, cashflows: CashFlowAggregator | CompactCashFlows, terms: list[PaymentTerms] | None = None,
+                 by: np.ndarray | None = None, groups: list[str] | None = None):
+        compact = cashflows.compact if isinstance(cashflows, CashFlowAggregator) else cashflows
+        self.terms = DEFAULT_TERMS if terms is None else terms
+        self.payers = [t.payer for t in self.terms]
+        by = np.zeros(len(compact), dtype=np.int64) if by is None else np.asarray(by, dtype=np.int64)
+        num_groups = int(by.max()) + 1 if len(by) else 1
+        self.groups = groups or [str(i) for i in range(num_groups)]
+
+        # revenue and every flow per group, one extra group code keeps the two sums in one pass
+        revenue = compact.tags == 'revenue'
+        self.dates, values = compact.totals('D', np.where(revenue, by, by + num_groups))
+        values = np.vstack([values, np.zeros((2 * num_groups - len(values), values.shape[-1]))])
+        self.billed = values[:num_groups]
+        self.costs = values[num_groups:]
+        self.received = delay(self.billed, kernels(self.terms))          # groups x payers x days
+
+    @property
+    def collected(self) -> np.ndarray:
+        return self.received.sum(axis=1)
+
+    @property
+    def balance(self) -> np.ndarray:
+        """Receivables outstanding at the end of each day."""
+        return np.cumsum(self.billed - self.collected, axis=-1)
+
+    @property
+    def outstanding(self) -> np.ndarray:
+        # per payer balance, groups x payers x days, adding up to balance
+        shares = np.array([t.share for t in self.terms])
+        return np.cumsum(self.billed[:, None, :] * shares[:, None] - self.received, axis=-1)
+
+    @property
+    def cash_position(self) -> np.ndarray:
+        # cumulative cash with revenue as collected, against accrual_position with revenue as billed
+        return np.cumsum(self.collected + self.costs, axis=-1)
+
+    @property
+    def accrual_position(self) -> np.ndarray:
+        return np.cumsum(self.billed + self.costs, axis=-1)
+
+    @property
+    def npv(self) -> np.ndarray:
+        return quarterly_npv(self.dates, self.billed + self.costs)
+
+    @property
+    def delayed_npv(self) -> np.ndarray:
+        return quarterly_npv(self.dates, self.collected + self.costs)
+
+    def summary(self) -> pd.DataFrame:
+        """Per group NPV with and without delays, the cash trough and its date, and peak and closing receivables."""
+        cash, balance = self.cash_position, self.balance
+        trough = cash.argmin(axis=-1)
+        return pd.DataFrame({
+            'npv': self.npv,
+            'delayed_npv': self.delayed_npv,
+            'npv_cost_of_delay': self.npv - self.delayed_npv,
+            'cash_trough': np.minimum(cash.min(axis=-1), 0.0),
+            'trough_date': self.dates[trough],
+            'peak_receivables': balance.max(axis=-1),
+            'closing_receivables': balance[:, -1],
+        }, index=pd.Index(self.groups, name='group'))
+
+    def frame(self, group: int = 0, frequency: str = 'D') -> pd.DataFrame:
+        # one group's daily balances, end of period values when resampled
+        df = pd.DataFrame({'billed': self.billed[group], 'collected': self.collected[group],
+                           'receivables': self.balance[group], 'cash_position': self.cash_position[group],
+                           'accrual_position': self.accrual_position[group]}, index=self.dates)
+        if frequency == 'D':
+            return df
+        flows = df[['billed', 'collected']].resample(frequency).sum()
+        return flows.join(df.drop(columns=['billed', 'collected']).resample(frequency).last())
+
+def fleet_receivables(fleet: HealthPostFleet, terms: list[PaymentTerms] | None = None) -> Receivables:
+    """Receivables of every post in a fleet, groups are the posts."""
+    compact = fleet.compact_cashflows()
+    per_post = len(compact) // max(len(fleet), 1)
+    return Receivables(compact, terms, np.repeat(np.arange(len(fleet)), per_post), fleet.posts)
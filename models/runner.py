@@ -0,0 +1,165 @@
+from __future__ import annotations
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from models.fleet import HealthPostFleet
+from models.simulation import SimulationConfig, SimulationResult, simulate
+
+class HistogramSketch():
+    """Mergeable quantile sketch on fixed log-spaced bins.
+
+    Bins are symmetric around zero with `per_decade` bins per power of ten,
+    so any two sketches can be added bin by bin and quantiles come back within
+    about 10 ** (1 / per_decade) - 1 relative error (5% by default).
+    """
+
+    def __init__(self, per_decade: int = 50, decades: tuple[int, int] = (0, 13)):
+        positive = np.logspace(decades[0], decades[1], per_decade * (decades[1] - decades[0]) + 1)
+        self.edges = np.concatenate([-positive[::-1], [0.0], positive])
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64)
+
+    def update(self, values: np.ndarray):
+        self.counts += np.bincount(np.searchsorted(self.edges, values), minlength=len(self.counts))
+
+    def merge(self, other: HistogramSketch):
+        self.counts += other.counts
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def quantile(self, q: float) -> float:
+        cumulative = np.cumsum(self.counts)
+        if cumulative[-1] == 0:
+            return float('nan')
+        i = int(np.searchsorted(cumulative, q * cumulative[-1]))
+        # midpoint of the bin, the open ended outer bins report their inner edge
+        lo = self.edges[max(i - 1, 0)]
+        hi = self.edges[min(i, len(self.edges) - 1)]
+        return float((lo + hi) / 2)
+
+class RunningSummary():
+    """Folds chunk results, in chunk order, into per-post stats and portfolio reductions."""
+
+    def __init__(self, num_posts: int, scenarios: int):
+        self.names = np.empty(num_posts, dtype=object)
+        self.stats: dict[str, np.ndarray] = {}
+        self.portfolio_npv = np.zeros(scenarios)
+        self.post_npv = HistogramSketch()
+        self.posts_done = 0
+        self.npv_sum = 0.0
+
+    def update(self, result: SimulationResult):
+        rows = slice(self.posts_done, self.posts_done + len(result.names))
+        self.names[rows] = result.names
+        for k, v in result.stats.items():
+            self.stats.setdefault(k, np.empty(len(self.names), dtype=v.dtype))[rows] = v
+        self.portfolio_npv += result.portfolio_npv
+        self.post_npv.update(result.stats['npv_mean'])
+        self.npv_sum += float(result.stats['npv_mean'].sum(dtype=np.float64))
+        self.posts_done = rows.stop
+
+    @property
+    def mean_post_npv(self) -> float:
+        return self.npv_sum / self.posts_done if self.posts_done else float('nan')
+
+    def result(self) -> SimulationResult:
+        rows = slice(0, self.posts_done)
+        return SimulationResult(self.names[rows], {k: v[rows] for k, v in self.stats.items()}, self.portfolio_npv)
+
+def _run_chunk(fleet: HealthPostFleet, config: SimulationConfig, seed: np.random.SeedSequence) -> SimulationResult:
+    return simulate(fleet, config, rng=np.random.default_rng(seed))
+
+class ScenarioRunner():
+    """Shards a fleet simulation into fixed-size chunks of posts, optionally over a process pool.
+
+    Chunk boundaries and their SeedSequence children depend only on
+    chunk_size and seed, and chunk results are folded in chunk order, so the
+    output is bit-identical for any number of workers.
+    """
+
+    def __init__(self, fleet: HealthPostFleet, config: SimulationConfig | None = None,
+                 seed: int = 0, chunk_size: int = 512, workers: int | None = 1):
+        self.fleet = fleet
+        self.config = config or SimulationConfig()
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count()
+        self.num_chunks = -(-len(fleet) // chunk_size)
+        self.seeds = np.random.SeedSequence(seed).spawn(self.num_chunks)
+
+    def _chunk(self, i: int) -> HealthPostFleet:
+        return self.fleet.take(i * self.chunk_size, (i + 1) * self.chunk_size)
+
+    def iter_results(self) -> Iterator[SimulationResult]:
+        # yields chunk results in chunk order, at most 2 * workers chunks in flight
+        if self.workers == 1:
+            for i in range(self.num_chunks):
+                yield _run_chunk(self._chunk(i), self.config, self.seeds[i])
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = {}
+            submitted = 0
+            try:
+                for i in range(self.num_chunks):
+                    while submitted < self.num_chunks and submitted < i + 2 * self.workers:
+                        pending[submitted] = pool.submit(_run_chunk, self._chunk(submitted), self.config, self.seeds[submitted])
+                        submitted += 1
+                    yield pending.pop(i).result()
+            finally:
+                # the caller stopped early, drop whatever has not started
+                for future in pending.values():
+                    future.cancel()
+
+    def iter_summaries(self) -> Iterator[RunningSummary]:
+        # the running summary after every chunk, for progress reporting
+        summary = RunningSummary(len(self.fleet), self.config.scenarios)
+        for result in self.iter_results():
+            summary.update(result)
+            yield summary
+
+    def run(self) -> SimulationResult:
+        summary = RunningSummary(len(self.fleet), self.config.scenarios)
+        for summary in self.iter_summaries():
+            pass
+        return summary.result()
+
+def summarise(result: SimulationResult, percentiles=(5, 50, 95)) -> dict:
+    npv = result.portfolio_npv
+    return {
+        'posts': len(result.names),
+        'scenarios': len(npv),
+        'portfolio_npv_mean': float(npv.mean()),
+        **{f'portfolio_npv_p{p:g}': float(v) for p, v in zip(percentiles, np.percentile(npv, percentiles))},
+        'prob_negative_portfolio_npv': result.prob_negative_portfolio_npv,
+        'posts_with_negative_mean_npv': int((result.stats['npv_mean'] < 0).sum()),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo of health post NPV across a process pool")
+    parser.add_argument('--healthposts', default='data/healthposts.csv')
+    parser.add_argument('--services', default='data/services.csv')
+    parser.add_argument('--scenarios', type=int, default=1_000)
+    parser.add_argument('--method', choices=['clt', 'daily'], default='clt')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help="defaults to one per core")
+    parser.add_argument('--chunk-size', type=int, default=512)
+    parser.add_argument('--out', default=None, help="write per-post results to this csv")
+    args = parser.parse_args()
+
+    healthposts = pd.read_csv(args.healthposts).set_index('name')
+    services = pd.read_csv(args.services).set_index('service_type')
+    fleet = HealthPostFleet.from_frame(healthposts, services)
+
+    runner = ScenarioRunner(fleet, SimulationConfig(scenarios=args.scenarios, method=args.method),
+                            seed=args.seed, chunk_size=args.chunk_size, workers=args.workers)
+    result = runner.run()
+    if args.out:
+        result.to_frame().to_csv(args.out)
+    print(json.dumps(summarise(result), indent=2))
@@ -0,0 +1,219 @@
+from __future__ import annotations
+import json
+import os
+from pathlib import Path
+import tempfile
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from models.cashflow import discount_factors
+from models.fleet import HealthPostFleet
+from models.hierarchy import cashflow_basis
+from utils.cache import CACHE_DIR, input_hash
+from utils.constants import CONSTANT
+
+SERVICE_FIELDS = ['revenue_per_service', 'cost_per_service', 'service_prop']
+EQUIPMENT_FIELDS = ['capital_investment', 'monthly_maintenance', 'num_units']
+DRIVERS = ['patients', 'rev_per_visit', 'ehr_takeup', 'nurses', 'salary']
+DAILY, MONTHLY, ONCE_OFF = 0, 1, 2
+
+class Variant(BaseModel):
+    """A what-if as changes against a base fleet, every post gets the same change.
+
+    services and equipment map a type to the fields it overrides, drivers set
+    a per-post driver on every post and scale multiplies one.
+    """
+    name: str
+    services: dict[str, dict[str, float]] = {}
+    equipment: dict[str, dict[str, float]] = {}
+    drivers: dict[str, float] = {}
+    scale: dict[str, float] = {}
+
+    @classmethod
+    def from_tables(cls, name: str, services: pd.DataFrame, equipment: pd.DataFrame,
+                    edited_services: pd.DataFrame, edited_equipment: pd.DataFrame, **kwargs) -> Variant:
+        """The cells that differ between base and edited tables, as from st.data_editor.
+
+        Rows deleted from an edited table count as a zero service_prop or num_units.
+        """
+        return cls(name=name,
+                   services=_table_delta(services, edited_services, SERVICE_FIELDS, 'service_prop'),
+                   equipment=_table_delta(equipment, edited_equipment, EQUIPMENT_FIELDS, 'num_units'),
+                   **kwargs)
+
+def _by_type(df: pd.DataFrame, fields: list[str], share: str) -> pd.DataFrame:
+    # one row per type as HealthPostFleet holds them, the first row's prices and the summed share
+    df = df[[k for k in fields if k in df.columns]]
+    merged = df[~df.index.duplicated()].copy()
+    if share in df.columns:
+        merged[share] = df[share].groupby(level=0, sort=False).sum()
+    return merged
+
+def _table_delta(base: pd.DataFrame, edited: pd.DataFrame, fields: list[str], share: str) -> dict[str, dict[str, float]]:
+    base, edited = _by_type(base, fields, share), _by_type(edited, fields, share)
+    added = set(edited.index) - set(base.index)
+    if added:
+        raise ValueError(f"Variants cannot add rows, {sorted(map(str, added))} are not in the base")
+    delta = {}
+    for key in base.index:
+        if key not in edited.index:
+            delta[str(key)] = {share: 0.0}
+            continue
+        changed = {k: float(edited.at[key, k]) for k in base.columns
+                   if k in edited.columns and not np.isclose(edited.at[key, k], base.at[key, k], equal_nan=True)}
+        if changed:
+            delta[str(key)] = changed
+    return delta
+
+class ScenarioStore():
+    """Variants of one base fleet, evaluated side by side and kept on local disk.
+
+    The fleet's cashflows are the line items of HealthPostFleet.generate_cashflows,
+    each a driver times a daily, monthly or once-off unit flow. The store keeps
+    the base amounts and their monthly matrix, and a variant only recomputes the
+    line items its changes reach, so comparing many variants costs a few
+    vector operations each rather than a rebuild. Variants are saved under
+    directory as json named by a hash of the base's service and equipment
+    tables only, so they stay with the tables they were edited from and are
+    evaluated against whatever drivers the base currently has.
+    """
+
+    def __init__(self, base: HealthPostFleet, directory: str | Path = CACHE_DIR / 'scenarios'):
+        self.base = base
+        columns = base.columns()
+        tables = {k: v for k, v in columns.items() if k not in DRIVERS}
+        self.key = input_hash('scenarios', base.service_types, base.equipment_types, tables, CONSTANT, version=None)
+        self.path = Path(directory) / f'{self.key}.json'
+        self.months, self.basis = cashflow_basis(**base.horizon)
+
+        services, equipment = base.service_types, base.equipment_types
+        self.names = [f'{s}_{k}' for s in services for k in ('rev', 'cost')] + ['salaries'] \
+                     + [f'{e}_{k}' for e in equipment for k in ('capital', 'maintain')]
+        self.tags = np.array(['revenue', 'cost_of_care'] * len(services) + ['salary'] + ['equipment'] * 2 * len(equipment))
+        self.kinds = np.array([DAILY] * 2 * len(services) + [MONTHLY] + [ONCE_OFF, MONTHLY] * len(equipment))
+
+        start, end = base.start_date, base.end_date
+        monthly = discount_factors(start, end, 'ME', start)
+        self.weights = np.array([discount_factors(start, end, 'D', start).sum(), monthly.sum(), monthly[0]])
+
+        self.amounts = self._amounts(self._columns(None), range(len(services)), range(len(equipment)), True)
+        self.matrix = self.amounts[:, None] * self.basis[self.kinds]
+        self.variants: dict[str, Variant] = {}
+        self.load()
+
+    def _columns(self, variant: Variant | None) -> dict[str, np.ndarray]:
+        # fleet columns with the variant applied, untouched columns are the fleet's own arrays
+        columns = self.base.columns()
+        if variant is None:
+            return columns
+        for k, v in variant.drivers.items():
+            columns[k] = np.full(len(self.base), v)
+        for k, v in variant.scale.items():
+            columns[k] = columns[k] * v
+        for kind, types, delta, fields in [('service', self.base.service_types, variant.services, SERVICE_FIELDS),
+                                           ('equipment', self.base.equipment_types, variant.equipment, EQUIPMENT_FIELDS)]:
+            for key, values in delta.items():
+                if key not in types:
+                    raise ValueError(f"Unknown {kind} type {key} for this fleet")
+                for field, value in values.items():
+                    if field not in fields:
+                        raise ValueError(f"Variant {variant.name} cannot change {kind} field {field}")
+                    field = 'units' if field == 'num_units' else field
+                    column = columns[field].copy()
+                    column[..., types.index(key)] = value
+                    columns[field] = column
+        return columns
+
+    def _amounts(self, columns: dict[str, np.ndarray], services, equipment, salaries: bool,
+                 amounts: np.ndarray | None = None) -> np.ndarray:
+        # per period amount of the given services', equipment's and optionally the salaries' line items
+        amounts = np.zeros(len(self.names)) if amounts is None else amounts.copy()
+        services, equipment = list(services), list(equipment)
+        scaled = columns['patients'] / columns['ehr_takeup']
+        visits = scaled @ columns['service_prop'][:, services]
+        amounts[[2 * i for i in services]] = visits * columns['revenue_per_service'][services]
+        amounts[[2 * i + 1 for i in services]] = -visits * columns['cost_per_service'][services]
+        first = 2 * len(self.base.service_types)
+        if salaries:
+            amounts[first] = -(columns['nurses'] @ columns['salary']) / 12
+        units = columns['units'][:, equipment].sum(axis=0)
+        amounts[[first + 1 + 2 * j for j in equipment]] = -columns['capital_investment'][equipment] * units * CONSTANT['USDxRWF']
+        amounts[[first + 2 + 2 * j for j in equipment]] = -columns['monthly_maintenance'][equipment] * units * CONSTANT['USDxRWF']
+        return amounts
+
+    def _changed(self, variant: Variant) -> tuple[list[int], list[int], bool]:
+        # services, equipment and whether salaries are reached by the variant's changes
+        drivers = set(variant.drivers) | set(variant.scale)
+        unknown = drivers - set(DRIVERS)
+        if unknown:
+            raise ValueError(f"Variant {variant.name} changes unknown drivers {sorted(unknown)}")
+        if drivers & {'patients', 'ehr_takeup'}:
+            services = range(len(self.base.service_types))
+        else:
+            services = [self.base.service_types.index(k) for k in variant.services if k in self.base.service_types]
+        equipment = [self.base.equipment_types.index(k) for k in variant.equipment if k in self.base.equipment_types]
+        return list(services), equipment, bool(drivers & {'nurses', 'salary'})
+
+    def evaluate_variant(self, variant: Variant) -> tuple[np.ndarray, np.ndarray]:
+        """Line item amounts and the monthly matrix of one variant, sharing the base rows it leaves alone."""
+        services, equipment, salaries = self._changed(variant)
+        amounts = self._amounts(self._columns(variant), services, equipment, salaries, self.amounts)
+        rows = np.flatnonzero(amounts != self.amounts)
+        matrix = self.matrix.copy()
+        matrix[rows] = amounts[rows, None] * self.basis[self.kinds[rows]]
+        return amounts, matrix
+
+    def add(self, variant: Variant, save: bool = True):
+        self._changed(variant)
+        self._columns(variant)
+        self.variants[variant.name] = variant
+        if save:
+            self.save()
+
+    def remove(self, name: str, save: bool = True):
+        del self.variants[name]
+        if save:
+            self.save()
+
+    def _summary(self, amounts: np.ndarray, matrix: np.ndarray) -> dict[str, float]:
+        year = matrix[:, :12].sum(axis=1)
+        summary = {tag: float(year[self.tags == tag].sum()) for tag in ['revenue', 'cost_of_care', 'salary', 'equipment']}
+        summary['net_income'] = float(year.sum())
+        summary['npv'] = float(amounts @ self.weights[self.kinds])
+        summary['cash_trough'] = float(min(matrix.sum(axis=0).cumsum().min(), 0.0))
+        return summary
+
+    def evaluate(self, names: list[str] | None = None) -> pd.DataFrame:
+        """First year totals by tag, net income, NPV and the lowest cumulative cash of the base and each variant."""
+        names = list(self.variants) if names is None else names
+        rows = {'base': self._summary(self.amounts, self.matrix)}
+        for name in names:
+            rows[name] = self._summary(*self.evaluate_variant(self.variants[name]))
+        df = pd.DataFrame.from_dict(rows, orient='index')
+        df['npv_change'] = df['npv'] - df.at['base', 'npv']
+        return df.rename_axis('variant')
+
+    def cashflows(self, name: str | None = None, frequency: str = 'ME') -> pd.DataFrame:
+        # net cashflows by tag of the base (name None) or a variant, resampled from the months
+        matrix = self.matrix if name is None else self.evaluate_variant(self.variants[name])[1]
+        df = pd.DataFrame(matrix.T, index=self.months, columns=self.names).T.groupby(self.tags).sum().T
+        return df if frequency == 'ME' else df.resample(frequency).sum()
+
+    def load(self):
+        if self.path.exists():
+            with open(self.path) as f:
+                self.variants = {v['name']: Variant(**v) for v in json.load(f)['variants']}
+
+    def save(self):
+        # written to a temporary file first so a concurrent reader never sees half a file
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'base': self.key, 'variants': [v.model_dump() for v in self.variants.values()]}, f, indent=2)
+            os.replace(tmp, self.path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
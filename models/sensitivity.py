@@ -0,0 +1,60 @@
+from __future__ import annotations
+from typing import Literal
+
+import numpy as np
+import pandas as pd
+
+from models.fleet import HealthPostFleet, metrics
+from models.healthpost import HealthPost
+
+# driver name -> metrics() column it scales
+DRIVERS = {
+    'patients': 'patients',
+    'rev_per_visit': 'rev_per_visit',
+    'ehr_takeup': 'ehr_takeup',
+    'salary': 'salary',
+    'service_prop': 'service_prop',
+    'cost_per_service': 'cost_per_service',
+    'equipment_capital': 'capital_investment',
+    'equipment_maintenance': 'monthly_maintenance',
+}
+
+def perturbed_metrics(fleet: HealthPostFleet, drivers: list[str], pct: float) -> dict[str, np.ndarray]:
+    """metrics() for every driver moved down and up by pct, in one batched call.
+
+    Row 2i of the batch scales drivers[i] by (1 - pct) and row 2i + 1 by
+    (1 + pct); everything else stays at its base value.
+    """
+    columns = fleet.columns()
+    factors = np.ones((len(drivers), 2))
+    factors[:, 0], factors[:, 1] = 1 - pct, 1 + pct
+
+    batch = {}
+    for k, v in columns.items():
+        scale = np.ones(2 * len(drivers))
+        for i, driver in enumerate(drivers):
+            if DRIVERS[driver] == k:
+                scale[2 * i:2 * i + 2] = factors[i]
+        batch[k] = np.asarray(v, dtype=float)[None] * scale.reshape((-1,) + (1,) * np.ndim(v))
+    return metrics(**batch, **fleet.horizon)
+
+def tornado(model: HealthPost | HealthPostFleet, pct: float = 0.1, metric: Literal['npv', 'net_income'] = 'npv',
+            drivers: list[str] | None = None) -> pd.DataFrame:
+    """Fleet total of `metric` with each driver moved by -pct and +pct, largest swing first.
+
+    Elasticity is the central difference (high - low) / |base| / (2 * pct), so
+    its sign is the direction the metric moves even when the base is negative. The
+    NPV is bottom up on services, so rev_per_visit only moves net income.
+    """
+    fleet = HealthPostFleet.from_healthposts([model]) if isinstance(model, HealthPost) else model
+    drivers = drivers or list(DRIVERS)
+    base = fleet.totals[metric]
+
+    totals = perturbed_metrics(fleet, drivers, pct)[metric].sum(axis=-1).reshape(len(drivers), 2)
+    df = pd.DataFrame({
+        'low': totals[:, 0],
+        'high': totals[:, 1],
+    }, index=pd.Index(drivers, name='driver'))
+    df['swing'] = (df['high'] - df['low']).abs()
+    df['elasticity'] = (df['high'] - df['low']) / abs(base) / (2 * pct) if base else np.nan
+    return df.sort_values('swing', ascending=False)
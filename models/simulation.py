@@ -0,0 +1,194 @@
+from __future__ import annotations
+import datetime as dt
+from typing import Literal
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from models.cashflow import discount_factors
+from models.fleet import HealthPostFleet
+from utils.constants import CONSTANT
+
+METRICS = ['revenue', 'expenses', 'npv']
+
+class SimulationConfig(BaseModel):
+    scenarios: int = 1_000
+    days: int | None = None                          # defaults to the whole projection horizon
+    method: Literal['clt', 'daily'] = 'clt'
+
+    # daily patients and revenue per visit are truncated normals around each
+    # post's own figures, sd and bounds are given as multiples of that figure
+    patients_cv: float = 0.3
+    patients_bounds: tuple[float, float] = (0.0, 3.0)
+    rev_cv: float = 0.2
+    rev_bounds: tuple[float, float] = (0.5, 2.0)
+
+    percentiles: tuple[float, ...] = (5.0, 50.0, 95.0)
+    max_block: int = 2**24                           # floats drawn at once in 'daily' mode
+
+    @property
+    def horizon(self) -> tuple[dt.date, dt.date]:
+        start = CONSTANT['start_date']
+        if self.days is None:
+            return start, CONSTANT['end_date']
+        return start, start + dt.timedelta(days=self.days - 1)
+
+class SimulationResult():
+    """Per-post float32 summaries over the scenarios, plus the portfolio NPV of each scenario."""
+
+    def __init__(self, names: np.ndarray, stats: dict[str, np.ndarray], portfolio_npv: np.ndarray):
+        self.names = names
+        self.stats = stats
+        self.portfolio_npv = portfolio_npv
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.stats, index=pd.Index(self.names, name='name'))
+
+    @property
+    def prob_negative_portfolio_npv(self) -> float:
+        return float((self.portfolio_npv < 0).mean())
+
+def _truncnorm(mean, cv, bounds):
+    # standardised bounds, degenerate (zero mean) posts get a point mass
+    mean = np.asarray(mean, dtype=float)
+    sd = cv * mean
+    safe_sd = np.where(sd > 0, sd, 1.0)
+    alpha = np.where(sd > 0, (bounds[0] * mean - mean) / safe_sd, 0.0)
+    beta = np.where(sd > 0, (bounds[1] * mean - mean) / safe_sd, 0.0)
+    return mean, np.where(sd > 0, sd, 0.0), alpha, beta
+
+def truncnorm_moments(mean, cv, bounds) -> tuple[np.ndarray, np.ndarray]:
+    from scipy.special import ndtr     # scipy is only imported by processes that simulate
+    mean, sd, alpha, beta = _truncnorm(mean, cv, bounds)
+    pdf_a, pdf_b = np.exp(-alpha**2 / 2) / np.sqrt(2 * np.pi), np.exp(-beta**2 / 2) / np.sqrt(2 * np.pi)
+    mass = np.where(sd > 0, ndtr(beta) - ndtr(alpha), 1.0)
+    shift = (pdf_a - pdf_b) / mass
+    m = mean + sd * shift
+    v = sd**2 * (1 + (alpha * pdf_a - beta * pdf_b) / mass - shift**2)
+    return m, np.maximum(v, 0.0)
+
+def truncnorm_sample(rng: np.random.Generator, mean, cv, bounds, size: tuple) -> np.ndarray:
+    # inverse cdf sampling, `size` has the posts on the first axis
+    from scipy.special import ndtr, ndtri
+    mean, sd, alpha, beta = _truncnorm(mean, cv, bounds)
+    expand = (slice(None),) + (None,) * (len(size) - 1)
+    lo, hi = ndtr(alpha).astype(np.float32)[expand], ndtr(beta).astype(np.float32)[expand]
+    u = rng.random(size, dtype=np.float32)
+    z = ndtri(np.clip(lo + u * (hi - lo), 1e-7, 1 - 1e-7))
+    return mean.astype(np.float32)[expand] + sd.astype(np.float32)[expand] * z
+
+def _inputs(fleet: HealthPostFleet) -> dict[str, np.ndarray]:
+    rows = slice(0, fleet.size)
+    return {
+        'patients': fleet.patients[rows],
+        'rev_per_visit': fleet.rev_per_visit[rows],
+        'ehr_takeup': fleet.ehr_takeup[rows],
+        'cost_per_visit': fleet.service_prop[rows] @ fleet.cost_per_service,
+        'salaries': fleet.nurses[rows] * fleet.salary[rows],
+        'capital': fleet.units[rows] @ fleet.capital_investment,
+        'maintenance': fleet.units[rows] @ fleet.monthly_maintenance,
+    }
+
+def _fixed_costs(inputs: dict, config: SimulationConfig) -> tuple[np.ndarray, np.ndarray]:
+    # salaries, maintenance and capital do not vary by scenario, they are
+    # booked on month ends like HealthPost.generate_cashflows
+    start, end = config.horizon
+    monthly = discount_factors(start, end, 'ME', start)
+    per_month = inputs['salaries'] / 12 + inputs['maintenance'] * CONSTANT['USDxRWF']
+    capital = inputs['capital'] * CONSTANT['USDxRWF'] if len(monthly) else 0.0
+    total = per_month * len(monthly) + capital
+    npv = per_month * monthly.sum() + capital * (monthly[0] if len(monthly) else 0.0)
+    return total, npv
+
+def _draw_clt(inputs: dict, config: SimulationConfig, weights: np.ndarray, rng: np.random.Generator) -> dict:
+    """Draw the horizon sums directly from their normal limit.
+
+    Per post and day, A = patients * revenue / takeup and B = patients / takeup
+    are iid across days. The plain and discounted sums of A and B over the
+    horizon are jointly normal with covariance kron(T, C), where C is the
+    day covariance of (A, B) and T that of (sum 1, sum w) over the days. Over
+    hundreds of days the normal limit is indistinguishable from the daily draw.
+    """
+    takeup = inputs['ehr_takeup']
+    mp, vp = truncnorm_moments(inputs['patients'], config.patients_cv, config.patients_bounds)
+    mr, vr = truncnorm_moments(inputs['rev_per_visit'], config.rev_cv, config.rev_bounds)
+
+    mean_a, mean_b = mp * mr / takeup, mp / takeup
+    var_a = ((vp + mp**2) * (vr + mr**2) - mp**2 * mr**2) / takeup**2
+    var_b = vp / takeup**2
+    cov_ab = vp * mr / takeup**2
+
+    # 2x2 Cholesky factors of the day and time covariances
+    l11 = np.sqrt(var_a)
+    l21 = np.divide(cov_ab, l11, out=np.zeros_like(l11), where=l11 > 0)
+    l22 = np.sqrt(np.maximum(var_b - l21**2, 0.0))
+    days, w1, w2 = len(weights), weights.sum(), (weights**2).sum()
+    t11 = np.sqrt(days)
+    t21 = w1 / t11
+    t22 = np.sqrt(max(w2 - t21**2, 0.0))
+
+    z = rng.standard_normal((len(takeup), config.scenarios, 4), dtype=np.float32)
+    # kron(L_T, L_C) applied to z, ordered (sum A, sum B, disc A, disc B)
+    za = l11[:, None] * z[..., 0], l21[:, None] * z[..., 0] + l22[:, None] * z[..., 1]
+    zb = l11[:, None] * z[..., 2], l21[:, None] * z[..., 2] + l22[:, None] * z[..., 3]
+    return {
+        'sum_a': days * mean_a[:, None] + t11 * za[0],
+        'sum_b': days * mean_b[:, None] + t11 * za[1],
+        'disc_a': w1 * mean_a[:, None] + t21 * za[0] + t22 * zb[0],
+        'disc_b': w1 * mean_b[:, None] + t21 * za[1] + t22 * zb[1],
+    }
+
+def _draw_daily(inputs: dict, config: SimulationConfig, weights: np.ndarray, rng: np.random.Generator) -> dict:
+    # exact daily draws, in blocks of posts so no more than max_block floats are live
+    n, days = len(inputs['patients']), len(weights)
+    out = {k: np.empty((n, config.scenarios), dtype=np.float32) for k in ['sum_a', 'sum_b', 'disc_a', 'disc_b']}
+    block = max(1, config.max_block // (config.scenarios * days))
+    w = weights.astype(np.float32)
+    for i in range(0, n, block):
+        rows = slice(i, i + block)
+        size = (len(inputs['patients'][rows]), config.scenarios, days)
+        patients = truncnorm_sample(rng, inputs['patients'][rows], config.patients_cv, config.patients_bounds, size)
+        revenue = truncnorm_sample(rng, inputs['rev_per_visit'][rows], config.rev_cv, config.rev_bounds, size)
+        b = patients / inputs['ehr_takeup'][rows, None, None].astype(np.float32)
+        a = b * revenue
+        out['sum_a'][rows], out['sum_b'][rows] = a.sum(axis=-1), b.sum(axis=-1)
+        out['disc_a'][rows], out['disc_b'][rows] = a @ w, b @ w
+    return out
+
+def simulate(fleet: HealthPostFleet, config: SimulationConfig | None = None,
+             rng: np.random.Generator | int | None = None) -> SimulationResult:
+    """Monte Carlo of revenue, expenses and NPV for every post of a fleet.
+
+    Revenue is top down (patients * revenue per visit / EHR takeup), the cost
+    of care follows the same patients at the fleet's cost per visit, and
+    salaries, maintenance and capital are fixed. 'clt' draws horizon sums in one
+    batched call (10k posts x 1k scenarios in a couple of seconds), 'daily'
+    draws every day and is meant for small fleets and checking 'clt'.
+    """
+    config = config or SimulationConfig()
+    rng = np.random.default_rng(rng)
+    inputs = _inputs(fleet)
+
+    start, end = config.horizon
+    weights = discount_factors(start, end, 'D', start)
+    draw = _draw_clt if config.method == 'clt' else _draw_daily
+    sums = draw(inputs, config, weights, rng)
+
+    fixed_total, fixed_npv = _fixed_costs(inputs, config)
+    cost = inputs['cost_per_visit'][:, None].astype(np.float32)
+    samples = {
+        'revenue': sums['sum_a'],
+        'expenses': cost * sums['sum_b'] + fixed_total[:, None].astype(np.float32),
+        'npv': sums['disc_a'] - cost * sums['disc_b'] - fixed_npv[:, None].astype(np.float32),
+    }
+
+    stats = {}
+    for metric in METRICS:
+        stats[f'{metric}_mean'] = samples[metric].mean(axis=1, dtype=np.float64).astype(np.float32)
+        for p, values in zip(config.percentiles, np.percentile(samples[metric], config.percentiles, axis=1)):
+            stats[f'{metric}_p{p:g}'] = values.astype(np.float32)
+    stats['prob_negative_npv'] = (samples['npv'] < 0).mean(axis=1, dtype=np.float64).astype(np.float32)
+
+    return SimulationResult(names=np.asarray(fleet.posts, dtype=object), stats=stats,
+                            portfolio_npv=samples['npv'].sum(axis=0, dtype=np.float64))
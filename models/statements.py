@@ -0,0 +1,80 @@
+from __future__ import annotations
+import typing
+
+import numpy as np
+import pandas as pd
+
+from models.calendar import FREQUENCY_ALIASES
+from models.cashflow import CashFlow, CashFlowAggregator, CashFlowMatrix
+from models.compact import CompactCashFlows
+from utils.profiling import profiled
+
+TAGS = list(typing.get_args(CashFlow.model_fields['tag'].annotation))
+COST_TAGS = [tag for tag in TAGS if tag != 'revenue']
+FREQUENCIES = ['ME', 'QE', 'YE']
+
+class Statements():
+    """Income statement, cost breakdown by tag and cash position of a set of cashflows.
+
+    Flows are binned to months straight from their compact segments, tag
+    totals are summed from those months, and quarters and years are rolled up
+    from the months, so the daily matrix is never built.
+    Every frame is built on first use and kept, so hold on to the object
+    (HealthPostGraph does) rather than rebuilding it per rerun.
+    """
+
+    @profiled('statements.build')
+    def __init__(self, cashflows: CashFlowAggregator | CompactCashFlows | CashFlowMatrix):
+        flows = cashflows.compact if isinstance(cashflows, CashFlowAggregator) else cashflows
+        self.names = flows.names
+        self.tags = flows.tags
+        self.tag_names = [tag for tag in TAGS if tag in set(flows.tags)]
+
+        onehot = (np.asarray(self.tag_names, dtype=object)[:, None] == flows.tags[None, :]).astype(float)
+        labels, months = flows.resample('ME')
+        self._monthly = pd.DataFrame(np.vstack([months, onehot @ months]).T, index=labels,
+                                     columns=list(self.names) + self.tag_names)
+        self._frames: dict[tuple, pd.DataFrame] = {}
+
+    def _rollup(self, frequency: str) -> pd.DataFrame:
+        frequency = FREQUENCY_ALIASES.get(frequency, frequency)
+        if frequency not in FREQUENCIES:
+            raise ValueError(f"statements are monthly, quarterly or yearly, not {frequency}")
+        if ('rollup', frequency) not in self._frames:
+            df = self._monthly if frequency == 'ME' else self._monthly.resample(frequency).sum()
+            self._frames[('rollup', frequency)] = df
+        return self._frames[('rollup', frequency)]
+
+    def line_items(self, frequency: str = 'QE', tag: str | None = None) -> pd.DataFrame:
+        # one column per cashflow, largest total first, optionally only the flows of one tag
+        key = ('line_items', frequency, tag)
+        if key not in self._frames:
+            names = [n for n, t in zip(self.names, self.tags) if tag is None or t == tag]
+            df = self._rollup(frequency)[names]
+            self._frames[key] = df[df.sum().abs().sort_values(ascending=False).index]
+        return self._frames[key]
+
+    def by_tag(self, frequency: str = 'QE') -> pd.DataFrame:
+        # signed totals per tag, costs are negative as in the cashflows
+        return self._rollup(frequency)[self.tag_names]
+
+    def income_statement(self, frequency: str = 'QE') -> pd.DataFrame:
+        """Revenue, each cost tag and their total as positive costs, net income and cumulative cash."""
+        key = ('income_statement', frequency)
+        if key not in self._frames:
+            tags = self.by_tag(frequency)
+            df = pd.DataFrame(index=tags.index)
+            df['revenue'] = tags['revenue'] if 'revenue' in tags else 0.0
+            for tag in COST_TAGS:
+                df[tag] = -tags[tag] if tag in tags else 0.0
+            df['total_cost'] = df[COST_TAGS].sum(axis=1)
+            df['net_income'] = df['revenue'] - df['total_cost']
+            df['cash_position'] = df['net_income'].cumsum()
+            self._frames[key] = df
+        return self._frames[key]
+
+    def cost_breakdown(self, frequency: str = 'QE') -> pd.DataFrame:
+        return self.income_statement(frequency)[COST_TAGS]
+
+    def cash_position(self, frequency: str = 'QE') -> pd.Series:
+        return self.income_statement(frequency)['cash_position']
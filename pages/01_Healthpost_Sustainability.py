@@ -2,17 +2,28 @@ import streamlit as st
 import pandas as pd
 
 from utils.constants import CONSTANT
-from models.healthpost import HealthPost, Equipment, Service, HealthCareWorker
-from charts.breakdown import chart_cost_breakdown
-
-def calculate_income_statement_model() -> HealthPost:
+from models.bulk import build_equipment, build_nurses, build_services
+from models.fleet import HealthPostFleet
+from models.healthpost import HealthPost
+from models.graph import HealthPostGraph
+from models.receivables import DEFAULT_TERMS, PaymentTerms, Receivables
+from models.scenarios import ScenarioStore, Variant
+from models.statements import FREQUENCIES
+from charts.views import LADDER, cost_breakdown_png, num_pages, page
+from utils.loader import DATA
+from utils import profiling
+
+profile = profiling.begin('Healthpost Sustainability')
+
+def calculate_income_statement_model(services: pd.DataFrame, equipment: pd.DataFrame) -> HealthPost:
     hp = HealthPost(
         name = "",
         patients = st.session_state.patients, 
         rev_per_visit = st.session_state.rev_per_visit,
-        nurses = [HealthCareWorker(salary=st.session_state.salary) for _ in range(st.session_state.num_nurses)],
-        equipment = [Equipment(equipment_type=k,**v) for k, v in st.session_state.equipment.iterrows()],
-        services = [Service(service_type=k, **v) for k, v in st.session_state.services.iterrows()],
+        nurses = build_nurses(st.session_state.num_nurses, st.session_state.salary),
+        # the tables are edited by hand, so every row is validated
+        equipment = build_equipment(equipment, validate=True),
+        services = build_services(services, validate=True),
         ehr_takeup = st.session_state.takeup
     )
 
@@ -44,7 +55,7 @@ average_salary = float(col2.number_input("Average Annual Salary per Nurse: RWF",
 patients_per_nurse = col3.empty()
 
 st.subheader("Cost of Care")
-df = st.session_state['services']
+df = DATA.frame('services').copy()
 df['cases'] = df['service_prop'] * st.session_state.patients
 
 # TODO update case column on service proportion change
@@ -58,47 +69,100 @@ st.session_state['service'] = st.data_editor(df,
                key='service_change', use_container_width = True, on_change=update_cases)
 
 st.subheader("Equipment Costs")
-equipment_df = st.session_state.equipment
-equipment_df['num_units'] = 1
+# the loaded tables are the base of every variant, edits only reach the copies in session_state
+equipment_df = DATA.frame('equipment').assign(num_units=1.0)
 st.session_state['equipment'] = st.data_editor(equipment_df, 
                num_rows = "dynamic",
                key='equipment_change', use_container_width=True)
 
-#calculate the Income Statement
-hp = calculate_income_statement_model()
+#calculate the Income Statement, only the figures whose inputs changed are recomputed
+with profiling.span('healthpost.validate'):
+    hp = calculate_income_statement_model(st.session_state.service, st.session_state.equipment)
+if 'hp_graph' not in st.session_state:
+    st.session_state['hp_graph'] = HealthPostGraph(hp)
+graph = st.session_state['hp_graph']
+graph.reset_trace()
+changed = graph.update_from(hp)
 
 with income_statement:
     col1, col2, col3, col4 = st.columns(4)
 
-    col1.metric(f"1st Year Revenue: RWF", value=f"{hp.revenue:,.0f}")
-    col2.metric(f"1st Year Cost: RWF", f"{hp.total_cost:,.0f}")
-    col3.metric(f"1st Year Net Income: RWF", f"{hp.net_income:,.0f}")
-    col4.metric(f"NPV @ {CONSTANT['discount_rate'] * 100:,.1f}%", f"{hp.npv:,.0f}")
+    col1.metric(f"1st Year Revenue: RWF", value=f"{graph.revenue:,.0f}")
+    col2.metric(f"1st Year Cost: RWF", f"{graph.total_cost:,.0f}")
+    col3.metric(f"1st Year Net Income: RWF", f"{graph.net_income:,.0f}")
+    col4.metric(f"NPV @ {CONSTANT['discount_rate'] * 100:,.1f}%", f"{graph.npv:,.0f}")
 
 with charts:
     with st.expander("Click down to see detailed breakdown"):
-        revenue, cost_breakdown, cashflow_chart, cashflows = st.tabs(['Revenue Drivers', 'Cost Breakdown', 'Cashflow Chart', 'Cashflows'])
-        cost_breakdown.pyplot(hp.chart_cost_breakdown())
-        cfs = hp.generate_cashflows()
-        cashflows.dataframe(cfs.df)
-        cashflow_chart.bar_chart(cfs.aggregate_frequency('QE'), y='total')
-
-        # TODO - move this to a better place
-        df_rev = cfs.aggregate_frequency('QE')
-        df_rev = df_rev[[c for c in df_rev.columns if c.endswith('rev')]]
-        column_totals = df_rev.sum()
-        sorted_columns = column_totals.sort_values(ascending=False).index
-        df_rev = df_rev[sorted_columns]
-        revenue.area_chart(df_rev)
-        
+        revenue, cost_breakdown, cashflow_chart, statement, cashflows, receivables = st.tabs(['Revenue Drivers', 'Cost Breakdown', 'Cashflow Chart', 'Income Statement', 'Cashflows', 'Payment Delays'])
+        statements = graph.statements
+        # only the cost figures key the image, so it is redrawn when they change
+        cost_breakdown.image(cost_breakdown_png(graph))
+        cashflow_chart.bar_chart(statements.income_statement('QE'), y='net_income')
+        revenue.area_chart(graph.views.table('QE', tag='revenue', top=10))
+
+        # the browser gets one page of the top line items at the chosen granularity, not the daily matrix
+        col1, col2, col3 = cashflows.columns(3)
+        granularity = col1.selectbox('Granularity', options=LADDER, index=2, key='cashflow_granularity')
+        top = int(col2.number_input('Top line items', min_value=1, value=10, step=1, key='cashflow_top'))
+        table = graph.views.table(granularity, top=top)
+        number = int(col3.number_input(f'Page of {num_pages(table)}', min_value=1, max_value=num_pages(table), value=1, key='cashflow_page'))
+        cashflows.dataframe(page(table, number - 1), use_container_width=True)
+
+        # each payer's share of revenue is paid evenly between its min and max days after the visit
+        terms = receivables.data_editor(pd.DataFrame([{'payer': t.payer, 'share': t.share, 'min_days': t.days[0],
+                                                       'max_days': t.days[1]} for t in DEFAULT_TERMS]),
+                                        num_rows='dynamic', key='payment_terms', use_container_width=True)
+        try:
+            delays = Receivables(graph.cashflows, [PaymentTerms.spread(r.payer, r.share, int(r.min_days), int(r.max_days))
+                                                   for r in terms.itertuples()])
+        except ValueError as e:
+            receivables.error(str(e))
+        else:
+            summary = delays.summary().iloc[0]
+            col1, col2, col3, col4 = receivables.columns(4)
+            col1.metric("NPV with payment delays", f"{summary.delayed_npv:,.0f}", f"{-summary.npv_cost_of_delay:,.0f}")
+            col2.metric("Cash trough", f"{summary.cash_trough:,.0f}")
+            col3.metric("Peak receivables", f"{summary.peak_receivables:,.0f}")
+            col4.metric("Uncollected at end", f"{summary.closing_receivables:,.0f}")
+            receivables.line_chart(delays.frame(frequency='W')[['receivables', 'cash_position', 'accrual_position']])
+
+        period = statement.radio('Period', options=FREQUENCIES, index=2, horizontal=True, key='statement_period',
+                                 format_func={'ME': 'Month', 'QE': 'Quarter', 'YE': 'Year'}.get)
+        statement.dataframe(statements.income_statement(period), use_container_width=True)
+
 cost_per_patient.metric(label="Cost per patient", 
-              value=f"RWF {hp.cost_per_patient:,.1f}")
+              value=f"RWF {graph.cost_per_patient:,.1f}")
 
 patients_per_nurse.metric(label="Patients per nurse per day",
-                          value=f"{hp.patients_per_nurse:,.1f}")
+                          value=f"{graph.patients_per_nurse:,.1f}")
 
 implied_revenue.metric(label="Implied Revenue per Patient",
-                          value=f"{hp.implied_revenue_rate:,.1f}")
+                          value=f"{graph.implied_revenue_rate:,.1f}")
+
+with st.expander("Recomputed this run"):
+    st.write({'changed inputs': changed, 'recomputed': graph.trace})
+
+st.header("What-if Variants")
+# variants are saved against the tables as loaded and evaluated with the drivers as set above
+with profiling.span('scenarios.evaluate'):
+    base = calculate_income_statement_model(df, equipment_df)
+    store = ScenarioStore(HealthPostFleet.from_healthposts([base]))
+    col1, col2 = st.columns([3, 1])
+    variant_name = col1.text_input("Variant name", value=f"variant_{len(store.variants) + 1}")
+    if col2.button("Save edits as variant"):
+        try:
+            store.add(Variant.from_tables(variant_name, df, equipment_df, st.session_state.service, st.session_state.equipment))
+        except ValueError as e:
+            st.error(str(e))
+    if store.variants:
+        col1, col2 = st.columns([3, 1])
+        removed = col1.selectbox("Variant", options=list(store.variants))
+        if col2.button("Remove variant"):
+            store.remove(removed)
+        st.dataframe(store.evaluate(), use_container_width=True)
 
 st.markdown("### Note:")
-st.markdown("The above calculations are based on the assumptions made and may not reflect actual financial performance of a rural health post.")
\ No newline at end of file
+st.markdown("The above calculations are based on the assumptions made and may not reflect actual financial performance of a rural health post.")
+
+profiling.end(profile)
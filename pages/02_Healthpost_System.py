@@ -1,24 +1,38 @@
 from utils.constants import CONSTANT
 import streamlit as st
-from models.healthpost import HealthPost, HealthPostAggregator, HealthCareWorker
+import pandas as pd
+from models.fleet import HealthPostFleet
+from models.statements import Statements, FREQUENCIES, TAGS
+from charts.views import LADDER, CashflowView, cost_breakdown_png, num_pages, page
+from utils.cache import RESULTS, input_hash
+from utils.loader import DATA
+from utils import profiling
 
-st.header('RHOS Healthpost Profitability')
+profile = profiling.begin('Healthpost System')
 
-df_healthposts = st.session_state.healthposts
+def compute_portfolio(df_healthposts: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    fleet = HealthPostFleet.from_frame(df_healthposts)
+    cfs = fleet.generate_cashflows()
+    statements = Statements(cfs)
+    # line items are kept monthly with their tags as codes into TAGS, the daily matrix never leaves this function
+    monthly = cfs.aggregate_frequency('ME').drop(columns='total')
+    return {
+        'metrics': fleet.metrics(),
+        'line_items': monthly,
+        'line_item_tags': pd.DataFrame([[TAGS.index(t) for t in cfs.compact.tags]], columns=monthly.columns),
+        **{f'income_statement_{f}': statements.income_statement(f) for f in FREQUENCIES},
+    }
 
-healthpost_list = []
-for k, v in df_healthposts.iterrows():
-    nurses = [HealthCareWorker(name=f"{k}_{i}") for i in range(int(v.nurses))]
-    hp = HealthPost(
-        name=k,
-        patients=int(v['patients']) + 1,
-        rev_per_visit=v['rev_per_visit'],
-        nurses=nurses)
+st.header('RHOS Healthpost Profitability')
 
-    healthpost_list.append(hp)
+df_healthposts = DATA.frame('healthposts')
+df_healthposts = df_healthposts.assign(patients=df_healthposts['patients'].astype(int) + 1)
 
-hp_agg = HealthPostAggregator(name="RHOS", healthposts=healthpost_list)
-hp     = hp_agg.hp
+# unchanged inputs are served from the on-disk cache, shared by every session
+key = input_hash('healthpost_system', df_healthposts, CONSTANT)
+portfolio = RESULTS.frames(key, lambda: compute_portfolio(df_healthposts))
+totals = portfolio['metrics'].sum()
+view = CashflowView.from_frame(portfolio['line_items'], [TAGS[int(i)] for i in portfolio['line_item_tags'].iloc[0]])
 
 st.header("Income Statement")
 income_statement = st.empty()
@@ -27,17 +41,29 @@ charts = st.empty()
 with income_statement:
     col1, col2, col3, col4 = st.columns(4)
 
-    col1.metric(f"1st Year Revenue: RWF", value=f"{hp.revenue:,.0f}")
-    col2.metric(f"1st Year Cost: RWF", f"{hp.total_cost:,.0f}")
-    col3.metric(f"1st Year Net Income: RWF", f"{hp.net_income:,.0f}")
-    col4.metric(f"NPV @ {CONSTANT['discount_rate'] * 100:,.1f}%", f"{hp.npv:,.0f}")
+    col1.metric(f"1st Year Revenue: RWF", value=f"{totals.revenue:,.0f}")
+    col2.metric(f"1st Year Cost: RWF", f"{totals.total_cost:,.0f}")
+    col3.metric(f"1st Year Net Income: RWF", f"{totals.net_income:,.0f}")
+    col4.metric(f"NPV @ {CONSTANT['discount_rate'] * 100:,.1f}%", f"{totals.npv:,.0f}")
 
 with charts:
-    cost_breakdown, cashflow_chart, cashflows = st.tabs(['Cost Breakdown', 'Cashflow Chart', 'Cashflows'])
-    cost_breakdown.pyplot(hp.chart_cost_breakdown())
-    cfs = hp.generate_cashflows()
-    cashflows.dataframe(cfs.df)
-    cashflow_chart.bar_chart(cfs.aggregate_frequency('QE'), y='total')
+    cost_breakdown, healthposts, cashflow_chart, statement, cashflows = st.tabs(['Cost Breakdown', 'Healthposts', 'Cashflow Chart', 'Income Statement', 'Cashflows'])
+    cost_breakdown.image(cost_breakdown_png(totals))
+
+    col1, col2 = healthposts.columns(2)
+    sort_by = col1.selectbox('Sort by', options=list(portfolio['metrics'].columns), index=list(portfolio['metrics'].columns).index('npv'))
+    posts = portfolio['metrics'].sort_values(sort_by, ascending=False)
+    number = int(col2.number_input(f'Page of {num_pages(posts)}', min_value=1, max_value=num_pages(posts), value=1, key='system_posts_page'))
+    healthposts.dataframe(page(posts, number - 1), use_container_width=True)
 
+    col1, col2 = cashflows.columns(2)
+    granularity = col1.selectbox('Granularity', options=LADDER[2:], key='system_cashflow_granularity')
+    top = int(col2.number_input('Top line items', min_value=1, value=10, step=1, key='system_cashflow_top'))
+    cashflows.dataframe(view.table(granularity, top=top), use_container_width=True)
+    cashflow_chart.bar_chart(portfolio['income_statement_QE'], y='net_income')
 
+    period = statement.radio('Period', options=FREQUENCIES, index=2, horizontal=True, key='system_statement_period',
+                             format_func={'ME': 'Month', 'QE': 'Quarter', 'YE': 'Year'}.get)
+    statement.dataframe(portfolio[f'income_statement_{period}'], use_container_width=True)
 
+profiling.end(profile)
@@ -1,86 +1,90 @@
-from typing import List
 import streamlit as st
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
 
-from scipy.stats import truncnorm
+from models.fleet import HealthPostFleet
+from models.healthpost import SALARY
+from models.simulation import SimulationConfig, SimulationResult
+from utils.jobs import submit_simulation
+from utils.loader import DATA
+from utils import profiling
 
+profile = profiling.begin('Simulate Healthposts')
 
-class HealthPost():
-    def __init__(self, name:str, patients:int, ave_rev: float) -> None:
-        self.name = name
-        self.patients = patients
-        self.ave_rev = ave_rev
-        self.simulated_revenue = []
-        self.simulated_expenses = []
 
-        self.data = pd.DataFrame(columns = ["patients", "ave_revenue", "hcw", "ave_salary"])
+def plot_health_post_revenue(result: SimulationResult) -> None:
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
+    sns.histplot(data=result.stats['revenue_mean'], 
+                 bins=50, stat="density", kde=True, ax=ax1)
+    ax1.set_title("Histogram of Mean Revenue per Healthpost")
 
-    def revenue(self) -> float:
-        if self.simulated_revenue == []:
-            self.simulate_revenue()
-        return sum(self.simulated_revenue)
-    
-    def expenses(self) -> float:
-        if self.simulated_expenses == []:
-            self.simulate_expenses()
-        return sum(self.simulated_expenses)
+    sns.histplot(data=result.portfolio_npv, 
+                 bins=50, stat="density", kde=True, ax=ax2)
+    ax2.axvline(0, color='red')
+    ax2.set_title("Histogram of Portfolio NPV across Scenarios")
 
-    def simulate_revenue(self, days: int = 365) -> None:
-        revenue = []
-        for _ in range(days):
-            # Simulate number of patients per day using a truncated normal distribution
-            low, high, floc, scale = (50, 200, self.patients, 100)
-            patients_per_day = truncnorm.rvs(a=low / scale, b=high / scale, loc=floc).astype(int)
-
-            # Simulate average revenue per patient using a truncated normal distribution
-            low, high, floc, scale = (20, 50, self.ave_rev, 10)
-            average_revenue_per_patient = truncnorm.rvs(a=low / scale, b=high / scale, loc=floc).astype(float)
-
-            # Calculate total revenue for this day
-            revenue.append(patients_per_day * average_revenue_per_patient)
-
-        self.simulated_revenue = revenue
-
-    def simulate_expenses(self, days: int = 365) -> None:
-        revenue = []
-        for _ in range(days):
-            # Simulate number of patients per day using a truncated normal distribution
-            low, high, floc, scale = (50, 200, self.patients, 100)
-            patients_per_day = truncnorm.rvs(a=low / scale, b=high / scale, loc=floc).astype(int)
-
-            # Simulate average revenue per patient using a truncated normal distribution
-            low, high, floc, scale = (20, 50, self.ave_rev, 10)
-            average_revenue_per_patient = truncnorm.rvs(a=low / scale, b=high / scale, loc=floc).astype(float)
-
-            # Calculate total revenue for this day
-            revenue.append(patients_per_day * average_revenue_per_patient)
-
-        self.simulated_revenue = revenue
-
-def plot_health_post_revenue(healthposts: List[HealthPost]) -> None:
-    fig, ax = plt.subplots(figsize=(10, 6))
-    sns.histplot(data=[healthpost.revenue() for healthpost in healthposts], 
-                 bins=50, stat="density", kde=True, 
-                 palette='viridis')
-    ax.set_title("Histogram of Revenue")
-    ax.legend()
-
-    return fig, ax
+    return fig, (ax1, ax2)
 
 st.title('Simulating Health Post Profitability')
-num_healthposts = st.session_state['num_healthposts'] 
-ave_patients    = st.session_state['ave_patients'] 
-rev_patient     = st.session_state['rev_patient']
-
-healthposts = [HealthPost(f"Healthpost {i}", ave_patients, rev_patient) for i in range(num_healthposts)]
+# set on the landing page, opened directly the page falls back to the healthposts table
+df_healthposts  = DATA.frame('healthposts')
+num_healthposts = st.session_state.get('num_healthposts', len(df_healthposts))
+ave_patients    = st.session_state.get('ave_patients', df_healthposts['patients'].mean())
+rev_patient     = st.session_state.get('rev_patient', (df_healthposts['rev_per_visit'] * df_healthposts['patients']).sum() / df_healthposts['patients'].sum())
+
+col1, col2, col3, col4, col5 = st.columns(5)
+nurses    = col1.number_input('Nurses per Healthpost', min_value=0, value=1, step=1)
+scenarios = col2.number_input('Scenarios', min_value=10, value=1_000, step=100)
+method    = col3.selectbox('Method', options=['clt', 'daily'], help="'daily' draws every day and is slow for large fleets")
+seed      = col4.number_input('Seed', value=42, step=1)
+workers   = col5.number_input('Worker processes', min_value=1, value=1, step=1)
+
+healthposts = pd.DataFrame({
+    'patients': float(ave_patients),
+    'rev_per_visit': float(rev_patient),
+    'nurses': float(nurses),
+    'salary': SALARY,
+}, index=pd.Index([f"Healthpost {i}" for i in range(num_healthposts)], name='name'))
+fleet = HealthPostFleet.from_frame(healthposts, services=DATA.frame('services'))
+
+# runs in the background, a rerun with the same inputs attaches to the running job
+job = submit_simulation(fleet, SimulationConfig(scenarios=scenarios, method=method), seed=seed,
+                        chunk_size=max(1, num_healthposts // 20), workers=workers)
+previous = st.session_state.get('simulation_job')
+if previous is not None and previous.key != job.key:
+    previous.cancel()
+st.session_state['simulation_job'] = job
+
+if not job.done:
+    progress = st.progress(0.0, text="Simulating")
+    col1, col2 = st.columns(2)
+    histogram, convergence = col1.empty(), col2.empty()
+    for snapshot in job.iter_progress():
+        progress.progress(snapshot['posts_done'] / snapshot['posts'], text=f"Simulated {snapshot['posts_done']} of {snapshot['posts']} healthposts")
+        edges = snapshot['histogram_edges']
+        histogram.bar_chart(pd.Series(snapshot['histogram_counts'], index=[(a + b) / 2 for a, b in zip(edges, edges[1:])], name='posts'))
+        convergence.line_chart(pd.Series([s['mean_post_npv'] for s in job.history], name='mean healthpost NPV'))
+    progress.empty()
+    histogram.empty()
+    convergence.empty()
+
+job.wait()
+if job.status == 'failed':
+    st.exception(job.error)
+    st.stop()
+if job.status == 'cancelled':
+    st.rerun()
+result = job.result
+
+col1, col2 = st.columns(2)
+col1.metric('Mean Portfolio NPV', f"{result.portfolio_npv.mean():,.0f}")
+col2.metric('Probability of Negative Portfolio NPV', f"{result.prob_negative_portfolio_npv:.1%}")
 
 # Plot the revenue histogram
-fig, ax = plot_health_post_revenue(healthposts)
+fig, ax = plot_health_post_revenue(result)
 
 st.pyplot(fig)
+st.dataframe(result.to_frame(), use_container_width=True)
 
-
-
-
+profiling.end(profile)
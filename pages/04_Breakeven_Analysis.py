@@ -1,62 +1,28 @@
+import math
 import streamlit as st
 
-from models.healthpost import HealthPost, HealthCareWorker, Service
+from models.breakeven import breakeven
+from models.fleet import HealthPostFleet
+from models.optimizer import allocate
+from models.sensitivity import tornado
+from utils.loader import DATA
+from models.bulk import build_nurses, build_services
+from models.healthpost import HealthPost
+from utils import profiling
+
+profile = profiling.begin('Breakeven Analysis')
 
 def calculate_npv() -> HealthPost:
 
     health_post = HealthPost(
         patients=st.session_state['be_patients'],
         rev_per_visit=st.session_state['be_revenue'],
-        nurses=[HealthCareWorker(salary=st.session_state['be_salary'])] * int(st.session_state['be_nurses']),
+        nurses=build_nurses(int(st.session_state['be_nurses']), st.session_state['be_salary']),
         equipment=[],
-        services=services
+        services=build_services(DATA.frame('services'))
     )
     st.session_state['be_healthpost'] = health_post
 
-def update_nurses(num_nurses, salary: None) -> list[HealthCareWorker]:
-    if salary is None:
-        salary = st.session_state['be_salary']
-    return [HealthCareWorker(salary)] * num_nurses
-
-
-def find_breakeven(hp: HealthPost, metric, start, end, step, target = 0) -> float:
-    value = start
-    while True:
-        setattr(hp, metric, value)
-        if (hp.npv < target) and (value < end):
-            value += step
-        else:
-            break
-    
-    return value
-
-def find_breakeven_nurses(hp: HealthPost, change_nurses: bool, change_salary: bool, start, end, step, target = 0) -> float:
-    if change_nurses and change_salary:
-        raise Exception('please dont change two things at the same time in a breakeven')
-    
-    if change_salary:
-        nurses = st.session_state['be_nurses']
-
-    if change_nurses:
-        salary = st.session_state['be_salary']
-
-    value = start
-    while True:
-        if change_salary: 
-            salary = value
-        if change_nurses:
-            nurses = value
-
-        hp.nurses = [HealthCareWorker(salary=salary)] * nurses
-
-        if (hp.npv < target) and (value > end):
-            value += step
-
-        else:
-            break
-    
-    return value
-
 # Streamlit UI
 st.title("HealthPost Breakeven Point Analysis")
 
@@ -80,25 +46,64 @@ col1, col2 = st.columns([3, 1])
 salary = col1.slider("Average Salary of Nurses", min_value=0, max_value=10_000_000, value=6_000_000, step=100_000, key='be_salary', on_change=calculate_npv)
 salary_breakeven = col2.empty()
 
-services = [Service(service_type=k, **v) for k, v in st.session_state.services.iterrows()]
-
 if 'be_healthpost' not in st.session_state:
     calculate_npv()
 
 hp = st.session_state['be_healthpost']
-npv.metric('NPV with current assumptions', hp.npv)
+npv.metric('NPV with current assumptions', f"{hp.npv_fast:,.0f}")
 
 if calculate.button('Calculate Breakeven', key='calculate'):
 
-    breakeven_patients = find_breakeven(hp, 'patients', start=0, end=500, step=10)
-    patients_breakeven.metric("Breakeven Number of Patients", breakeven_patients)
-
-    # TODO this wont work because the NPV calc is bottom up on services 
-    # breakeven_revenue = find_breakeven(hp, 'average', 0, 500, 10)
-    # revenue_breakeven.metric("Breakeven Revenue per Patient", breakeven_revenue)
-
-    breakeven_nurses = find_breakeven_nurses(hp, change_nurses=True, change_salary=False, start=10, end=0, step=-1, target=0)
-    nurses_breakeven.metric(f"Breakeven Number of Nurses", breakeven_nurses)
-
-    breakeven_salary = find_breakeven_nurses(hp, change_nurses=False, change_salary=True, start=10_000_000, end=0, step=-100_000, target=0)
-    salary_breakeven.metric(f"Breakeven Salary for Nurses", breakeven_salary)
+    breakeven_patients = breakeven(hp, 'patients')
+    patients_breakeven.metric("Breakeven Number of Patients", f"{breakeven_patients:,.1f}")
+
+    # the NPV is bottom up on services, so this scales the revenue of every service
+    breakeven_revenue = breakeven(hp, 'rev_per_visit')
+    revenue_breakeven.metric("Breakeven Revenue per Patient", f"{breakeven_revenue:,.0f}")
+
+    # the most nurses the post can carry without a negative NPV
+    breakeven_nurses = breakeven(hp, 'nurses')
+    nurses_breakeven.metric(f"Breakeven Number of Nurses", 
+                            math.floor(breakeven_nurses) if math.isfinite(breakeven_nurses) else "n/a")
+
+    breakeven_salary = breakeven(hp, 'salary')
+    salary_breakeven.metric(f"Breakeven Salary for Nurses", 
+                            f"{breakeven_salary:,.0f}" if math.isfinite(breakeven_salary) else "n/a")
+
+st.header("Sensitivity")
+pct = st.slider("Move each driver by ±%", min_value=1, max_value=50, value=10, key='be_pct') / 100
+table = tornado(hp, pct=pct)
+base = hp.npv_fast
+st.bar_chart((table[['low', 'high']] - base).rename(columns={'low': f'-{pct:.0%}', 'high': f'+{pct:.0%}'}))
+st.dataframe(table, use_container_width=True)
+
+st.header("Fleet Allocation")
+# every post in healthposts.csv with one of each equipment item, as on the sustainability page
+fleet = HealthPostFleet.from_frame(DATA.frame('healthposts'), DATA.frame('services'), DATA.frame('equipment').assign(num_units=1.0))
+col1, col2, col3, col4 = st.columns(4)
+total_nurses = col1.number_input("Nurses to allocate", min_value=0, value=int(fleet.nurses[:len(fleet)].sum()), key='opt_nurses')
+limit = col2.number_input("Max patients per nurse per day", min_value=1.0, value=30.0, key='opt_limit')
+kits = col3.number_input("Equipment kits to allocate", min_value=0, max_value=len(fleet), value=len(fleet), key='opt_kits')
+use_all_nurses = col4.checkbox("Place every nurse", value=True, key='opt_use_all')
+close_posts = col4.checkbox("Allow closing posts", value=False, key='opt_close')
+
+if st.button("Optimize allocation", key='optimize'):
+    try:
+        allocation = allocate(fleet, nurses=total_nurses, patients_per_nurse=limit, close_posts=close_posts,
+                              use_all_nurses=use_all_nurses,
+                              stock={e: float(kits) for e in fleet.equipment_types})
+    except ValueError as e:
+        st.error(str(e))
+    else:
+        summary = allocation.summary()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Optimized NPV", f"{summary['npv']:,.0f}", f"{summary['npv_gain']:,.0f}")
+        col2.metric("Nurses used", f"{summary['nurses']:,.0f}")
+        col3.metric("Equipped posts", f"{summary['equipped_posts']:,.0f}")
+        col4.metric("Patients turned away per day", f"{summary['patients_turned_away']:,.1f}")
+        st.subheader("Shadow prices: NPV of one more unit")
+        st.caption("A budget with slack is not binding, so one more unit of it is worth nothing.")
+        st.dataframe(allocation.budgets(), use_container_width=True)
+        st.dataframe(allocation.posts.join(allocation.post_prices.add_prefix('value_of_')), use_container_width=True)
+
+profiling.end(profile)
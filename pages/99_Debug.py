@@ -1,3 +1,43 @@
+import json
+
+import pandas as pd
 import streamlit as st
 
-st.write(st.session_state)
\ No newline at end of file
+from models.calendar import CALENDARS
+from utils.cache import RESULTS
+from utils.jobs import JOBS
+from utils.loader import DATA
+from utils import profiling
+
+st.subheader('Calendar cache')
+st.write(CALENDARS.stats())
+
+st.subheader('Result cache')
+st.write(RESULTS.stats())
+
+st.subheader('Background jobs')
+st.write(JOBS.stats())
+
+st.subheader('Data snapshots')
+st.write({table: DATA._manifest(table) for table in DATA.schemas} | {'rebuilds': DATA.rebuilds})
+
+st.subheader('Profiling')
+col1, col2 = st.columns(2)
+enabled = col1.toggle('Profile page runs', value=profiling.ENABLED)
+memory = col2.toggle('Sample peak memory (slow)', value=profiling.MEMORY, disabled=not enabled)
+if (enabled, memory and enabled) != (profiling.ENABLED, profiling.MEMORY):
+    profiling.enable(enabled, memory)
+
+profiles = list(profiling.PROFILES)[::-1]
+if profiles:
+    labels = [f"{p['name']} ({p['elapsed'] * 1e3:,.0f}ms{', interrupted' if p['interrupted'] else ''})" for p in profiles]
+    chosen = profiles[st.selectbox('Run', options=range(len(profiles)), format_func=labels.__getitem__)]
+    spans = pd.DataFrame(chosen['spans']).T
+    st.dataframe(spans, use_container_width=True)
+    st.write({'counters': chosen['counters'], 'peak_memory': chosen['peak_memory']})
+    st.download_button('Download profiles as json', json.dumps(profiles, indent=2), file_name='profiles.json')
+else:
+    st.write('No profiled runs yet, turn profiling on and run a page.')
+
+st.subheader('Session state')
+st.write(st.session_state)
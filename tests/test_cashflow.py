@@ -0,0 +1,43 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from models.cashflow import CashFlow, CashFlowAggregator
+from models.healthpost import HealthPost
+
+FREQUENCIES = ['D', 'WD', 'ME', 'QE', 'Y']
+
+@pytest.mark.parametrize('cashflow_type', ['repeat', 'smooth', 'once-off'])
+@pytest.mark.parametrize('frequency', FREQUENCIES)
+@pytest.mark.parametrize('start_date', [dt.date(2024, 1, 1), dt.date(2024, 2, 15), dt.date(2024, 11, 30)])
+def test_npv_fast_matches_aggregator(frequency, cashflow_type, start_date):
+    cf = CashFlow(name='flow', amount=100.0, tag='revenue', start_date=start_date, end_date=dt.date(2026, 12, 31),
+                  frequency=frequency, cashflow_type=cashflow_type)
+    assert cf.npv_fast == pytest.approx(CashFlowAggregator([cf]).npv, rel=1e-9)
+
+def test_npv_at_adds_up_to_aggregator():
+    flows = [CashFlow(name=f, amount=100.0, tag='revenue', frequency=f) for f in FREQUENCIES]
+    agg = CashFlowAggregator(flows)
+    origin = agg.matrix.calendar[0].date()
+    assert sum(cf.npv_at(origin=origin) for cf in flows) == pytest.approx(agg.npv, rel=1e-9)
+
+def test_empty_flow_has_no_npv():
+    cf = CashFlow(amount=100.0, tag='revenue', start_date=dt.date(2024, 1, 1), end_date=dt.date(2024, 1, 30), frequency='QE')
+    assert cf.npv_fast == 0.0
+
+def test_npv_fast_is_a_property_on_both_models():
+    assert isinstance(CashFlow.npv_fast, property)
+    assert isinstance(HealthPost.npv_fast, property)
+
+@pytest.mark.parametrize('end_date', [None, dt.date(2024, 12, 31), dt.date(2033, 12, 31)])
+def test_healthpost_npv_fast_matches_npv(end_date):
+    from models.bulk import build_equipment, build_nurses, build_services
+    from models.fleet import HealthPostFleet
+    from utils.loader import DATA
+    horizon = {} if end_date is None else {'end_date': end_date}
+    hp = HealthPost(name='post', patients=20, rev_per_visit=1500, ehr_takeup=0.7, nurses=build_nurses(2),
+                    services=build_services(DATA.frame('services'), patients=20),
+                    equipment=build_equipment(DATA.frame('equipment').assign(num_units=1.0)), **horizon)
+    assert hp.npv_fast == pytest.approx(hp.npv, rel=1e-9)
+    assert HealthPostFleet.from_healthposts([hp]).npv == pytest.approx(hp.npv, rel=1e-9)
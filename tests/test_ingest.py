@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.ingest import VisitAggregator
+
+def visit_log(num_visits: int = 200, seed: int = 0) -> pd.DataFrame:
+    # visits of one to six service lines, so a visit often crosses a chunk boundary
+    rng = np.random.default_rng(seed)
+    rows = []
+    for v in range(num_visits):
+        for _ in range(rng.integers(1, 7)):
+            rows.append((f"post_{v % 7}", f"visit_{v}", f"2024-02-{v % 28 + 1:02d}", f"service_{v % 4}",
+                         float(rng.integers(100, 900))))
+    return pd.DataFrame(rows, columns=['healthpost', 'visit_id', 'visit_date', 'service_type', 'amount'])
+
+def split_visit(log: pd.DataFrame, near: int, held: int = 3) -> int:
+    # a row index from `near` on that leaves `held` lines of a visit before it and more after it
+    ids = log['visit_id'].to_numpy()
+    return next(i for i in range(near, len(log)) if (ids[i - held:i + 1] == ids[i]).all())
+
+@pytest.mark.parametrize('chunksize', [2, 3, 4, 5, 37, 902, 10_000])
+def test_appended_ingest_matches_full_ingest(tmp_path, chunksize):
+    log = visit_log()
+    cut = split_visit(log, len(log) // 2)
+    path = tmp_path / 'visits.csv'
+    log.iloc[:cut].to_csv(path, index=False)
+
+    agg = VisitAggregator()
+    agg.ingest(path, chunksize)
+    agg.save(tmp_path / 'state.json')
+    agg = VisitAggregator.load(tmp_path / 'state.json')
+    with open(path, 'a') as f:
+        log.iloc[cut:].to_csv(f, index=False, header=False)
+    assert agg.ingest(path, chunksize)
+
+    full = VisitAggregator()
+    full.ingest(path, chunksize)
+    pd.testing.assert_frame_equal(agg.counts.sort_index(), full.counts.sort_index())
+    assert agg.days == full.days
+
+def test_rewritten_log_is_read_from_the_start(tmp_path):
+    path = tmp_path / 'visits.csv'
+    visit_log(seed=0).to_csv(path, index=False)
+    agg = VisitAggregator()
+    agg.ingest(path)
+
+    rewritten = visit_log(num_visits=100, seed=1).assign(healthpost='rotated')
+    rewritten.to_csv(path, index=False)
+    assert agg.ingest(path)
+    assert agg.counts.loc['rotated', 'services'].sum() == len(rewritten)
+
+def test_unchanged_log_is_skipped(tmp_path):
+    path = tmp_path / 'visits.csv'
+    visit_log().to_csv(path, index=False)
+    agg = VisitAggregator()
+    assert agg.ingest(path)
+    assert not agg.ingest(path)
@@ -0,0 +1,170 @@
+from __future__ import annotations
+import datetime as dt
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+CACHE_DIR = Path(os.environ.get('EOV_CACHE_DIR', '.cache'))
+# part of every result key, bump it whenever a model change alters what cached results hold
+CACHE_VERSION = 1
+
+def _update(h, obj: Any):
+    # feed a canonical byte form of obj into the hash
+    if isinstance(obj, pd.DataFrame):
+        h.update(b'frame')
+        _update(h, [list(map(str, obj.columns)), list(map(str, obj.dtypes))])
+        h.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+    elif isinstance(obj, pd.Series):
+        h.update(b'series')
+        _update(h, [str(obj.name), str(obj.dtype)])
+        h.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+    elif isinstance(obj, np.ndarray):
+        h.update(f'array{obj.dtype.str}{obj.shape}'.encode())
+        h.update(np.ascontiguousarray(obj).tobytes() if obj.dtype != object else json.dumps(obj.tolist(), default=str).encode())
+    elif isinstance(obj, BaseModel):
+        _update(h, obj.model_dump())
+    elif isinstance(obj, dict):
+        h.update(b'dict')
+        for k in sorted(obj, key=str):
+            _update(h, str(k))
+            _update(h, obj[k])
+    elif isinstance(obj, (list, tuple)):
+        h.update(f'list{len(obj)}'.encode())
+        for v in obj:
+            _update(h, v)
+    elif isinstance(obj, (dt.date, dt.datetime)):
+        h.update(f'date{obj.isoformat()}'.encode())
+    else:
+        h.update(f'{type(obj).__name__}:{obj!r}'.encode())
+
+def input_hash(*parts: Any, version: int | None = CACHE_VERSION) -> str:
+    """Content hash of model inputs: frames, arrays, pydantic models, dicts such as CONSTANT.
+
+    Keys carry CACHE_VERSION so results computed by older model code are never
+    served; pass version=None to key stored inputs that outlive a model change.
+    """
+    h = hashlib.sha256()
+    if version is not None:
+        _update(h, ('cache_version', version))
+    for part in parts:
+        _update(h, part)
+    return h.hexdigest()
+
+class ResultCache():
+    """Content-addressed store of computed arrays on local disk.
+
+    Entries are .npz files named by input hash, written atomically so several
+    processes can share a directory. Reads refresh an entry's mtime and the
+    least recently used entries are deleted once the directory passes
+    max_bytes.
+    """
+
+    def __init__(self, directory: str | Path = CACHE_DIR / 'results', max_bytes: int = 512 * 2**20):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f'{key}.npz'
+
+    def get(self, key: str) -> dict[str, np.ndarray] | None:
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {k: data[k] for k in data.files}
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return arrays
+
+    def put(self, key: str, arrays: dict[str, np.ndarray]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        self._evict()
+
+    def get_or_compute(self, key: str, compute: Callable[[], dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+        arrays = self.get(key)
+        if arrays is None:
+            arrays = compute()
+            self.put(key, arrays)
+        return arrays
+
+    def frames(self, key: str, compute: Callable[[], dict[str, pd.DataFrame]]) -> dict[str, pd.DataFrame]:
+        # get_or_compute for a dict of numeric DataFrames
+        arrays = self.get_or_compute(key, lambda: _frames_to_arrays(compute()))
+        return _arrays_to_frames(arrays)
+
+    def _entries(self) -> list[tuple[Path, os.stat_result]]:
+        entries = []
+        for path in self.directory.glob('*.npz'):
+            try:
+                entries.append((path, path.stat()))
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda e: e[1].st_mtime)
+        total = sum(stat.st_size for _, stat in entries)
+        while entries and total > self.max_bytes:
+            path, stat = entries.pop(0)
+            path.unlink(missing_ok=True)
+            total -= stat.st_size
+            with self._lock:
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        entries = self._entries() if self.directory.exists() else []
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes_on_disk': sum(stat.st_size for _, stat in entries),
+            'max_bytes': self.max_bytes,
+        }
+
+    def clear(self):
+        for path, _ in self._entries():
+            path.unlink(missing_ok=True)
+
+def _frames_to_arrays(frames: dict[str, pd.DataFrame]) -> dict[str, np.ndarray]:
+    arrays = {}
+    for name, df in frames.items():
+        index = df.index.to_numpy()
+        arrays[f'{name}.values'] = df.to_numpy(dtype=float)
+        arrays[f'{name}.index'] = index.astype(str) if index.dtype == object else index
+        arrays[f'{name}.columns'] = np.asarray(df.columns, dtype=str)
+        arrays[f'{name}.index_name'] = np.asarray(df.index.name or '', dtype=str)
+    return arrays
+
+def _arrays_to_frames(arrays: dict[str, np.ndarray]) -> dict[str, pd.DataFrame]:
+    names = {k.rsplit('.', 1)[0] for k in arrays}
+    return {name: pd.DataFrame(arrays[f'{name}.values'],
+                               index=pd.Index(arrays[f'{name}.index'], name=str(arrays[f'{name}.index_name']) or None),
+                               columns=list(arrays[f'{name}.columns']))
+            for name in names}
+
+RESULTS = ResultCache()
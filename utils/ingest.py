@@ -0,0 +1,194 @@
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+
+from utils.cache import CACHE_DIR
+
+# one row per service line item of a visit, a visit has a single service type
+VISIT_COLUMNS = {
+    'healthpost': str,
+    'visit_id': str,
+    'visit_date': str,
+    'service_type': str,
+    'amount': float,
+}
+MARGIN = 0.2            # revenue per service is cost to serve plus 20%, as in services.csv
+FINGERPRINT_BYTES = 1 << 16
+
+def read_chunks(path: str | Path, chunksize: int = 500_000) -> Iterator[pd.DataFrame]:
+    """Visit records from a csv or parquet file, chunksize rows at a time."""
+    path = Path(path)
+    if path.suffix == '.parquet':
+        import pyarrow.parquet as pq     # only needed for parquet extracts
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=list(VISIT_COLUMNS)):
+            yield batch.to_pandas().astype(VISIT_COLUMNS)
+    else:
+        yield from pd.read_csv(path, usecols=list(VISIT_COLUMNS), dtype=VISIT_COLUMNS, chunksize=chunksize)
+
+def fingerprint(path: Path, size: int) -> str:
+    """Hash of the first bytes of a file and, for text logs, of the bytes just before `size`.
+
+    A log that was only appended to keeps both, one that was truncated,
+    rotated or rewritten loses at least one of them.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        digest.update(f.read(min(size, FINGERPRINT_BYTES)))
+        if path.suffix != '.parquet' and size > FINGERPRINT_BYTES:
+            f.seek(max(FINGERPRINT_BYTES, size - FINGERPRINT_BYTES))
+            digest.update(f.read(size - f.tell()))
+    return digest.hexdigest()
+
+class VisitAggregator():
+    """Running per post and per service aggregates of raw EHR visit records.
+
+    Only additive counts and each post's set of active days are kept, so
+    memory scales with posts x services and not with the log. Records must
+    keep the lines of one visit together (EHR extracts are ordered by visit),
+    a visit cut by a chunk boundary is carried into the next chunk. Files
+    already ingested are skipped and a log that was appended to only adds its
+    new rows, so a new day of logs never reprocesses history. A log whose
+    fingerprint no longer matches was replaced and is read from its first row.
+    """
+
+    def __init__(self):
+        self.counts = pd.DataFrame(columns=['visits', 'services', 'revenue'], dtype=float,
+                                   index=pd.MultiIndex.from_tuples([], names=['healthpost', 'service_type']))
+        self.days: dict[str, set[str]] = {}
+        self.sources: dict[str, dict] = {}
+
+    @staticmethod
+    def _counts(chunk: pd.DataFrame) -> pd.DataFrame:
+        visits = chunk.drop_duplicates(['healthpost', 'visit_id'])
+        return pd.concat([
+            visits.groupby(['healthpost', 'service_type']).size().rename('visits'),
+            chunk.groupby(['healthpost', 'service_type'])['amount'].agg(['size', 'sum'])
+                 .rename(columns={'size': 'services', 'sum': 'revenue'}),
+        ], axis=1).fillna(0.0).astype(float)
+
+    def _update(self, chunk: pd.DataFrame):
+        self.counts = self.counts.add(self._counts(chunk), fill_value=0.0)
+        for post, dates in chunk.drop_duplicates(['healthpost', 'visit_id']).groupby('healthpost')['visit_date']:
+            self.days.setdefault(post, set()).update(d[:10] for d in dates.unique())
+
+    def ingest(self, path: str | Path, chunksize: int = 500_000) -> bool:
+        path = Path(path)
+        stat = path.stat()
+        key = str(path.resolve())
+        seen = self.sources.get(key, {})
+        if (seen.get('size'), seen.get('mtime_ns')) == (stat.st_size, stat.st_mtime_ns):
+            return False
+
+        # a log that grew since the last run only contributes its new rows, from its last visit on:
+        # that visit was counted at the end of the last run and may continue, so it is taken back out first
+        appended = bool(seen) and stat.st_size >= seen['size'] and fingerprint(path, seen['size']) == seen.get('fingerprint')
+        skip, held = (seen['rows'], seen.get('pending', 0)) if appended else (0, 0)
+        rows, pending, taken = 0, None, []
+        for chunk in read_chunks(path, chunksize):
+            rows += len(chunk)
+            chunk = chunk.iloc[max(0, skip - rows + len(chunk)):].reset_index(drop=True)
+            if not len(chunk):
+                continue
+            if held:
+                # the held visit may span chunks, it is taken out once all of its rows are in
+                taken.append(chunk.iloc[:held])
+                held -= len(taken[-1])
+                if not held:
+                    self.counts = self.counts.sub(self._counts(pd.concat(taken, ignore_index=True)), fill_value=0.0)
+            if pending is not None:
+                chunk = pd.concat([pending, chunk], ignore_index=True)
+            # hold back the last visit, its lines may continue in the next chunk
+            last = (chunk['healthpost'].iloc[-1], chunk['visit_id'].iloc[-1])
+            tail = (chunk['healthpost'] == last[0]) & (chunk['visit_id'] == last[1])
+            pending = chunk[tail]
+            self._update(chunk[~tail])
+        if pending is not None and len(pending):
+            self._update(pending)
+
+        pending_rows = 0 if pending is None else len(pending)
+        self.sources[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'fingerprint': fingerprint(path, stat.st_size),
+                             'rows': rows - pending_rows, 'pending': pending_rows}
+        return True
+
+    def healthposts(self) -> pd.DataFrame:
+        # patients are visits per active day, the figure HealthPost.patients expects
+        posts = self.counts.groupby(level='healthpost').sum()
+        days = pd.Series({post: len(d) for post, d in self.days.items()}, dtype=float)
+        df = pd.DataFrame({
+            'patients': posts['visits'] / days.reindex(posts.index),
+            'rev_per_visit': posts['revenue'] / posts['visits'],
+            'visits': posts['visits'],
+            'days': days.reindex(posts.index),
+        })
+        df.index.name = 'name'
+        return df
+
+    def services(self, margin: float = MARGIN) -> pd.DataFrame:
+        # same columns as data/services.csv
+        services = self.counts.groupby(level='service_type').sum()
+        df = pd.DataFrame({
+            'cost_per_service': services['revenue'] / services['visits'],
+            'service_prop': services['visits'] / services['visits'].sum(),
+            'total_revenue': services['revenue'],
+            'total_visits': services['visits'],
+            'total_services': services['services'],
+            'ave_services_per_visit': services['services'] / services['visits'],
+        })
+        df['revenue_per_service'] = df['cost_per_service'] * (1 + margin)
+        return df
+
+    def service_mix(self) -> pd.DataFrame:
+        # each post's own service_prop, posts x services
+        visits = self.counts['visits'].unstack('service_type', fill_value=0.0)
+        return visits.div(visits.sum(axis=1), axis=0)
+
+    def save(self, path: str | Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        state = {
+            'counts': self.counts.reset_index().to_dict('list'),
+            'days': {post: sorted(d) for post, d in self.days.items()},
+            'sources': self.sources,
+        }
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> VisitAggregator:
+        agg = cls()
+        if Path(path).exists():
+            state = json.loads(Path(path).read_text())
+            counts = pd.DataFrame(state['counts'])
+            if len(counts):
+                agg.counts = counts.set_index(['healthpost', 'service_type']).astype(float)
+            agg.days = {post: set(d) for post, d in state['days'].items()}
+            agg.sources = state['sources']
+        return agg
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold raw EHR visit logs into the driver tables the models read")
+    parser.add_argument('logs', nargs='+', help="csv or parquet visit logs, already ingested files are skipped")
+    parser.add_argument('--state', default=str(CACHE_DIR / 'ingest' / 'state.json'))
+    parser.add_argument('--chunksize', type=int, default=500_000)
+    parser.add_argument('--out-dir', default=None, help="write healthposts.csv and services.csv drivers here")
+    args = parser.parse_args()
+
+    agg = VisitAggregator.load(args.state)
+    for log in args.logs:
+        print(f"{log}: {'ingested' if agg.ingest(log, args.chunksize) else 'already ingested'}")
+    agg.save(args.state)
+
+    if args.out_dir:
+        out = Path(args.out_dir)
+        out.mkdir(parents=True, exist_ok=True)
+        agg.healthposts().to_csv(out / 'healthposts.csv')
+        agg.services().to_csv(out / 'services.csv', index_label='service_type')
+    print(agg.healthposts().describe())
@@ -0,0 +1,194 @@
+from __future__ import annotations
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Iterator
+
+from models.fleet import HealthPostFleet
+from models.runner import RunningSummary, ScenarioRunner
+from models.sensitivity import tornado
+from models.simulation import SimulationConfig
+from utils.cache import input_hash
+
+_DONE = object()
+
+class Job():
+    """A background run that publishes a progress snapshot after every step.
+
+    Snapshots are plain dicts so any thread can read `progress` while the job
+    runs. Cancelling takes effect after the step in flight.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.status = 'pending'         # pending, running, done, cancelled or failed
+        self.progress: dict = {}
+        self.history: list[dict] = []
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.started = time.time()
+        self.finished: float | None = None
+        self._cancelled = threading.Event()
+        self._changed = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('done', 'cancelled', 'failed')
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _publish(self, status: str, progress: dict | None = None):
+        with self._changed:
+            if progress is not None:
+                self.progress = progress
+                self.history.append(progress)
+            self.status = status
+            if self.done:
+                self.finished = time.time()
+            self._changed.notify_all()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        with self._changed:
+            return self._changed.wait_for(lambda: self.done, timeout)
+
+    def iter_progress(self, timeout: float | None = None) -> Iterator[dict]:
+        # blocking: every snapshot from now on until the job ends, or until
+        # nothing new arrives within timeout, for sync callers such as Streamlit
+        seen = len(self.history)
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: len(self.history) > seen or self.done, timeout)
+                snapshots, seen = self.history[seen:], len(self.history)
+                done = self.done
+            yield from snapshots
+            if done or not snapshots:
+                return
+
+    async def updates(self, interval: float = 0.1) -> AsyncIterator[dict]:
+        # non-blocking version of iter_progress for asyncio callers
+        seen = 0
+        while True:
+            snapshots, seen = self.history[seen:], len(self.history)
+            for snapshot in snapshots:
+                yield snapshot
+            if self.done and seen == len(self.history):
+                return
+            await asyncio.sleep(interval)
+
+def _step(iterator: Iterator, progress: Callable[[Any], dict]) -> tuple[Any, dict | None]:
+    # runs on the executor; the snapshot is taken here, before the next step can mutate the value
+    value = next(iterator, _DONE)
+    return value, (None if value is _DONE else progress(value))
+
+class JobManager():
+    """Runs jobs on an asyncio loop in a background thread, keyed by input hash.
+
+    A job is a function returning an iterator of steps. Each step runs on
+    `executor`, so the loop and the caller stay responsive, and the job checks
+    for cancellation in between. Submitting a key that is running or finished
+    returns the existing job; the last `keep` finished jobs are remembered.
+    """
+
+    def __init__(self, executor: Executor | None = None, keep: int = 32):
+        self.executor = executor or ThreadPoolExecutor(thread_name_prefix='job')
+        self.keep = keep
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='jobs', daemon=True)
+        self._thread.start()
+
+    def submit(self, key: str, steps: Callable[[], Iterator], progress: Callable[[Any], dict] = lambda value: {},
+               finish: Callable[[Any], Any] = lambda value: value) -> Job:
+        with self._lock:
+            job = self.jobs.get(key)
+            if job is not None and job.status not in ('cancelled', 'failed') and not job._cancelled.is_set():
+                self.jobs.move_to_end(key)
+                return job
+            job = self.jobs[key] = Job(key)
+            self._trim()
+        asyncio.run_coroutine_threadsafe(self._run(job, steps, progress, finish), self._loop)
+        return job
+
+    def _trim(self):
+        finished = [k for k, job in self.jobs.items() if job.done]
+        for key in finished[:max(0, len(finished) - self.keep)]:
+            del self.jobs[key]
+
+    async def _run(self, job: Job, steps: Callable[[], Iterator], progress: Callable, finish: Callable):
+        loop = asyncio.get_running_loop()
+        iterator = None
+        last = _DONE
+        try:
+            iterator = await loop.run_in_executor(self.executor, lambda: iter(steps()))
+            job._publish('running')
+            while not job._cancelled.is_set():
+                value, snapshot = await loop.run_in_executor(self.executor, _step, iterator, progress)
+                if value is _DONE:
+                    job.result = await loop.run_in_executor(self.executor, finish, last)
+                    job._publish('done')
+                    return
+                last = value
+                job._publish('running', snapshot)
+            job._publish('cancelled')
+        except Exception as e:
+            job.error = e
+            job._publish('failed')
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                # lets a generator release its own workers, e.g. ScenarioRunner's process pool
+                await loop.run_in_executor(self.executor, close)
+
+    def get(self, key: str) -> Job | None:
+        return self.jobs.get(key)
+
+    def cancel(self, key: str):
+        job = self.jobs.get(key)
+        if job is not None:
+            job.cancel()
+
+    def stats(self) -> dict:
+        statuses = [job.status for job in self.jobs.values()]
+        return {status: statuses.count(status) for status in sorted(set(statuses))}
+
+def fleet_hash(fleet: HealthPostFleet, *parts: Any) -> str:
+    return input_hash(fleet.posts, fleet.service_types, fleet.equipment_types, fleet.columns(), fleet.horizon, *parts)
+
+def simulation_progress(summary: RunningSummary) -> dict:
+    # per post NPV histogram over the posts done so far and the running mean it converges to
+    edges, counts = summary.post_npv.edges, summary.post_npv.counts
+    nonzero = counts[1:len(edges)].nonzero()[0] + 1     # bins between two edges
+    lo, hi = (nonzero[0], nonzero[-1] + 1) if len(nonzero) else (1, 1)
+    return {
+        'posts_done': summary.posts_done,
+        'posts': len(summary.names),
+        'mean_post_npv': summary.mean_post_npv,
+        'post_npv_p5': summary.post_npv.quantile(0.05),
+        'post_npv_p50': summary.post_npv.quantile(0.5),
+        'post_npv_p95': summary.post_npv.quantile(0.95),
+        'histogram_edges': edges[lo - 1:hi].tolist(),
+        'histogram_counts': counts[lo:hi].tolist(),
+    }
+
+def submit_simulation(fleet: HealthPostFleet, config: SimulationConfig | None = None, seed: int = 0,
+                      chunk_size: int = 512, workers: int | None = 1, manager: JobManager | None = None) -> Job:
+    """Monte Carlo of fleet as a job, one step per chunk of posts.
+
+    workers is left out of the key, results do not depend on it.
+    """
+    config = config or SimulationConfig()
+    key = fleet_hash(fleet, 'simulation', config, seed, chunk_size)
+    runner = ScenarioRunner(fleet, config, seed=seed, chunk_size=chunk_size, workers=workers)
+    return (manager or JOBS).submit(key, runner.iter_summaries, simulation_progress, lambda summary: summary.result())
+
+def submit_tornado(fleet: HealthPostFleet, pct: float = 0.1, metric: str = 'npv', drivers: list[str] | None = None,
+                   manager: JobManager | None = None) -> Job:
+    key = fleet_hash(fleet, 'tornado', pct, metric, drivers)
+    return (manager or JOBS).submit(key, lambda: iter([tornado(fleet, pct, metric, drivers)]),
+                                    lambda df: {'drivers': len(df)})
+
+JOBS = JobManager()
@@ -0,0 +1,144 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from utils.cache import CACHE_DIR
+
+class TableSchema(BaseModel):
+    path: str
+    index: str
+    columns: dict[str, str]                 # column -> numpy dtype, 'str' for text
+    fillna: dict[str, float] = {}
+    sort_by: str | None = None
+    ascending: bool = True
+    frame_columns: list[str] | None = None  # columns handed out by DataLoader.frame, all by default
+
+SCHEMAS = {
+    'healthposts': TableSchema(
+        path='data/healthposts.csv', index='name',
+        columns={'name': 'str', 'id': 'float64', 'patients': 'float64', 'rev_per_visit': 'float64', 'nurses': 'float64'},
+        frame_columns=['id', 'patients', 'rev_per_visit', 'nurses']),
+    'nurses': TableSchema(
+        path='data/healthcareworkers.csv', index='id',
+        columns={'id': 'int64', 'name': 'str', 'salary': 'float64'}),
+    'services': TableSchema(
+        path='data/services.csv', index='service_type',
+        columns={'service_type': 'str', 'cost_per_service': 'float64', 'service_prop': 'float64',
+                 'total_revenue': 'float64', 'total_visits': 'float64', 'total_services': 'float64',
+                 'ave_services_per_visit': 'float64', 'revenue_per_service': 'float64'},
+        sort_by='service_prop', ascending=False,
+        frame_columns=['revenue_per_service', 'cost_per_service', 'service_prop']),
+    'equipment': TableSchema(
+        path='data/equipment.csv', index='equipment_type',
+        columns={'equipment_type': 'str', 'capital_investment': 'float64', 'monthly_maintenance': 'float64', 'num_units': 'float64'},
+        fillna={'capital_investment': 0.0, 'monthly_maintenance': 0.0, 'num_units': 0.0}),
+}
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+class DataLoader():
+    """Typed loader for the data/ tables, backed by memory-mapped NumPy snapshots.
+
+    The first load of a CSV parses it with its declared schema and writes one
+    .npy file per column next to a manifest of the source's mtime, size and
+    sha256. Later loads, in any process, map those files instead of parsing.
+    A touched source whose hash is unchanged keeps its snapshot. One loader is
+    shared per process and hands the same read-only objects to every caller.
+    """
+
+    def __init__(self, schemas: dict[str, TableSchema] = SCHEMAS, root: str | Path = '.',
+                 snapshot_dir: str | Path = CACHE_DIR / 'data'):
+        self.schemas = schemas
+        self.root = Path(root)
+        self.snapshot_dir = Path(snapshot_dir)
+        self.rebuilds = 0
+        self._columns: dict[str, tuple[str, dict[str, np.ndarray]]] = {}
+        self._frames: dict[str, tuple[str, pd.DataFrame]] = {}
+        self._lock = threading.Lock()
+
+    def _manifest(self, table: str) -> dict | None:
+        try:
+            return json.loads((self.snapshot_dir / table / 'manifest.json').read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _current(self, table: str) -> dict:
+        # the manifest of a snapshot that matches the source, rebuilding it if needed
+        source = self.root / self.schemas[table].path
+        stat = source.stat()
+        manifest = self._manifest(table)
+        if manifest and (manifest['mtime_ns'], manifest['size']) == (stat.st_mtime_ns, stat.st_size):
+            return manifest
+
+        sha256 = _sha256(source)
+        if manifest and manifest['sha256'] == sha256:
+            manifest.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        else:
+            manifest = self._snapshot(table, source, sha256)
+            manifest.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        self._write(self.snapshot_dir / table / 'manifest.json', json.dumps(manifest).encode())
+        return manifest
+
+    def _snapshot(self, table: str, source: Path, sha256: str) -> dict:
+        schema = self.schemas[table]
+        dtypes = {k: (str if v == 'str' else v) for k, v in schema.columns.items() if v != 'int64'}
+        df = pd.read_csv(source, usecols=list(schema.columns), dtype=dtypes, keep_default_na=True)
+        df = df.fillna(schema.fillna)
+        if schema.sort_by:
+            df = df.sort_values(schema.sort_by, ascending=schema.ascending, kind='stable')
+
+        directory = self.snapshot_dir / table
+        directory.mkdir(parents=True, exist_ok=True)
+        for column, dtype in schema.columns.items():
+            values = df[column].to_numpy(dtype=str if dtype == 'str' else dtype)
+            with open(directory / f'{column}.npy.tmp', 'wb') as f:
+                np.save(f, values, allow_pickle=False)
+            os.replace(directory / f'{column}.npy.tmp', directory / f'{column}.npy')
+        self.rebuilds += 1
+        return {'source': str(source), 'sha256': sha256, 'rows': len(df), 'columns': list(schema.columns)}
+
+    @staticmethod
+    def _write(path: Path, data: bytes):
+        tmp = path.with_suffix('.tmp')
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    def columns(self, table: str) -> dict[str, np.ndarray]:
+        """Every column of a table as a read-only memory-mapped array."""
+        with self._lock:
+            manifest = self._current(table)
+            cached = self._columns.get(table)
+            if cached is None or cached[0] != manifest['sha256']:
+                directory = self.snapshot_dir / table
+                arrays = {c: np.load(directory / f'{c}.npy', mmap_mode='r', allow_pickle=False)
+                          for c in manifest['columns']}
+                cached = self._columns[table] = (manifest['sha256'], arrays)
+            return cached[1]
+
+    def frame(self, table: str) -> pd.DataFrame:
+        """The table as a DataFrame indexed like the pages expect. Shared, so copy before editing."""
+        columns = self.columns(table)
+        sha256 = self._columns[table][0]
+        cached = self._frames.get(table)
+        if cached is None or cached[0] != sha256:
+            schema = self.schemas[table]
+            keep = schema.frame_columns or [c for c in schema.columns if c != schema.index]
+            index = columns[schema.index]
+            df = pd.DataFrame({c: columns[c] for c in keep},
+                              index=pd.Index(index.astype(object) if index.dtype.kind == 'U' else index, name=schema.index))
+            cached = self._frames[table] = (sha256, df)
+        return cached[1]
+
+DATA = DataLoader()
@@ -0,0 +1,148 @@
+from __future__ import annotations
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+import functools
+import json
+import os
+import time
+import tracemalloc
+from typing import Callable, Iterator
+
+# Off unless EOV_PROFILE=1 or enable() is called. Disabled, a span or counter
+# costs one ContextVar lookup, nothing is timed or allocated.
+ENABLED = os.environ.get('EOV_PROFILE') == '1'
+MEMORY = os.environ.get('EOV_PROFILE_MEMORY') == '1'    # tracemalloc, slows everything down while on
+
+_current: ContextVar[Profile | None] = ContextVar('profile', default=None)
+_NULL = nullcontext()
+
+class Profile():
+    """Spans, counters and peak memory collected over one page run or request.
+
+    A span's self time excludes the spans nested inside it, so the time spent
+    in e.g. pydantic validation is what generate_cashflows keeps for itself.
+    """
+
+    def __init__(self, name: str, memory: bool = False):
+        self.name = name
+        self.memory = memory
+        self.spans: dict[str, list[float]] = {}     # name -> [calls, total, self]
+        self.counters: dict[str, int] = {}
+        self.started = time.time()
+        self.elapsed = 0.0
+        self.peak_memory: int | None = None
+        self.interrupted = False
+        self._children = [0.0]                      # child time of each open span
+        self._start = self._last = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        self._children.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._last = time.perf_counter()
+            elapsed = self._last - start
+            children = self._children.pop()
+            self._children[-1] += elapsed
+            stats = self.spans.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] += elapsed - children
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'started': self.started,
+            'elapsed': self.elapsed,
+            'peak_memory': self.peak_memory,
+            'interrupted': self.interrupted,
+            'spans': {k: {'calls': int(v[0]), 'total': v[1], 'self': v[2]}
+                      for k, v in sorted(self.spans.items(), key=lambda kv: -kv[1][2])},
+            'counters': dict(sorted(self.counters.items())),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+# finished profiles, newest last, for the debug page and the api
+PROFILES: deque[dict] = deque(maxlen=50)
+
+_tracing = False        # whether tracemalloc was started here, and so is ours to stop
+
+def enable(on: bool = True, memory: bool = False):
+    global ENABLED, MEMORY, _tracing
+    ENABLED, MEMORY = on, on and memory
+    if not MEMORY and _tracing:
+        tracemalloc.stop()
+        _tracing = False
+
+def begin(name: str, memory: bool | None = None) -> Profile | None:
+    """Start collecting for the current thread or task, None when disabled.
+
+    A profile still current here was never ended, e.g. its page hit st.stop,
+    st.rerun or an exception. It is ended as interrupted, timed to its last span.
+    """
+    global _tracing
+    stale = _current.get()
+    if stale is not None:
+        end(stale, interrupted=True)
+    if not ENABLED:
+        return None
+    memory = MEMORY if memory is None else memory
+    profile = Profile(name, memory)
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _tracing = True
+    if memory:
+        tracemalloc.reset_peak()
+    _current.set(profile)
+    return profile
+
+def end(profile: Profile | None, interrupted: bool = False) -> dict | None:
+    if profile is None:
+        return None
+    profile.interrupted = interrupted
+    profile.elapsed = (profile._last if interrupted else time.perf_counter()) - profile._start
+    if profile.memory and tracemalloc.is_tracing():
+        profile.peak_memory = tracemalloc.get_traced_memory()[1]
+    if _current.get() is profile:
+        _current.set(None)
+    result = profile.to_dict()
+    PROFILES.append(result)
+    return result
+
+@contextmanager
+def record(name: str, memory: bool | None = None) -> Iterator[Profile | None]:
+    profile = begin(name, memory)
+    try:
+        yield profile
+    finally:
+        end(profile)
+
+def span(name: str):
+    profile = _current.get()
+    return _NULL if profile is None else profile.span(name)
+
+def count(name: str, n: int = 1):
+    profile = _current.get()
+    if profile is not None:
+        profile.count(name, n)
+
+def profiled(name: str) -> Callable:
+    # decorator form of span for model entry points
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            profile = _current.get()
+            if profile is None:
+                return fn(*args, **kwargs)
+            with profile.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate